@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from backend.metrics import count_bytes, count_lookup
+
+load_dotenv()
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("results", "artifacts"))
+# Jobs not updated for this long are released by the GC
+ARTIFACT_MAX_AGE_DAYS = float(os.getenv("ARTIFACT_MAX_AGE_DAYS", "14"))
+# Total blob size the GC keeps the store under, releasing the oldest jobs first
+ARTIFACT_MAX_BYTES = int(float(os.getenv("ARTIFACT_MAX_GB", "20")) * 1024 ** 3)
+ARTIFACT_GC_INTERVAL = float(os.getenv("ARTIFACT_GC_INTERVAL", "3600"))
+# Blobs written or reused this recently are never collected, so a put racing a GC keeps its blob
+GC_GRACE_SECONDS = 600
+ARTIFACT_KINDS = {
+    ".mp3": "audio", ".m4a": "audio", ".wav": "audio",
+    ".png": "image", ".jpg": "image", ".jpeg": "image",
+    ".mp4": "video",
+    ".json": "data", ".srt": "data",
+}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Return the sha256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_kind(path):
+    return ARTIFACT_KINDS.get(os.path.splitext(path)[1].lower(), "other")
+
+
+def link_or_copy(source, destination):
+    """
+    Hard-link source to destination (a new path), copying when links are not possible.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for the files jobs produce (audio, images, videos, ...).
+
+    Blobs are named by the sha256 of their content, so identical files are
+    stored once however many jobs produce them. Each job has a manifest
+    listing its artifacts by name. A blob is referenced once per manifest
+    entry naming it, and the GC deletes blobs nothing references.
+
+    record() adopts files a job wrote in its own directory: the file is
+    moved into the store and hard-linked back in place, so pipelines keep
+    their paths while sharing the bytes. A job about to rewrite adopted
+    files must detach() them first. Releasing a job removes its
+    manifest and those links. Every write goes to a temporary name first
+    and is renamed into place, so readers never see a partial blob or
+    manifest.
+    """
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.manifest_dir = os.path.join(root, "manifests")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.lock = threading.Lock()
+
+    def tmp_path(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    def blob_path(self, blob):
+        return os.path.join(self.blob_dir, blob[:2], blob)
+
+    def manifest_path(self, job_id):
+        return os.path.join(self.manifest_dir, f"{job_id}.json")
+
+    def store(self, tmp_path, blob):
+        """
+        Move a finished temporary file in as blob, unless the content is already stored.
+        """
+        path = self.blob_path(blob)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stored = os.path.exists(path)
+        count_lookup("artifacts", stored)
+        if stored:
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            count_bytes("artifacts", os.path.getsize(tmp_path), "in")
+            os.replace(tmp_path, path)
+        return path
+
+    def put_bytes(self, data, extension=""):
+        """
+        Store data and return its blob name (digest plus extension).
+        """
+        blob = hashlib.sha256(data).hexdigest() + extension
+        tmp_path = self.tmp_path()
+        with open(tmp_path, "wb") as blob_file:
+            blob_file.write(data)
+        self.store(tmp_path, blob)
+        return blob
+
+    def put_file(self, path, link=False):
+        """
+        Store a copy of a file and return its blob name. With link, the blob
+        is a hard link to the file instead, which is only safe if the file
+        is never rewritten in place.
+        """
+        blob = file_hash(path) + os.path.splitext(path)[1].lower()
+        tmp_path = self.tmp_path()
+        if link:
+            link_or_copy(path, tmp_path)
+        else:
+            shutil.copyfile(path, tmp_path)
+        self.store(tmp_path, blob)
+        return blob
+
+    def adopt(self, path):
+        """
+        Store a file and replace it with a link to its blob, so both share one copy.
+        """
+        blob = self.put_file(path, link=True)
+        blob_path = self.blob_path(blob)
+        if not os.path.samefile(path, blob_path):
+            tmp_path = path + ".link"
+            link_or_copy(blob_path, tmp_path)
+            os.replace(tmp_path, path)
+        return blob
+
+    def detach(self, paths):
+        """
+        Give linked files their own copy again, so rewriting one in place cannot change its blob.
+        """
+        for path in paths:
+            if os.path.exists(path) and os.stat(path).st_nlink > 1:
+                tmp_path = path + ".detach"
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, path)
+
+    def load_manifest(self, job_id):
+        try:
+            with open(self.manifest_path(job_id), "r") as json_file:
+                return json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = self.manifest_path(manifest["job_id"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(manifest, json_file, indent=2)
+        os.replace(tmp_path, path)
+
+    def record(self, job_id, paths, base_dir=None, adopt=True):
+        """
+        Add files to a job's manifest, named by their path relative to base_dir.
+
+        With adopt, each file is replaced by a link to its blob (see adopt());
+        otherwise the store keeps its own copy. Returns {name: blob}.
+        """
+        added = {}
+        for path in paths:
+            name = os.path.relpath(path, base_dir) if base_dir else os.path.basename(path)
+            blob = self.adopt(path) if adopt else self.put_file(path)
+            added[name] = {
+                "blob": blob,
+                "kind": artifact_kind(path),
+                "size": os.path.getsize(self.blob_path(blob)),
+                "path": os.path.abspath(path) if adopt else None,
+            }
+        with self.lock:
+            now = time.time()
+            manifest = self.load_manifest(job_id) or {"job_id": job_id, "created": now, "artifacts": {}}
+            manifest["artifacts"].update(added)
+            manifest["updated"] = now
+            self.save_manifest(manifest)
+        return {name: entry["blob"] for name, entry in added.items()}
+
+    def manifests(self):
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        manifests = []
+        for filename in os.listdir(self.manifest_dir):
+            if filename.endswith(".json"):
+                manifest = self.load_manifest(filename[:-len(".json")])
+                if manifest is not None:
+                    manifests.append(manifest)
+        return manifests
+
+    def references(self, manifests=None):
+        """
+        Reference count of every blob: how many manifest entries name it.
+        """
+        counts = {}
+        for manifest in self.manifests() if manifests is None else manifests:
+            for entry in manifest["artifacts"].values():
+                counts[entry["blob"]] = counts.get(entry["blob"], 0) + 1
+        return counts
+
+    def release(self, job_id):
+        """
+        Drop a job's manifest and the links record() left in its directory. Blobs go at the next GC.
+        """
+        with self.lock:
+            manifest = self.load_manifest(job_id)
+            if manifest is None:
+                return False
+            for entry in manifest["artifacts"].values():
+                path = entry.get("path")
+                blob_path = self.blob_path(entry["blob"])
+                # Only links to the blob; a file rewritten since then belongs to someone else
+                try:
+                    if path and os.path.exists(blob_path) and os.path.samefile(path, blob_path):
+                        os.remove(path)
+                except OSError:
+                    pass
+            os.remove(self.manifest_path(job_id))
+        return True
+
+    def blobs(self):
+        """
+        (blob, path, size, mtime) of every stored blob.
+        """
+        blobs = []
+        if not os.path.isdir(self.blob_dir):
+            return blobs
+        for prefix in os.listdir(self.blob_dir):
+            for blob in os.listdir(os.path.join(self.blob_dir, prefix)):
+                path = os.path.join(self.blob_dir, prefix, blob)
+                stat = os.stat(path)
+                blobs.append((blob, path, stat.st_size, stat.st_mtime))
+        return blobs
+
+    def gc(self, max_age_days=ARTIFACT_MAX_AGE_DAYS, max_bytes=ARTIFACT_MAX_BYTES, now=None):
+        """
+        Release jobs older than max_age_days, then the oldest jobs until the
+        blobs fit in max_bytes, and delete every unreferenced blob. Returns what was done.
+        """
+        now = now or time.time()
+        released = []
+        manifests = sorted(self.manifests(), key=lambda manifest: manifest.get("updated", 0))
+        for manifest in manifests:
+            if now - manifest.get("updated", 0) > max_age_days * 86400:
+                self.release(manifest["job_id"])
+                released.append(manifest["job_id"])
+        manifests = [manifest for manifest in manifests if manifest["job_id"] not in released]
+
+        references = self.references(manifests)
+        blobs = {blob: (path, size, mtime) for blob, path, size, mtime in self.blobs()}
+        total = sum(size for _, size, _ in blobs.values())
+        deleted = []
+
+        def collect():
+            nonlocal total
+            for blob, (path, size, mtime) in list(blobs.items()):
+                if references.get(blob, 0) == 0 and now - mtime > GC_GRACE_SECONDS:
+                    os.remove(path)
+                    deleted.append(blob)
+                    total -= size
+                    del blobs[blob]
+
+        collect()
+        while total > max_bytes and manifests:
+            manifest = manifests.pop(0)
+            self.release(manifest["job_id"])
+            released.append(manifest["job_id"])
+            for entry in manifest["artifacts"].values():
+                references[entry["blob"]] -= 1
+            collect()
+
+        # Leftovers of writes that died halfway
+        if os.path.isdir(self.tmp_dir):
+            for filename in os.listdir(self.tmp_dir):
+                path = os.path.join(self.tmp_dir, filename)
+                if now - os.path.getmtime(path) > GC_GRACE_SECONDS:
+                    os.remove(path)
+
+        return {"released": released, "blobs_deleted": len(deleted), "total_bytes": total, "blobs": len(blobs)}
+
+
+async def run_gc_periodically(store, interval=ARTIFACT_GC_INTERVAL):
+    """
+    Run store.gc() every interval seconds, off the event loop, until cancelled.
+    """
+    while True:
+        try:
+            result = await asyncio.to_thread(store.gc)
+            if result["released"] or result["blobs_deleted"]:
+                print(
+                    f"Artifact GC released {len(result['released'])} jobs, deleted {result['blobs_deleted']} blobs;"
+                    f" {result['total_bytes'] / 1024 ** 2:.1f} MB in {result['blobs']} blobs"
+                )
+        except Exception as e:
+            print(f"Artifact GC failed: {e}")
+        await asyncio.sleep(interval)
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+from dotenv import load_dotenv
+
+from backend.metrics import count_lookup
+
+load_dotenv()
+
+# Decoded scene images and caption rasters shared by every render process; "" turns the cache off
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join("results", "asset_cache"))
+# Least recently used entries are evicted past this size; a decoded 1080x1920 scene is about 6 MB
+ASSET_CACHE_MAX_BYTES = int(float(os.getenv("ASSET_CACHE_MAX_MB", "2048")) * 1024 ** 2)
+
+
+def cache_key(kind, value):
+    return f"{kind}-" + hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class AssetCache:
+    """
+    Read-only numpy arrays (decoded scenes, caption rasters) kept on disk as .npy files.
+
+    The in-memory caches of the compositor and captions live only as long as
+    their process, and every render composes in fresh segment worker
+    processes. This cache is what lets a final render, or another segment of
+    the same render, reuse what an earlier one decoded or rasterized.
+
+    Entries are written under a temporary name and renamed into place, so a
+    reader never loads a partial array. Reads refresh an entry's mtime, and
+    the oldest entries are evicted once the cache outgrows max_bytes.
+    """
+    def __init__(self, root=ASSET_CACHE_DIR, max_bytes=ASSET_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.root, f"{key}.npy")
+
+    def get(self, key, kind):
+        path = self.path(key)
+        try:
+            array = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            count_lookup(kind, False)
+            return None
+        count_lookup(kind, True)
+        array.flags.writeable = False
+        return array
+
+    def put(self, key, array):
+        # A cache that cannot be written must not fail the render
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self.path(key))
+            self.evict()
+        except OSError as e:
+            print(f"Could not cache {key}: {e}")
+
+    def evict(self):
+        entries = []
+        for filename in os.listdir(self.root):
+            if filename.startswith(".") or not filename.endswith(".npy"):
+                continue
+            path = os.path.join(self.root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Evicted by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get_or_create(self, key, kind, create):
+        """
+        The cached array for key, else create() stored under it. kind labels the cache lookup metrics.
+        """
+        if not self.root:
+            return create()
+        array = self.get(key, kind)
+        if array is None:
+            array = create()
+            self.put(key, array)
+        return array
+
+
+asset_cache = AssetCache()
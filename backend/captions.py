@@ -0,0 +1,129 @@
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from backend.asset_cache import asset_cache, cache_key
+
+# Rendered captions kept in memory; a reel reuses the same few words a lot.
+# Bounded so long reels do not hold every caption they ever showed.
+CAPTION_CACHE_SIZE = 32
+FALLBACK_FONTS = ("DejaVuSans.ttf", "Arial.ttf")
+
+
+@dataclass(frozen=True)
+class CaptionStyle:
+    """
+    Look of a burned-in caption. Frozen so it can be part of a cache key.
+    """
+    font: str = "DejaVuSans.ttf"
+    fontsize: int = 96
+    color: str = "white"
+    stroke_color: str = "orange"
+    stroke_width: int = 2
+    bg_color: str = "black"
+    max_width: int = 864
+    align: str = "center"
+    line_spacing: int = 4
+
+    @classmethod
+    def for_frame(cls, frame_size, **overrides):
+        """
+        Default style for a frame: font at 5% of the height, wrapped to 80% of the width.
+        """
+        values = {
+            "fontsize": int(frame_size[1] * 0.05),
+            "max_width": int(frame_size[0] * 0.8),
+        }
+        values.update(overrides)
+        return cls(**values)
+
+
+@lru_cache(maxsize=32)
+def load_font(font, fontsize):
+    """
+    Load a TrueType font, falling back to common system fonts and then Pillow's default.
+    """
+    for candidate in (font,) + FALLBACK_FONTS:
+        try:
+            return ImageFont.truetype(candidate, fontsize)
+        except OSError:
+            continue
+    return ImageFont.load_default(fontsize)
+
+
+def wrap_text(text, font, max_width):
+    """
+    Greedy word wrap so that every line fits in max_width pixels where possible.
+    """
+    lines = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if current and font.getlength(candidate) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines or [""]
+
+
+@lru_cache(maxsize=CAPTION_CACHE_SIZE)
+def render_caption(text, style):
+    """
+    Rasterize a caption to an RGBA array of width style.max_width.
+
+    Results are cached by (text, style) and returned read-only, so callers
+    must copy before modifying them.
+    """
+    font = load_font(style.font, style.fontsize)
+    lines = wrap_text(text.replace("\n", " "), font, style.max_width)
+
+    ascent, descent = font.getmetrics()
+    line_height = ascent + descent + 2 * style.stroke_width
+    height = line_height * len(lines) + style.line_spacing * (len(lines) - 1)
+
+    image = Image.new("RGBA", (style.max_width, height), style.bg_color or (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    y = 0
+    for line in lines:
+        line_width = font.getlength(line) + 2 * style.stroke_width
+        if style.align == "left":
+            x = 0
+        elif style.align == "right":
+            x = style.max_width - line_width
+        else:
+            x = (style.max_width - line_width) / 2
+        draw.text(
+            (x + style.stroke_width, y + style.stroke_width),
+            line,
+            font=font,
+            fill=style.color,
+            stroke_width=style.stroke_width,
+            stroke_fill=style.stroke_color,
+        )
+        y += line_height + style.line_spacing
+
+    array = np.asarray(image)
+    array.flags.writeable = False
+    return array
+
+
+@lru_cache(maxsize=CAPTION_CACHE_SIZE)
+def load_caption(text, style):
+    """
+    render_caption() through the on-disk asset cache, so renders in other
+    processes (segment workers, a final after a draft) reuse the raster.
+    """
+    key = cache_key("caption", {"text": text, "style": asdict(style)})
+    return asset_cache.get_or_create(key, "caption_disk", lambda: render_caption(text, style))
+
+
+def caption_cache_info():
+    """
+    Hit/miss statistics of the rendered-caption cache.
+    """
+    return render_caption.cache_info()
@@ -0,0 +1,265 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from backend.artifacts import file_hash
+from backend.asset_cache import asset_cache, cache_key
+from backend.captions import load_caption
+from backend.metrics import count_lookup, observe
+from backend.timeline import IntervalIndex
+
+
+def fade_factor(t, start, end, fade):
+    """
+    Opacity of a clip at t with linear fade-in/out of `fade` seconds at both ends.
+    """
+    if fade <= 0:
+        return 1.0
+    return max(0.0, min(1.0, (t - start) / fade, (end - t) / fade))
+
+
+# Decoded scenes kept per process, over the on-disk asset cache that renders in
+# other processes share. Bounded, so memory does not grow with reel length.
+SCENE_CACHE_SIZE = 8
+
+
+def decode_image(image_path, size):
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        if img.size != size:
+            target_ratio = size[0] / size[1]
+            if img.width / img.height > target_ratio:
+                new_width = int(img.height * target_ratio)
+                left = (img.width - new_width) // 2
+                img = img.crop((left, 0, left + new_width, img.height))
+            else:
+                new_height = int(img.width / target_ratio)
+                top = (img.height - new_height) // 2
+                img = img.crop((0, top, img.width, top + new_height))
+            img = img.resize(size, Image.LANCZOS)
+        array = np.asarray(img)
+    array.flags.writeable = False
+    return array
+
+
+@lru_cache(maxsize=SCENE_CACHE_SIZE)
+def decode_scene_image(image_path, mtime_ns, size):
+    # Keyed by content like the resize manifest, so a final render in a new
+    # worker process reuses what the draft decoded
+    key = cache_key("scene", {"source_hash": file_hash(image_path), "size": list(size)})
+    return asset_cache.get_or_create(key, "scene_disk", lambda: decode_image(image_path, size))
+
+
+@lru_cache(maxsize=SCENE_CACHE_SIZE)
+def scale_scene_image(image_path, mtime_ns, asset_size, size):
+    array = np.asarray(Image.fromarray(decode_scene_image(image_path, mtime_ns, asset_size)).resize(size, Image.LANCZOS))
+    array.flags.writeable = False
+    return array
+
+
+def load_scene_image(image_path, size, asset_size=None):
+    """
+    Decode a scene image to a read-only RGB array of exactly `size`, center-cropping to its aspect ratio.
+
+    With asset_size, the image is decoded at that size and downscaled, so
+    renders at different output sizes share one decode. Results are cached
+    per (path, mtime, size) in this process, and decodes on disk by content
+    (see AssetCache) for other processes.
+    """
+    mtime_ns = os.stat(image_path).st_mtime_ns
+    size = tuple(size)
+    if asset_size is None or tuple(asset_size) == size:
+        cache, args = decode_scene_image, (image_path, mtime_ns, size)
+    else:
+        cache, args = scale_scene_image, (image_path, mtime_ns, tuple(asset_size), size)
+    # Approximate under concurrent prefetches, which share the counters
+    misses = cache.cache_info().misses
+    start = time.perf_counter()
+    image = cache(*args)
+    if cache.cache_info().misses > misses:
+        count_lookup("scene", False)
+        observe("scene_decode", time.perf_counter() - start)
+    else:
+        count_lookup("scene", True)
+    return image
+
+
+def scale_raster(rgba, scale):
+    """
+    Resize an RGBA raster by a factor (used for captions rendered at asset size).
+    """
+    height, width = rgba.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return np.asarray(Image.fromarray(rgba).resize(size, Image.LANCZOS))
+
+
+class CaptionOverlay:
+    """
+    A caption raster prepared for blending at a fixed position in the frame.
+    """
+    __slots__ = ("rgb", "alpha", "opaque", "box")
+
+    def __init__(self, rgba, frame_size):
+        height, width = rgba.shape[:2]
+        x = (frame_size[0] - width) // 2
+        y = (frame_size[1] - height) // 2
+        # Clip the raster to the frame if it is larger than it
+        src_x, src_y = max(0, -x), max(0, -y)
+        x, y = max(0, x), max(0, y)
+        width = min(width - src_x, frame_size[0] - x)
+        height = min(height - src_y, frame_size[1] - y)
+        rgba = rgba[src_y:src_y + height, src_x:src_x + width]
+
+        self.box = (slice(y, y + height), slice(x, x + width))
+        self.opaque = bool((rgba[:, :, 3] == 255).all())
+        self.rgb = np.ascontiguousarray(rgba[:, :, :3])
+        self.alpha = None if self.opaque else rgba[:, :, 3:4].astype(np.float32) / 255.0
+
+    def blend(self, frame, factor):
+        region = frame[self.box]
+        if self.opaque and factor >= 1.0:
+            np.copyto(region, self.rgb)
+            return
+        rgb = self.rgb.astype(np.float32)
+        if factor < 1.0:
+            # moviepy's fadein/fadeout darken the caption towards black
+            rgb *= factor
+        if self.opaque:
+            region[...] = rgb
+        else:
+            region[...] = rgb * self.alpha + region * (1.0 - self.alpha)
+
+
+class FrameCompositor:
+    """
+    Compose reel frames from timed scene images and captions.
+
+    Image and caption timings are indexed once; each frame only touches the
+    scenes and captions active at t (normally one image, two around a
+    crossfade, and one caption) and is drawn into a reused frame buffer.
+
+    Frames are produced as a stream: a scene image is decoded only shortly
+    before it becomes active (on a background thread, `lookahead` seconds
+    ahead so crossfades never wait) and released once it has ended, and a
+    caption overlay lives only while its caption is on screen. Memory use
+    therefore does not depend on the reel's duration.
+    """
+    def __init__(self, size, scenes, captions, caption_style, image_fade=0.1, caption_fade=0.25, bg_color=(0, 0, 0), asset_size=None, lookahead=1.0):
+        """
+        scenes: iterable of (start, end, image_path); captions: iterable of (start, end, text).
+        caption_style is laid out for asset_size (default: size); frames at a
+        different size reuse the asset-size decodes and caption rasters, scaled.
+        """
+        self.size = tuple(size)
+        self.asset_size = tuple(asset_size) if asset_size else self.size
+        self.caption_style = caption_style
+        self.caption_scale = self.size[0] / self.asset_size[0]
+        self.image_fade = image_fade
+        self.caption_fade = caption_fade
+        self.lookahead = lookahead
+
+        self.scene_index = IntervalIndex(scenes)
+        self.caption_index = IntervalIndex(captions)
+        # position in scene_index -> decoded image, or a Future while it decodes
+        self.scene_images = {}
+        self.prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scene-prefetch")
+
+        self.background = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.background[...] = bg_color
+        self.frame = np.empty_like(self.background)
+        self.overlays = {}
+
+    def load_scene(self, j):
+        return load_scene_image(self.scene_index.items[j], self.size, self.asset_size)
+
+    def scene_image(self, j):
+        image = self.scene_images.get(j)
+        if image is None:
+            image = self.load_scene(j)
+        elif not isinstance(image, np.ndarray):
+            image = image.result()
+        self.scene_images[j] = image
+        return image
+
+    def update_window(self, t):
+        """
+        Release scenes that are over and start decoding the ones about to begin.
+        """
+        index = self.scene_index
+        for j in list(self.scene_images):
+            if index.ends[j] <= t or index.starts[j] > t + self.lookahead:
+                del self.scene_images[j]
+        for j in index.active(t + self.lookahead):
+            if j not in self.scene_images and index.ends[j] > t:
+                self.scene_images[j] = self.prefetcher.submit(self.load_scene, j)
+
+    def caption_overlay(self, text):
+        overlay = self.overlays.get(text)
+        if overlay is None:
+            misses = load_caption.cache_info().misses
+            start = time.perf_counter()
+            rgba = load_caption(text, self.caption_style)
+            rendered = load_caption.cache_info().misses > misses
+            count_lookup("caption", not rendered)
+            if rendered:
+                observe("caption_render", time.perf_counter() - start)
+            if self.caption_scale != 1.0:
+                rgba = scale_raster(rgba, self.caption_scale)
+            overlay = CaptionOverlay(rgba, self.size)
+            self.overlays[text] = overlay
+        return overlay
+
+    def draw_scenes(self, frame, t):
+        index = self.scene_index
+        positions = index.active(t)
+        factors = [fade_factor(t, index.starts[j], index.ends[j], self.image_fade) for j in positions]
+
+        # Everything below the topmost fully opaque scene is hidden; start there
+        base = 0
+        for n, factor in enumerate(factors):
+            if factor >= 1.0:
+                base = n
+        if not positions or factors[base] < 1.0:
+            np.copyto(frame, self.background)
+
+        for j, factor in zip(positions[base:], factors[base:]):
+            image = self.scene_image(j)
+            if factor >= 1.0:
+                np.copyto(frame, image)
+            elif factor > 0.0:
+                frame[...] = image * factor + frame * (1.0 - factor)
+
+    def draw_captions(self, frame, t):
+        index = self.caption_index
+        positions = index.active(t)
+        # Overlays of captions no longer on screen are dropped; the raster
+        # itself stays in the bounded load_caption cache
+        active_texts = {index.items[j] for j in positions}
+        for text in [text for text in self.overlays if text not in active_texts]:
+            del self.overlays[text]
+        for j in positions:
+            factor = fade_factor(t, index.starts[j], index.ends[j], self.caption_fade)
+            self.caption_overlay(index.items[j]).blend(frame, factor)
+
+    def close(self):
+        """
+        Stop prefetching and drop decoded scenes, overlays and frame buffers.
+        """
+        self.prefetcher.shutdown(wait=True, cancel_futures=True)
+        self.scene_images.clear()
+        self.overlays.clear()
+        self.frame = self.background = None
+
+    def make_frame(self, t):
+        """
+        moviepy-compatible frame function. The returned array is reused by the next call.
+        """
+        frame = self.frame
+        self.update_window(t)
+        self.draw_scenes(frame, t)
+        self.draw_captions(frame, t)
+        return frame
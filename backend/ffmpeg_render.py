@@ -0,0 +1,375 @@
+import os
+import subprocess
+import tempfile
+
+from backend.metrics import stage
+from backend.render_profiles import DEFAULT_PROFILE, get_profile
+
+# How often a running ffmpeg's render is checked for cancellation
+CANCEL_POLL_SECONDS = 0.25
+# Grace period for ffmpeg to exit after SIGTERM before it is killed
+TERMINATE_TIMEOUT = 5
+
+
+class FFmpegRenderError(RuntimeError):
+    """
+    Raised when an ffmpeg invocation exits with an error.
+    """
+
+
+def ffmpeg_binary():
+    """
+    The ffmpeg executable moviepy is configured with (imageio-ffmpeg's by default).
+    """
+    # moviepy is imported on first use, keeping it out of the web app's startup
+    from moviepy.config import get_setting
+
+    return get_setting("FFMPEG_BINARY")
+
+
+def stop_process(process):
+    """
+    Terminate a process still running and wait for it, killing it if it does not exit in time.
+    """
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=TERMINATE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_ffmpeg(args, cancel=None):
+    """
+    Run ffmpeg with the given arguments, raising FFmpegRenderError on failure.
+
+    With a CancelToken, ffmpeg is stopped as soon as the render is cancelled
+    and the token raises RenderCancelled.
+    """
+    command = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + list(args)
+    # stderr goes to a file: a pipe nobody reads while we wait could fill up and stall ffmpeg
+    with stage("ffmpeg"), tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            while True:
+                try:
+                    process.wait(timeout=None if cancel is None else CANCEL_POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    cancel.check()
+        finally:
+            stop_process(process)
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", "replace").strip()
+            raise FFmpegRenderError(message or f"ffmpeg exited with {process.returncode}")
+
+
+def probe_duration(path):
+    """
+    Duration of a media file in seconds, read from the container without decoding it.
+    """
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    return ffmpeg_parse_infos(path)["duration"]
+
+
+def mux_audio(video_path, audio_path, output_path, duration, cancel=None):
+    """
+    Combine a video-only file with an audio file, copying both streams.
+    """
+    run_ffmpeg([
+        "-i", video_path,
+        "-i", audio_path,
+        "-map", "0:v", "-map", "1:a",
+        "-c", "copy",
+        "-t", f"{duration:.6f}",
+        "-movflags", "+faststart",
+        output_path,
+    ], cancel)
+    return output_path
+
+
+def escape_filter_value(value):
+    """
+    Quote a value (e.g. a file path) for use inside a filtergraph option.
+    """
+    return "'" + str(value).replace("'", "'\\''") + "'"
+
+
+def ass_color(color, alpha=0):
+    """
+    Convert a Pillow color name or (r, g, b) tuple to ASS &HAABBGGRR.
+    """
+    from PIL import ImageColor
+
+    if isinstance(color, str):
+        color = ImageColor.getrgb(color)
+    r, g, b = color[:3]
+    return f"&H{alpha:02X}{b:02X}{g:02X}{r:02X}"
+
+
+def ass_timestamp(seconds):
+    centiseconds = int(round(max(0.0, seconds) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02}:{secs:02}.{centiseconds:02}"
+
+
+def write_ass_subtitles(captions, size, style, path, fade=0.25):
+    """
+    Write captions [(start, end, text), ...] as an ASS script styled like CaptionStyle.
+
+    Two layers reproduce the Pillow caption: a black opaque box underneath and
+    the white text with its colored stroke on top. Text wraps inside the
+    central style.max_width pixels of the frame.
+    """
+    from backend.captions import load_font
+
+    font = load_font(style.font, style.fontsize)
+    family = font.getname()[0] if hasattr(font, "getname") else "Sans"
+    margin = max(0, (size[0] - style.max_width) // 2)
+    fade_ms = int(fade * 1000)
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {size[0]}",
+        f"PlayResY: {size[1]}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Box,{family},{style.fontsize},{ass_color(style.color)},{ass_color(style.color)},"
+        f"{ass_color(style.bg_color or (0, 0, 0))},{ass_color(style.bg_color or (0, 0, 0))},"
+        f"0,0,0,0,100,100,0,0,3,{style.stroke_width},0,5,{margin},{margin},0,1",
+        f"Style: Caption,{family},{style.fontsize},{ass_color(style.color)},{ass_color(style.color)},"
+        f"{ass_color(style.stroke_color)},{ass_color((0, 0, 0), 255)},"
+        f"0,0,0,0,100,100,0,0,1,{style.stroke_width},0,5,{margin},{margin},0,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for start, end, text in captions:
+        text = text.replace("\n", " ").replace("{", "(").replace("}", ")")
+        timing = f"{ass_timestamp(start)},{ass_timestamp(end)}"
+        lines.append(f"Dialogue: 0,{timing},Box,,0,0,0,,{{\\fad({fade_ms},{fade_ms})}}{text}")
+        lines.append(f"Dialogue: 1,{timing},Caption,,0,0,0,,{{\\fad({fade_ms},{fade_ms})}}{text}")
+
+    with open(path, "w", encoding="utf-8") as ass_file:
+        ass_file.write("\n".join(lines) + "\n")
+    return path
+
+
+def subtitles_filter(ass_path, fonts_dir=None):
+    subtitles = f"subtitles=filename={escape_filter_value(ass_path)}"
+    if fonts_dir:
+        subtitles += f":fontsdir={escape_filter_value(fonts_dir)}"
+    return subtitles
+
+
+def font_dir(caption_style):
+    """
+    Directory of the caption font file, so libass finds the same font Pillow uses.
+    """
+    from backend.captions import load_font
+
+    font = load_font(caption_style.font, caption_style.fontsize)
+    return os.path.dirname(font.path) if getattr(font, "path", None) else None
+
+
+class FFmpegRenderer:
+    """
+    Render a reel with a single ffmpeg invocation.
+
+    Each still is decoded once and repeated for its scene duration, faded in/out like the moviepy
+    engine and concatenated (black filler covers gaps and missing images);
+    captions are burned in from an ASS script by libass and the TTS audio is
+    stream-copied. No frame passes through Python.
+    """
+    def __init__(self, size, profile=DEFAULT_PROFILE, image_fade=0.1, caption_fade=0.25, asset_size=None, cancel=None):
+        """
+        size is the output frame size; captions are laid out for asset_size
+        (default: size) and scaled by libass. A cancel token stops ffmpeg mid-render.
+        """
+        self.size = tuple(size)
+        self.asset_size = tuple(asset_size) if asset_size else self.size
+        self.profile = get_profile(profile)
+        self.fps = self.profile.fps
+        self.image_fade = image_fade
+        self.caption_fade = caption_fade
+        self.cancel = cancel
+
+    def frame_count(self, seconds):
+        return int(round(seconds * self.fps))
+
+    def timeline_segments(self, scenes, duration):
+        """
+        Split [0, duration) into (frames, image_path or None) pieces aligned to whole frames.
+        """
+        segments = []
+        cursor = 0
+        total = self.frame_count(duration)
+        for start, end, image_path in sorted(scenes, key=lambda scene: scene[0]):
+            first = max(self.frame_count(start), cursor)
+            last = min(self.frame_count(end), total)
+            if last <= first:
+                continue
+            if first > cursor:
+                segments.append((first - cursor, None))
+            segments.append((last - first, image_path))
+            cursor = last
+        if total > cursor:
+            segments.append((total - cursor, None))
+        return segments
+
+    def still_inputs(self, scenes, duration):
+        """
+        Input arguments and per-segment filter chains for the stills, plus their output labels.
+        """
+        width, height = self.size
+        inputs = []
+        filters = []
+        labels = []
+        for n, (frames, image_path) in enumerate(self.timeline_segments(scenes, duration)):
+            seconds = frames / self.fps
+            if image_path is None:
+                inputs += ["-f", "lavfi", "-t", f"{seconds:.6f}", "-i", f"color=c=black:s={width}x{height}:r={self.fps}"]
+                chain = f"[{n}:v]setsar=1,format=yuv420p[v{n}]"
+            else:
+                # Decode and scale the still once, then repeat that frame
+                inputs += ["-i", image_path]
+                chain = (
+                    f"[{n}:v]scale={width}:{height}:force_original_aspect_ratio=increase,"
+                    f"crop={width}:{height},setsar=1,format=yuv420p,"
+                    f"loop=loop={frames - 1}:size=1:start=0,settb=1/{self.fps},setpts=N"
+                )
+                if self.image_fade > 0 and seconds > 0:
+                    fade = min(self.image_fade, seconds / 2)
+                    chain += f",fade=t=in:st=0:d={fade:.3f},fade=t=out:st={seconds - fade:.6f}:d={fade:.3f}"
+                chain += f"[v{n}]"
+            filters.append(chain)
+            labels.append(f"[v{n}]")
+        return inputs, filters, labels
+
+    def output_args(self, video_label, audio_index, duration, output_path):
+        return [
+            "-map", video_label,
+            "-map", f"{audio_index}:a",
+        ] + self.profile.encoder_args() + [
+            "-pix_fmt", "yuv420p",
+            "-r", str(self.fps),
+            "-c:a", "copy",
+            "-t", f"{duration:.6f}",
+            "-movflags", "+faststart",
+            output_path,
+        ]
+
+    def build_command(self, scenes, ass_path, fonts_dir, audio_path, duration, output_path, graph_path):
+        inputs, filters, labels = self.still_inputs(scenes, duration)
+        filters.append(f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0,{subtitles_filter(ass_path, fonts_dir)}[out]")
+
+        with open(graph_path, "w", encoding="utf-8") as graph_file:
+            graph_file.write(";\n".join(filters))
+
+        return inputs + [
+            "-i", audio_path,
+            "-filter_complex_script", graph_path,
+        ] + self.output_args("[out]", len(labels), duration, output_path)
+
+    def render(self, scenes, captions, caption_style, audio_path, output_path, duration=None):
+        """
+        scenes: [(start, end, image_path)], captions: [(start, end, text)].
+        """
+        if duration is None:
+            duration = probe_duration(audio_path)
+        fonts_dir = font_dir(caption_style)
+
+        with tempfile.TemporaryDirectory(prefix="reel_ffmpeg_") as workdir:
+            ass_path = write_ass_subtitles(
+                captions, self.asset_size, caption_style, os.path.join(workdir, "captions.ass"), self.caption_fade
+            )
+            args = self.build_command(
+                scenes, ass_path, fonts_dir, audio_path, duration, output_path, os.path.join(workdir, "graph.txt")
+            )
+            run_ffmpeg(args, self.cancel)
+        return output_path
+
+
+# Named output formats for multi-aspect renders, at final-profile resolution
+OUTPUT_FORMATS = {
+    "9:16": (1080, 1920),
+    "1:1": (1080, 1080),
+    "16:9": (1920, 1080),
+}
+
+
+def center_crop(canvas, aspect):
+    """
+    Largest even-sized rectangle of the given aspect ratio that fits in canvas.
+    """
+    width, height = canvas
+    if width / height > aspect:
+        width = int(height * aspect)
+    else:
+        height = int(width / aspect)
+    return width // 2 * 2, height // 2 * 2
+
+
+class MultiFormatRenderer(FFmpegRenderer):
+    """
+    Render one reel to several aspect ratios in a single ffmpeg process.
+
+    The stills are decoded, faded and concatenated once on a master canvas
+    large enough for every output, then split; each branch gets its own
+    center crop, scale and caption layout (an ASS script at that output's
+    resolution) and its own encoder, all muxed with the same copied audio.
+    """
+    def __init__(self, output_sizes, profile=DEFAULT_PROFILE, image_fade=0.1, caption_fade=0.25, cancel=None):
+        """
+        output_sizes: [(width, height), ...], one per output file.
+        """
+        self.output_sizes = [tuple(size) for size in output_sizes]
+        master = (max(size[0] for size in self.output_sizes), max(size[1] for size in self.output_sizes))
+        super().__init__(master, profile, image_fade, caption_fade, cancel=cancel)
+
+    def render(self, scenes, captions, caption_style, audio_path, output_paths, duration=None):
+        """
+        caption_style is applied per output via CaptionStyle.for_frame; output_paths parallel output_sizes.
+        """
+        if duration is None:
+            duration = probe_duration(audio_path)
+        fonts_dir = font_dir(caption_style)
+
+        with tempfile.TemporaryDirectory(prefix="reel_ffmpeg_") as workdir:
+            inputs, filters, labels = self.still_inputs(scenes, duration)
+            branches = "".join(f"[m{n}]" for n in range(len(self.output_sizes)))
+            filters.append(
+                f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0,split={len(self.output_sizes)}{branches}"
+            )
+
+            outputs = []
+            for n, (size, output_path) in enumerate(zip(self.output_sizes, output_paths)):
+                style = type(caption_style).for_frame(size, font=caption_style.font)
+                ass_path = write_ass_subtitles(
+                    captions, size, style, os.path.join(workdir, f"captions_{n}.ass"), self.caption_fade
+                )
+                crop_width, crop_height = center_crop(self.size, size[0] / size[1])
+                filters.append(
+                    f"[m{n}]crop={crop_width}:{crop_height},scale={size[0]}:{size[1]},setsar=1,"
+                    f"{subtitles_filter(ass_path, fonts_dir)}[out{n}]"
+                )
+                outputs += self.output_args(f"[out{n}]", len(labels), duration, output_path)
+
+            graph_path = os.path.join(workdir, "graph.txt")
+            with open(graph_path, "w", encoding="utf-8") as graph_file:
+                graph_file.write(";\n".join(filters))
+
+            run_ffmpeg(inputs + ["-i", audio_path, "-filter_complex_script", graph_path] + outputs, self.cancel)
+        return output_paths
@@ -1,25 +1,7 @@
-import srt
-
 from langchain_core.prompts import PromptTemplate
 from langchain_mistralai import ChatMistralAI
 
 
-def parse_srt(file_path):
-    """
-    Parse the SRT file and return a list of subtitles.
-    """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        srt_content = file.read()
-    subtitles = list(srt.parse(srt_content))
-    parsed_subtitles = []
-    for sub in subtitles:
-        parsed_subtitles.append({
-            'index': sub.index,
-            'start_time': sub.start,
-            'end_time': sub.end,
-            'content': sub.content.replace('\n', ' ')
-        })
-    return parsed_subtitles
 
 def generate_prompt(subtitle_text, llm_chain):
     """
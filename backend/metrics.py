@@ -0,0 +1,298 @@
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+import threading
+import time
+import uuid
+
+# Seconds; from a cached lookup up to a long final render
+LATENCY_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0, 600.0)
+# Recent spans kept for GET /traces/{trace_id}
+SPAN_HISTORY = 5000
+
+current_trace = ContextVar("trace_id", default=None)
+_lock = threading.Lock()
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """
+    A metric family with fixed label names, rendered in the Prometheus text format.
+    """
+    type = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+SPANS = deque(maxlen=SPAN_HISTORY)
+
+STAGE_SECONDS = Histogram(
+    "medireels_stage_seconds", "Latency of pipeline stages, external calls and render steps.", ["stage"]
+)
+STAGE_IN_FLIGHT = Gauge("medireels_stage_in_flight", "Stages currently running.", ["stage"])
+STAGE_ERRORS = Counter("medireels_stage_errors_total", "Stages that raised.", ["stage"])
+BYTES = Counter("medireels_bytes_total", "Bytes received from or sent to a stage.", ["stage", "direction"])
+CACHE_LOOKUPS = Counter("medireels_cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+
+
+def render_metrics():
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _lock:
+        lines = []
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+        # Hit ratios, derived from the lookup counters for convenience
+        lookups = {}
+        for (cache, result), value in CACHE_LOOKUPS.values.items():
+            lookups.setdefault(cache, {})[result] = value
+    lines += ["# HELP medireels_cache_hit_ratio Cache hits over lookups.", "# TYPE medireels_cache_hit_ratio gauge"]
+    for cache, results in sorted(lookups.items()):
+        total = sum(results.values())
+        if total:
+            lines.append(f'medireels_cache_hit_ratio{{cache="{escape_label(cache)}"}} {results.get("hit", 0) / total}')
+    return "\n".join(lines) + "\n"
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def traced(trace_id=None):
+    """
+    Run the block under a trace id (a new one if None); stages inside record spans with it.
+    """
+    token = current_trace.set(trace_id or current_trace.get() or new_trace_id())
+    try:
+        yield current_trace.get()
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def stage(name, span=True):
+    """
+    Time a block as one stage: latency histogram, in-flight gauge, error counter and, with span, a trace span.
+    """
+    STAGE_IN_FLIGHT.inc(stage=name)
+    start = time.perf_counter()
+    wall_start = time.time()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(stage=name)
+        STAGE_SECONDS.observe(seconds, stage=name)
+        if span:
+            SPANS.append({
+                "trace_id": current_trace.get(),
+                "stage": name,
+                "start": wall_start,
+                "seconds": round(seconds, 6),
+                "status": status,
+            })
+
+
+def timed(name):
+    """
+    Decorator form of stage(), for plain and coroutine functions.
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observe(name, seconds):
+    """
+    Record a latency measured elsewhere (e.g. summed over many frames) without a span.
+    """
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def count_bytes(name, size, direction="in"):
+    BYTES.inc(size, stage=name, direction=direction)
+
+
+def count_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def spans(trace_id):
+    return [span for span in list(SPANS) if span["trace_id"] == trace_id]
+
+
+def snapshot():
+    """
+    Counters, histograms and spans recorded in this process, to ship from a worker to the API process.
+    """
+    with _lock:
+        return {
+            "metrics": {
+                metric.name: {key: (value if not isinstance(value, list) else [list(value[0]), value[1], value[2]])
+                              for key, value in metric.values.items()}
+                for metric in REGISTRY if not isinstance(metric, Gauge)
+            },
+            "spans": list(SPANS),
+        }
+
+
+def merge(data):
+    """
+    Add a worker's snapshot() into this process's metrics.
+    """
+    by_name = {metric.name: metric for metric in REGISTRY}
+    with _lock:
+        for name, values in data["metrics"].items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            for key, value in values.items():
+                if isinstance(metric, Histogram):
+                    state = metric.values.setdefault(key, [[0] * (len(metric.buckets) + 1), 0.0, 0])
+                    state[0] = [a + b for a, b in zip(state[0], value[0])]
+                    state[1] += value[1]
+                    state[2] += value[2]
+                else:
+                    metric.values[key] = metric.values.get(key, 0) + value
+        SPANS.extend(data["spans"])
+
+
+def reset():
+    with _lock:
+        for metric in REGISTRY:
+            metric.values.clear()
+        SPANS.clear()
+
+
+def call_collecting(fn, *args, trace_id=None, **kwargs):
+    """
+    Run fn in a worker process and return (result, snapshot) of only what this call recorded.
+
+    If fn raises, the snapshot travels with the exception instead (see collected()):
+    failed stages are what the error counters and traces are for.
+    """
+    reset()
+    try:
+        with traced(trace_id):
+            result = fn(*args, **kwargs)
+    except Exception as e:
+        e.collected_metrics = snapshot()
+        raise
+    return result, snapshot()
+
+
+def collected(future):
+    """
+    The snapshot a finished call_collecting() future shipped back, whether fn
+    returned or raised; None if the call never ran or died with its worker.
+    """
+    if future.cancelled():
+        return None
+    error = future.exception()
+    if error is None:
+        return future.result()[1]
+    return getattr(error, "collected_metrics", None)
@@ -0,0 +1,220 @@
+import asyncio
+import contextlib
+import hashlib
+import inspect
+import json
+import os
+import time
+
+from backend import metrics, profiling
+from backend.artifacts import file_hash
+
+PIPELINE_STATE = "pipeline.json"
+
+
+class PipelineError(RuntimeError):
+    """
+    A stage failed. Stages before it stay cached, so running the job again resumes there.
+    """
+    def __init__(self, stage, cause, timings):
+        super().__init__(f"Stage {stage!r} failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+        self.timings = timings
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    run(job, inputs) receives the outputs of the stages it depends on by
+    name and returns its own outputs as a JSON-serializable dict. Paths
+    listed under the "files" key are hashed, so downstream stages re-run
+    when a file changes even if its name does not. run may be a coroutine
+    function; plain functions run in a worker thread.
+
+    config is everything besides the inputs that changes the result (model,
+    voice, render profile, ...); it is part of the stage's fingerprint.
+    resource names the limit the stage runs under when several jobs share
+    one set of limits (see Pipeline.run).
+    """
+    def __init__(self, name, run, deps=(), config=None, resource=None):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.config = config or {}
+        self.resource = resource
+
+
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def output_digest(outputs):
+    """
+    Digest of a stage's outputs, including the content of the files it wrote.
+    """
+    files = {path: file_hash(path) for path in outputs.get("files", [])}
+    return digest({"outputs": outputs, "files": files})
+
+
+def topological_order(stages):
+    """
+    Stages sorted so each comes after its dependencies. Dependencies not in
+    stages are external: they must be given as upstream to Pipeline.run.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    order = []
+    visiting = set()
+    done = set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a cycle through stage {name!r}")
+        if name not in by_name:
+            return
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(by_name[name])
+
+    for stage in stages:
+        visit(stage.name)
+    return order
+
+
+class Pipeline:
+    """
+    Run a DAG of stages for one job, skipping stages whose inputs and config did not change.
+
+    Each stage's fingerprint is its name and config plus the output digests
+    of the stages it depends on. The fingerprint, outputs and timing of every
+    finished stage are stored in job_dir/pipeline.json after it completes,
+    so a job that failed halfway resumes from the last good stage when it
+    is run again.
+
+    With an artifact store, the files each stage lists are recorded in the
+    store under artifact_id, so identical outputs of different jobs share
+    one copy on disk (see ArtifactStore).
+    """
+    def __init__(self, stages, job_dir, store=None, artifact_id=None):
+        self.stages = topological_order(stages)
+        self.job_dir = job_dir
+        self.store = store
+        self.artifact_id = artifact_id or os.path.basename(os.path.normpath(job_dir))
+        self.state_path = os.path.join(job_dir, PIPELINE_STATE)
+        self.state = {}
+
+    def load_state(self):
+        try:
+            with open(self.state_path, "r") as json_file:
+                return json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(state, json_file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def record(self, name):
+        """
+        Stored outputs and digest of a finished stage, to pass as upstream to another pipeline.
+        """
+        return {"outputs": self.state[name]["outputs"], "digest": self.state[name]["digest"]}
+
+    def fingerprint(self, stage, state):
+        return digest({
+            "stage": stage.name,
+            "config": stage.config,
+            "deps": {dep: state[dep]["digest"] for dep in stage.deps},
+        })
+
+    @staticmethod
+    def is_current(record, fingerprint):
+        return (
+            record is not None
+            and record.get("fingerprint") == fingerprint
+            and all(os.path.exists(path) for path in record["outputs"].get("files", []))
+        )
+
+    async def run(self, job=None, upstream=None, limits=None, progress=None, trace_id=None):
+        """
+        Run every stage that is not current. Returns (outputs by stage, timings).
+
+        timings is a list of {"stage", "status" ("cached", "ran" or "failed"), "seconds"}.
+        upstream: records (see record()) of stages run by another pipeline,
+        that stages here depend on. limits: {resource: asyncio.Semaphore}
+        shared between concurrent jobs. progress(stage, status) is called
+        as each stage starts and finishes. Stages are recorded as
+        "pipeline.<name>" metrics under trace_id (by default the current trace, or a new one).
+        When profiling is on, each stage that runs leaves a profile in job_dir/profiles.
+        """
+        with metrics.traced(trace_id):
+            return await self.run_stages(job, upstream, limits, progress)
+
+    async def run_stages(self, job, upstream, limits, progress):
+        os.makedirs(self.job_dir, exist_ok=True)
+        state = self.state = self.load_state()
+        state.update(upstream or {})
+        missing = {dep for stage in self.stages for dep in stage.deps} - set(state) - {stage.name for stage in self.stages}
+        if missing:
+            raise ValueError(f"Pipeline stages depend on {sorted(missing)}, which are neither stages nor upstream")
+        limits = limits or {}
+        progress = progress or (lambda stage, status: None)
+        profile_dir = os.path.join(self.job_dir, "profiles")
+        timings = []
+        for stage in self.stages:
+            fingerprint = self.fingerprint(stage, state)
+            record = state.get(stage.name)
+            cached = self.is_current(record, fingerprint)
+            metrics.count_lookup("pipeline", cached)
+            if cached:
+                # Files edited by hand (e.g. a replaced image) stay, but invalidate the stages after them
+                record["digest"] = output_digest(record["outputs"])
+                timings.append({"stage": stage.name, "status": "cached", "seconds": 0.0})
+                progress(stage.name, "cached")
+                continue
+
+            inputs = {dep: state[dep]["outputs"] for dep in stage.deps}
+            if self.store is not None and record is not None:
+                await asyncio.to_thread(self.store.detach, record["outputs"].get("files", []))
+            limit = limits.get(stage.resource)
+            progress(stage.name, "waiting" if limit is not None and limit.locked() else "running")
+            async with limit or contextlib.nullcontext():
+                progress(stage.name, "running")
+                start = time.perf_counter()
+                try:
+                    with metrics.stage(f"pipeline.{stage.name}"):
+                        if inspect.iscoroutinefunction(stage.run):
+                            with profiling.profiled(stage.name, profile_dir):
+                                outputs = await stage.run(job, inputs)
+                        else:
+                            outputs = await asyncio.to_thread(
+                                profiling.call_profiled, profiling.current_profile.get(), stage.name, profile_dir,
+                                stage.run, job, inputs,
+                            )
+                except Exception as e:
+                    timings.append({"stage": stage.name, "status": "failed", "seconds": round(time.perf_counter() - start, 3)})
+                    progress(stage.name, "failed")
+                    raise PipelineError(stage.name, e, timings) from e
+                seconds = round(time.perf_counter() - start, 3)
+
+            if self.store is not None and outputs.get("files"):
+                await asyncio.to_thread(self.store.record, self.artifact_id, outputs["files"], self.job_dir)
+            state[stage.name] = {
+                "fingerprint": fingerprint,
+                "digest": output_digest(outputs),
+                "outputs": outputs,
+                "seconds": seconds,
+            }
+            self.save_state(state)
+            timings.append({"stage": stage.name, "status": "ran", "seconds": seconds})
+            progress(stage.name, "done")
+
+        return {stage.name: state[stage.name]["outputs"] for stage in self.stages}, timings
@@ -2,9 +2,12 @@ import os
 import gender_guesser.detector as gender
 from dotenv import load_dotenv
 import json
-from pydub import AudioSegment
 import edge_tts
 import asyncio
+import uuid
+from functools import lru_cache
+
+from backend.metrics import count_bytes, stage
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -23,9 +26,25 @@ def retrieve_podcast_info(data):
     conversation = data["conversation"]
     return podcast_title, host_name, guest_name, conversation
 
+# Concurrent edge-tts requests per podcast; TTS is network-bound
+TTS_CONCURRENCY = 4
+# Every podcast is generated in a directory of its own under this one
+PODCAST_DIR = os.path.join("results", "podcasts")
+
+# A new directory for one podcast, so concurrent requests never write the same files
+def new_podcast_dir():
+    path = os.path.join(PODCAST_DIR, uuid.uuid4().hex[:12])
+    os.makedirs(path)
+    return path
+
+# The detector loads its name database once per process
+@lru_cache(maxsize=1)
+def gender_detector():
+    return gender.Detector()
+
 # Determine the gender from the name using gender-guesser
 def get_gender_from_name(name):
-    d = gender.Detector()
+    d = gender_detector()
     gender_of_person = d.get_gender(name.split()[0])  # Use the first name to guess gender
     return gender_of_person
 
@@ -39,33 +58,34 @@ def get_voice_for_gender(gender):
         return "en-US-AriaNeural"  # Neutral/fallback voice
 
 # Function to generate audio using edge-tts
-async def generate_audio(text, filename, voice):
+async def generate_audio(text, file_path, voice):
     communicate = edge_tts.Communicate(text, voice)
-    if not os.path.exists("podcast_audio"):
-        os.makedirs("podcast_audio")
-    await communicate.save(f"podcast_audio/{filename}")
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with stage("edge_tts"):
+        await communicate.save(file_path)
+    count_bytes("edge_tts", os.path.getsize(file_path))
 
 # Function to append audio files
 def append_audio(audio_files, output_filename):
+    from pydub import AudioSegment
+
     combined_audio = AudioSegment.empty()
     for file in audio_files:
-        if file.split("/")[0]=="podcast_audio":
-            audio = AudioSegment.from_mp3(file)
-        else:
-            audio = AudioSegment.from_mp3(os.path.join("podcast_audio", file))
-        combined_audio += audio
+        combined_audio += AudioSegment.from_mp3(file)
     combined_audio.export(output_filename, format="mp3")
 
-# Main function to generate the podcast
-async def generate_podcast(podcast_data):
+# Main function to generate the podcast; the lines and the final file are
+# written to output_dir (default: a new directory), and the final path is returned
+async def generate_podcast(podcast_data, output_dir=None):
+    output_dir = output_dir or new_podcast_dir()
 
     # Get host and guest names
     host_name = podcast_data['host_name']
     guest_name = podcast_data['guest_name']
 
-    # Determine the gender of the host and guest
-    host_gender = get_gender_from_name(host_name)
-    guest_gender = get_gender_from_name(guest_name)
+    # Determine the gender of the host and guest (loading the detector blocks, so off the loop)
+    host_gender = await asyncio.to_thread(get_gender_from_name, host_name)
+    guest_gender = await asyncio.to_thread(get_gender_from_name, guest_name)
 
     # Select voices based on gender
     host_voice = get_voice_for_gender(host_gender)
@@ -82,24 +102,33 @@ async def generate_podcast(podcast_data):
     # Host and guest conversation
     conversation = podcast_data.get("conversation", [])
 
-    # Iterate over the conversation array
+    # Iterate over the conversation array; the lines are synthesized
+    # concurrently and joined in conversation order
+    lines = []
     for i, dialogue in enumerate(conversation):
         if 'host' in dialogue:
-            host_filename = f"host_{i}.mp3"
-            await generate_audio(dialogue['host'], host_filename, host_voice)
-            audio_files.append(host_filename)
+            lines.append((dialogue['host'], os.path.join(output_dir, f"host_{i}.mp3"), host_voice))
         if 'guest' in dialogue:
-            guest_filename = f"guest_{i}.mp3"
-            await generate_audio(dialogue['guest'], guest_filename, guest_voice)
-            audio_files.append(guest_filename)
+            lines.append((dialogue['guest'], os.path.join(output_dir, f"guest_{i}.mp3"), guest_voice))
+
+    limit = asyncio.Semaphore(TTS_CONCURRENCY)
+
+    async def synthesize(text, file_path, voice):
+        async with limit:
+            await generate_audio(text, file_path, voice)
+
+    await asyncio.gather(*(synthesize(*line) for line in lines))
+    audio_files.extend(file_path for _, file_path, _ in lines)
 
     # Add outro music
     audio_files.append("podcast_audio/music/outro_music/outro_music_1.mp3")
 
     # Combine all audio files into one final podcast file
-    final_podcast_file = "results/podcast_final.mp3"
-    append_audio(audio_files, final_podcast_file)
+    final_podcast_file = os.path.join(output_dir, "podcast_final.mp3")
+    # Decoding and re-encoding is CPU-bound; keep it off the event loop
+    await asyncio.to_thread(append_audio, audio_files, final_podcast_file)
     print(f"Podcast saved as {final_podcast_file}")
+    return final_podcast_file
 
 if __name__ == "__main__":
     filename = "podcast_res/podcast_script.json"  # Path to your JSON file
@@ -0,0 +1,188 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+from backend.metrics import current_trace, new_trace_id
+
+load_dotenv()
+
+# "sample": a thread samples the profiled thread's stack, written as folded stacks for flamegraph.pl/speedscope.
+# "cprofile": deterministic cProfile of the calling thread, written as pstats.
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+# Fraction of requests profiled without asking, e.g. 0.01 for 1% of traffic
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Where request profiles go; pipeline stages write theirs into the job directory
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("results", "profiles"))
+# Seconds between stack samples
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# The profiling mode of the current request or job, or None when it is not profiled
+current_profile = ContextVar("profile_mode", default=None)
+_cprofile_active = threading.local()
+# Threads with a stack sampler running, and whether the current block is inside one of their profiles
+_sampled_threads = set()
+_sampled_lock = threading.Lock()
+_in_sampled_block = ContextVar("in_sampled_block", default=False)
+
+
+def request_profile_mode(header_value=None):
+    """
+    Profiling mode for a request: the X-Profile header ("1", "sample" or
+    "cprofile"; "0" opts out), else PROFILE_MODE for a PROFILE_SAMPLE_RATE share of requests.
+    """
+    if header_value:
+        value = header_value.strip().lower()
+        if value in PROFILE_MODES:
+            return value
+        return None if value in ("0", "false", "no") else PROFILE_MODE
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_MODE
+    return None
+
+
+@contextmanager
+def profiling(mode):
+    """
+    Turn profiling on (a mode) or off (None) for the block, including the tasks and workers it starts.
+    """
+    if mode is not None and mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}")
+    token = current_profile.set(mode)
+    try:
+        yield
+    finally:
+        current_profile.reset(token)
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread (default: the one creating it) every `interval` seconds.
+
+    Counts are kept per folded stack ("thread;outer;...;inner"), the input
+    format of flamegraph.pl, inferno and speedscope. Waiting shows up too
+    (e.g. subprocess.run for ffmpeg), which is what a slow reel needs to show.
+
+    Other threads, such as concurrent requests' workers, are left out.
+    Work handed to a worker thread shows up as the wait for it; pipeline
+    stages and renders leave profiles of their own. An event loop thread
+    runs every request's coroutines, so its samples include whatever other
+    requests the loop serves meanwhile; profiled() samples at most one
+    request per thread at a time.
+    """
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def run(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        root = names.get(self.thread_id, str(self.thread_id))
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(root)
+            self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as folded_file:
+            for stack, count in self.counts.most_common():
+                folded_file.write(f"{stack} {count}\n")
+
+
+def artifact_path(name, directory=None, mode=PROFILE_MODE):
+    directory = directory or PROFILE_DIR
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "profile"
+    extension = ".folded" if mode == "sample" else ".prof"
+    return os.path.join(directory, f"{current_trace.get() or new_trace_id()}-{slug}{extension}")
+
+
+@contextmanager
+def profiled(name, directory=None):
+    """
+    Profile the block when profiling is on for the current request or job.
+
+    Yields the artifact path (None when not profiling). Costs one context
+    variable lookup when profiling is off. A cProfile already running in
+    this thread keeps the samples of nested blocks, and a thread sampled
+    for another request (the event loop serving two profiled requests) is
+    not sampled for this one, since each profile would hold both.
+    """
+    mode = current_profile.get()
+    if mode is None or (mode == "cprofile" and getattr(_cprofile_active, "value", False)):
+        yield None
+        return
+
+    path = artifact_path(name, directory, mode)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if mode == "sample":
+        ident = threading.get_ident()
+        with _sampled_lock:
+            busy = ident in _sampled_threads and not _in_sampled_block.get()
+            owner = ident not in _sampled_threads
+            if not busy:
+                _sampled_threads.add(ident)
+        if busy:
+            print(f"Not profiling {name}: another request is being sampled on this thread")
+            yield None
+            return
+
+        sampler = StackSampler(ident)
+        token = _in_sampled_block.set(True)
+        sampler.start()
+        try:
+            yield path
+        finally:
+            sampler.stop()
+            _in_sampled_block.reset(token)
+            if owner:
+                with _sampled_lock:
+                    _sampled_threads.discard(ident)
+            sampler.write(path)
+            print(f"Profile of {name} saved to {path}")
+        return
+
+    profiler = cProfile.Profile()
+    _cprofile_active.value = True
+    profiler.enable()
+    try:
+        yield path
+    finally:
+        profiler.disable()
+        _cprofile_active.value = False
+        profiler.dump_stats(path)
+        print(f"Profile of {name} saved to {path}")
+
+
+def call_profiled(mode, name, directory, fn, *args, **kwargs):
+    """
+    Run fn in a worker process under the caller's profiling mode (see profiled()).
+    """
+    with profiling(mode), profiled(name, directory):
+        return fn(*args, **kwargs)
@@ -0,0 +1,434 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import requests
+
+from backend.artifacts import artifact_store
+from backend.metrics import count_bytes, stage, traced
+from backend.pipeline import Pipeline, PipelineError, Stage, digest, output_digest
+from backend.render_pool import render_pool, render_reel
+from backend.render_profiles import DEFAULT_PROFILE, PER_SCENE
+from backend.scene_planner import ScenePlanner
+from backend.summarize import generate_image, generate_prompt, get_transcriber_chain, summarize_article
+from backend.timeline import Timeline
+from backend.transcriber import Transcriber
+
+REELS_DIR = os.path.join("results", "reels")
+TAVILY_URL = os.getenv("TAVILY_URL", "https://api.tavily.com/search")
+# Pause between prompt requests, as /generate_images does, to stay under the LLM rate limit
+PROMPT_INTERVAL = 1.5
+
+
+def search_articles(topic, api_key=None):
+    """
+    Search Tavily for trending articles on a topic. Raises requests.HTTPError on a bad response.
+    """
+    payload = {
+        "api_key": api_key or os.getenv("SEARCH_API_KEY"),
+        "query": "Trending topics in " + topic,
+        "search_depth": "advanced",  # default
+        "topic": "general",  # default
+        "days": 180,  # default
+        "max_results": 5,  # default
+        "include_images": False,  # default
+        "include_image_descriptions": False,  # default
+        "include_answer": False,  # default
+        "include_raw_content": True,  # default
+        "include_domains": [],  # default
+        "exclude_domains": [],  # default
+    }
+    with stage("tavily"):
+        response = requests.post(TAVILY_URL, json=payload)
+        response.raise_for_status()
+    count_bytes("tavily", len(response.content))
+    return response.json()
+
+
+def load_json(path):
+    with open(path, "r") as json_file:
+        return json.load(json_file)
+
+
+def save_json(data, path):
+    with open(path, "w") as json_file:
+        json.dump(data, json_file, indent=2)
+    return path
+
+
+class ReelJob:
+    """
+    What to make (search topic, article, summary topic) and where its files go.
+
+    The job id depends only on what is made, so posting the same request
+    again reuses the job directory and resumes or skips finished stages;
+    settings such as the render profile only invalidate the stages they feed.
+    Search and summary files live in the article directory and are shared by
+    the reels of every topic of that article.
+    """
+    def __init__(self, topic, title="", topic_index=0, profile=DEFAULT_PROFILE, target_size=(1080, 1920), reels_dir=REELS_DIR):
+        self.topic = topic
+        self.title = title
+        self.topic_index = topic_index
+        self.profile = profile
+        self.target_size = tuple(target_size)
+        self.article_id = digest({"topic": topic, "title": title})[:16]
+        self.job_id = f"{self.article_id}-{topic_index}"
+        self.article_dir = os.path.join(reels_dir, self.article_id)
+        self.job_dir = os.path.join(self.article_dir, f"topic_{topic_index}")
+
+    def article_path(self, *names):
+        return os.path.join(self.article_dir, *names)
+
+    def path(self, *names):
+        return os.path.join(self.job_dir, *names)
+
+
+def search_stage(job, inputs):
+    path = save_json(search_articles(job.topic), job.article_path("search_results.json"))
+    return {"files": [path]}
+
+
+def summarize_stage(job, inputs):
+    search_results = load_json(inputs["search"]["files"][0])
+    articles = [item for item in search_results.get("results", []) if item.get("raw_content")]
+    if job.title:
+        articles = [item for item in articles if item.get("title") == job.title]
+    if not articles:
+        raise ValueError(f"No search result with content found for {job.title or job.topic!r}")
+    article = articles[0]
+
+    summaries = [
+        {
+            "title": result.title,
+            "script": result.script,
+            "follow_up_question": result.follow_up_question,
+            "caption": result.caption,
+        }
+        for result in summarize_article(article["raw_content"])
+    ]
+    path = save_json(summaries, job.article_path("summaries.json"))
+    return {"files": [path], "article": article.get("title")}
+
+
+async def tts_stage(job, inputs):
+    summaries = load_json(inputs["summarize"]["files"][0])
+    if not 0 <= job.topic_index < len(summaries):
+        raise ValueError(f"Topic {job.topic_index} out of range; the article has {len(summaries)} topics")
+    summary = summaries[job.topic_index]
+    text = f"{summary['title']}\n{summary['script']}"
+
+    # Scenes are planned by the next stage, so re-planning does not redo TTS
+    transcriber = Transcriber(
+        text,
+        job.path("output.mp3"),
+        job.path("output_subtitles.srt"),
+        job.path("output_images.srt"),
+        job.path("words.json"),
+        scene_planner=False,
+    )
+    await transcriber.generate_audio_and_convert()
+    return {"files": [job.path("output.mp3"), job.path("words.json")], "title": summary["title"], "text": text}
+
+
+def plan_stage(job, inputs, planner=None):
+    planner = planner or ScenePlanner()
+    words = Timeline.load(job.path("words.json")).words
+    timeline = Timeline.from_words(words, inputs["tts"]["text"], planner)
+    timeline.captions.to_srt(job.path("output_subtitles.srt"))
+    timeline.scenes.to_srt(job.path("output_images.srt"))
+    timeline.save(job.path("timeline.json"))
+    return {"files": [job.path("timeline.json")], "images": len(set(timeline.scenes.indices))}
+
+
+async def prompts_stage(job, inputs):
+    timeline = Timeline.load(inputs["plan"]["files"][0])
+    contents = {}
+    for cue in timeline.scenes:
+        contents.setdefault(cue.index, []).append(cue.text)
+
+    prompts = {}
+    for index, scene_contents in contents.items():
+        prompts[str(index)] = await asyncio.to_thread(generate_prompt, " ".join(scene_contents), get_transcriber_chain())
+        await asyncio.sleep(PROMPT_INTERVAL)
+    path = save_json(prompts, job.path("prompts.json"))
+    return {"files": [path]}
+
+
+async def images_stage(job, inputs):
+    """
+    Generate one image per prompt. Images whose prompt did not change since
+    an earlier, partly failed run are kept, so a retry only fetches the rest.
+    """
+    prompts = load_json(inputs["prompts"]["files"][0])
+    image_dir = job.path("images")
+    os.makedirs(image_dir, exist_ok=True)
+    done_path = os.path.join(image_dir, "prompts.json")
+    done = load_json(done_path) if os.path.exists(done_path) else {}
+
+    todo = {
+        index: prompt for index, prompt in prompts.items()
+        if done.get(index) != prompt or not os.path.exists(os.path.join(image_dir, f"{index}.png"))
+    }
+    async with aiohttp.ClientSession() as session:
+        results = await asyncio.gather(*(
+            generate_image(int(index), prompt, session, overwrite=True, image_dir=image_dir)
+            for index, prompt in todo.items()
+        ))
+
+    for (index, prompt), image_path in zip(todo.items(), results):
+        if image_path is not None:
+            done[index] = prompt
+    save_json(done, done_path)
+
+    failed = sorted(index for (index, _), image_path in zip(todo.items(), results) if image_path is None)
+    if failed:
+        raise RuntimeError(f"Image generation failed for scenes {failed}")
+    return {"files": [os.path.join(image_dir, f"{index}.png") for index in sorted(prompts, key=int)]}
+
+
+async def render_stage(job, inputs):
+    output_path = job.path("output_video.mp4")
+    creator_args = (
+        job.path("images"),
+        job.path("resized_images"),
+        job.target_size,
+        job.path("output.mp3"),
+        job.path("output_subtitles.srt"),
+        job.path("output_images.srt"),
+        output_path,
+    )
+    creator_kwargs = {"segments": PER_SCENE, "profile": job.profile, "timeline_path": inputs["plan"]["files"][0]}
+    # Pipelines are already bounded by the "render" stage limit, so they queue instead of being refused
+    await render_pool.run(
+        render_reel, creator_args, creator_kwargs,
+        description=f"reel {job.job_id}", admit=False, profile_dir=job.path("profiles"),
+    )
+    return {"files": [output_path]}
+
+
+# Concurrent stages of all jobs in the process, per resource. Renders and
+# TTS are CPU/bandwidth heavy, and the LLM and image endpoints are rate limited.
+STAGE_LIMITS = {"llm": 1, "tts": 2, "images": 2, "render": 1}
+_stage_semaphores = {}
+
+
+def stage_semaphores():
+    """
+    One process-wide semaphore per resource in STAGE_LIMITS.
+    """
+    if not _stage_semaphores:
+        _stage_semaphores.update({name: asyncio.Semaphore(limit) for name, limit in STAGE_LIMITS.items()})
+    return _stage_semaphores
+
+
+def article_stages(job):
+    """
+    search -> summarize, shared by every topic of the article
+    """
+    return [
+        Stage("search", search_stage, config={"topic": job.topic}),
+        Stage("summarize", summarize_stage, ["search"], config={"title": job.title}, resource="llm"),
+    ]
+
+
+def topic_stages(job, planner=None):
+    """
+    tts -> plan -> prompts -> images -> render, for one topic of the summary
+    """
+    planner = planner or ScenePlanner()
+    return [
+        Stage("tts", tts_stage, ["summarize"], config={"topic_index": job.topic_index}, resource="tts"),
+        Stage(
+            "plan", lambda job, inputs: plan_stage(job, inputs, planner), ["tts"],
+            config={
+                "min_duration": planner.min_duration,
+                "max_duration": planner.max_duration,
+                "merge_threshold": planner.merge_threshold,
+                "duplicate_threshold": planner.duplicate_threshold,
+            },
+        ),
+        Stage("prompts", prompts_stage, ["plan"], resource="llm"),
+        Stage("images", images_stage, ["prompts"], resource="images"),
+        # The timeline is an input too: scenes can change timing without changing prompts
+        Stage(
+            "render", render_stage, ["images", "plan", "tts"],
+            config={"profile": job.profile, "target_size": job.target_size}, resource="render",
+        ),
+    ]
+
+
+async def run_article(job, progress=None):
+    """
+    Run (or reuse) the search and summary of a job's article. Returns the pipeline, for its records.
+    """
+    pipeline = Pipeline(article_stages(job), job.article_dir, store=artifact_store, artifact_id=job.article_id)
+    _, timings = await pipeline.run(job, limits=stage_semaphores(), progress=progress)
+    return pipeline, timings
+
+
+def summary_record(job, summaries):
+    """
+    A summarize record (see Pipeline.record) for summaries the caller already
+    has, e.g. the ones /summarize returned and the user read, so the reels
+    are made from them instead of a new summary of the article.
+    """
+    os.makedirs(job.article_dir, exist_ok=True)
+    # Named by content, so the record of the article's own summarize stage is left alone
+    path = save_json(summaries, job.article_path(f"summaries_{digest(summaries)[:12]}.json"))
+    artifact_store.record(job.article_id, [path], job.article_dir)
+    outputs = {"files": [path], "article": job.title}
+    return {"outputs": outputs, "digest": output_digest(outputs)}
+
+
+async def run_topic(job, summary, planner=None, progress=None):
+    """
+    Run (or reuse) the stages of one topic, from a summarize record (see run_article() and summary_record()).
+    """
+    pipeline = Pipeline(topic_stages(job, planner), job.job_dir, store=artifact_store, artifact_id=job.job_id)
+    return await pipeline.run(
+        job, upstream={"summarize": summary}, limits=stage_semaphores(), progress=progress,
+    )
+
+
+async def run_reel(job, planner=None):
+    """
+    Run (or resume) a reel job. Returns (outputs by stage, per-stage timings).
+
+    Every stage, external call and render step is traced under the job id.
+    """
+    with traced(job.job_id):
+        article, article_timings = await run_article(job)
+        outputs, timings = await run_topic(job, article.record("summarize"), planner)
+    return outputs, article_timings + timings
+
+
+class ReelBatch:
+    """
+    Reels for several topics of one article, generated concurrently.
+
+    The article is searched and summarized once, unless its summaries are
+    given (see summary_record()); each topic then runs its own stages, with
+    the process-wide STAGE_LIMITS deciding how many TTS, LLM, image and
+    render stages run at the same time across all reels.
+    progress holds the current stage and status of every reel while it runs.
+
+    The batch id depends on the article and on what is asked of it (topics,
+    profile, summaries), so posting the same request again finds the same
+    batch, and a different request for the same article gets its own.
+    """
+    def __init__(self, topic, title="", topic_indices=None, profile=DEFAULT_PROFILE, planner=None, summaries=None):
+        self.base_job = ReelJob(topic, title, 0, profile)
+        self.topic_indices = topic_indices
+        self.summaries = summaries
+        self.profile = profile
+        self.planner = planner
+        request = {"topic_indices": topic_indices, "profile": profile, "summaries": summaries}
+        self.batch_id = f"{self.base_job.article_id}-{digest(request)[:8]}"
+        self.progress = {"article": {"stage": None, "status": "pending"}}
+        self.results = {}
+        self.status = "pending"
+        self.wall_seconds = None
+        self.task = None
+
+    @property
+    def active(self):
+        return self.status in ("pending", "running")
+
+    def jobs(self):
+        """
+        The reels of the batch; empty until the topics are known when topic_indices was not given.
+        """
+        return [
+            ReelJob(self.base_job.topic, self.base_job.title, index, self.profile) for index in self.topic_indices or []
+        ]
+
+    def overlaps(self, other):
+        """
+        Whether both batches may make a reel of the same topic of the same
+        article. Such reels share a job directory, so they must not run at once.
+        """
+        if self.base_job.article_id != other.base_job.article_id:
+            return False
+        if self.topic_indices is None or other.topic_indices is None:
+            return True
+        return bool(set(self.topic_indices) & set(other.topic_indices))
+
+    def reporter(self, key):
+        def report(stage, status):
+            self.progress[key] = {"stage": stage, "status": status}
+        return report
+
+    async def run_one(self, job, summary):
+        key = job.job_id
+        try:
+            with traced(job.job_id):
+                outputs, timings = await run_topic(job, summary, self.planner, self.reporter(key))
+        except PipelineError as e:
+            self.results[key] = {"status": "failed", "failed_stage": e.stage, "error": str(e), "stages": e.timings}
+        except Exception as e:
+            # A failure outside the stages (e.g. an unreadable upstream record) fails this reel only
+            self.results[key] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        else:
+            self.results[key] = {
+                "status": "done",
+                "title": outputs["tts"]["title"],
+                "video": outputs["render"]["files"][0],
+                "video_url": f"/media/{job.job_id}/{os.path.basename(outputs['render']['files'][0])}",
+                "stages": timings,
+            }
+
+    async def run(self):
+        self.status = "running"
+        start = time.perf_counter()
+        try:
+            if self.summaries is None:
+                with traced(self.batch_id):
+                    article, _ = await run_article(self.base_job, self.reporter("article"))
+                summary = article.record("summarize")
+            else:
+                summary = await asyncio.to_thread(summary_record, self.base_job, self.summaries)
+                self.progress["article"] = {"stage": "summarize", "status": "done"}
+            if self.topic_indices is None:
+                self.topic_indices = list(range(len(load_json(summary["outputs"]["files"][0]))))
+            jobs = self.jobs()
+            for job in jobs:
+                self.progress[job.job_id] = {"stage": None, "status": "pending"}
+            await asyncio.gather(*(self.run_one(job, summary) for job in jobs))
+            self.status = "done"
+        except PipelineError as e:
+            self.status = "failed"
+            self.results["article"] = {"status": "failed", "failed_stage": e.stage, "error": str(e), "stages": e.timings}
+        except Exception as e:
+            self.status = "failed"
+            self.results["batch"] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        except asyncio.CancelledError:
+            # e.g. the server shutting down; pollers must not see it running forever
+            self.status = "failed"
+            self.results["batch"] = {"status": "failed", "error": "Batch cancelled"}
+            raise
+        finally:
+            self.wall_seconds = round(time.perf_counter() - start, 3)
+
+    def summary(self):
+        done = sum(1 for result in self.results.values() if result["status"] == "done")
+        summary = {
+            "batch_id": self.batch_id,
+            "status": self.status,
+            # Reel job id by topic index; progress and results are keyed by job id
+            "jobs": {str(job.topic_index): job.job_id for job in self.jobs()},
+            "progress": self.progress,
+            "results": self.results,
+            "wall_seconds": self.wall_seconds,
+        }
+        if self.wall_seconds:
+            stage_seconds = sum(
+                stage["seconds"] for result in self.results.values() for stage in result.get("stages", [])
+            )
+            summary["reels_done"] = done
+            summary["reels_per_minute"] = round(done * 60 / self.wall_seconds, 3)
+            # Stage time over wall time: how much the reels overlapped
+            summary["concurrency"] = round(stage_seconds / self.wall_seconds, 2)
+        return summary
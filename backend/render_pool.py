@@ -0,0 +1,223 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from backend.metrics import Gauge, call_collecting, collected, current_trace, merge
+from backend.profiling import call_profiled, current_profile
+from backend.segment_render import CancelToken, RenderCancelled
+
+load_dotenv()
+
+# Renders running at once; each render already spreads over the cores itself
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+# Renders allowed to wait for a worker before new ones are turned away
+RENDER_MAX_QUEUE = int(os.getenv("RENDER_MAX_QUEUE", "4"))
+# Worker processes are replaced after this many renders, returning their memory
+RENDER_TASKS_PER_WORKER = int(os.getenv("RENDER_TASKS_PER_WORKER", "8"))
+# Finished jobs kept for GET /renders
+RENDER_HISTORY = 50
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_SECONDS = 1.0
+
+RENDER_JOBS = Gauge("medireels_render_jobs", "Render pool jobs by status.", ["status"])
+
+
+class RenderPoolFull(RuntimeError):
+    """
+    Every worker is busy and the queue is full.
+    """
+
+
+def render_reel(creator_args, creator_kwargs, method="render_video", method_args=(), cancel=None):
+    """
+    Run one VideoCreator session in a render worker and return what `method` returns.
+    """
+    # Rendering modules (moviepy, numpy, Pillow) load in the worker, not in the web app
+    from backend.video_render import VideoCreator
+
+    with VideoCreator(*creator_args, cancel=cancel, **creator_kwargs) as video_creator:
+        return getattr(video_creator, method)(*method_args)
+
+
+class RenderJob:
+    """
+    A render submitted to the pool, with its cancellation token and timing.
+    """
+    def __init__(self, job_id, description, future, cancel):
+        self.job_id = job_id
+        self.description = description
+        self.future = future
+        self.cancel = cancel
+        self.cancelled = False
+        self.submitted_at = time.time()
+        self.finished_at = None
+        future.add_done_callback(self.finished)
+
+    def finished(self, future):
+        self.finished_at = time.time()
+        self.cancel.clear()
+        metrics = collected(future)
+        if metrics is not None:
+            merge(metrics)
+
+    def result(self):
+        """
+        What the render returned (the worker's metrics are merged when it finishes).
+        """
+        return self.future.result()[0]
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            if self.cancelled:
+                return "cancelling"
+            return "running" if self.future.running() else "queued"
+        if self.future.exception() is not None:
+            return "cancelled" if self.cancelled else "failed"
+        return "done"
+
+    @property
+    def active(self):
+        return not self.future.done()
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        info = {
+            "job_id": self.job_id,
+            "description": self.description,
+            "status": self.status,
+            "seconds": round(end - self.submitted_at, 3),
+        }
+        if self.status == "failed":
+            info["error"] = str(self.future.exception())
+        return info
+
+
+class RenderPool:
+    """
+    Process pool dedicated to CPU-bound renders, apart from the API's event loop and I/O threads.
+
+    At most max_workers renders run at once and at most max_queue wait;
+    further submissions raise RenderPoolFull. Workers are spawned fresh and
+    replaced after max_tasks_per_worker renders. A render whose client went
+    away, or that is cancelled through cancel(), is dropped from the queue or
+    stopped at its next cancellation check.
+    """
+    def __init__(self, max_workers=RENDER_WORKERS, max_queue=RENDER_MAX_QUEUE, max_tasks_per_worker=RENDER_TASKS_PER_WORKER, cancel_dir=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.cancel_dir = cancel_dir or os.path.join(tempfile.gettempdir(), f"render_cancel_{os.getpid()}")
+        self.jobs = OrderedDict()
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            os.makedirs(self.cancel_dir, exist_ok=True)
+            # spawn: workers do not inherit the API's threads, sockets or event loop
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_worker,
+            )
+        return self.executor
+
+    def active_jobs(self):
+        return [job for job in self.jobs.values() if job.active]
+
+    def submit(self, fn, *args, description="", admit=True, profile_dir=None):
+        """
+        Queue fn(*args, cancel=token) on the pool. With admit, refuse when the pool is full.
+
+        The worker runs fn under the caller's trace id and profiling mode
+        (profiles go to profile_dir) and returns the metrics it recorded
+        along with the result; see RenderJob.result().
+        """
+        if admit and len(self.active_jobs()) >= self.max_workers + self.max_queue:
+            raise RenderPoolFull(f"{self.max_workers} renders running and {self.max_queue} queued; try again later")
+
+        job_id = uuid.uuid4().hex[:12]
+        cancel = CancelToken(os.path.join(self.cancel_dir, job_id))
+        future = self.get_executor().submit(
+            call_collecting, call_profiled, current_profile.get(), "render", profile_dir, fn, *args,
+            cancel=cancel, trace_id=current_trace.get(),
+        )
+        job = RenderJob(job_id, description, future, cancel)
+        self.jobs[job_id] = job
+        finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - RENDER_HISTORY)]:
+            del self.jobs[job_id]
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running render. Returns False if it already finished.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancelled = True
+        if not job.future.cancel():
+            job.cancel.cancel()
+        return True
+
+    async def run(self, fn, *args, description="", request=None, admit=True, profile_dir=None):
+        """
+        Submit a render and wait for its result without blocking the event loop.
+
+        The render is cancelled if the waiting task is cancelled, or if
+        request (a Starlette Request) disconnects while it waits; the latter
+        raises RenderCancelled.
+        """
+        job = self.submit(fn, *args, description=description, admit=admit, profile_dir=profile_dir)
+        result = asyncio.wrap_future(job.future)
+        # The outcome is read through job.result(); mark it retrieved here so asyncio does not log it
+        result.add_done_callback(lambda future: future.cancelled() or future.exception())
+        try:
+            while True:
+                done, _ = await asyncio.wait({result}, timeout=DISCONNECT_POLL_SECONDS)
+                if done:
+                    return job.result()
+                if request is not None and await request.is_disconnected():
+                    print(f"Client went away, cancelling render {job.job_id}")
+                    self.cancel(job.job_id)
+                    # A queued render is dropped outright; awaiting it would raise CancelledError
+                    if job.future.cancelled():
+                        raise RenderCancelled(f"Render {job.job_id} cancelled before it started")
+                    await asyncio.wait({result})
+                    return job.result()
+        except asyncio.CancelledError:
+            self.cancel(job.job_id)
+            raise
+
+    def status(self):
+        jobs = [job.to_dict() for job in self.jobs.values()]
+        for status in ("queued", "running", "cancelling"):
+            RENDER_JOBS.set(sum(1 for job in jobs if job["status"] == status), status=status)
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "tasks_per_worker": self.max_tasks_per_worker,
+            "running": sum(1 for job in jobs if job["status"] in ("running", "cancelling")),
+            "queued": sum(1 for job in jobs if job["status"] == "queued"),
+            "jobs": jobs,
+        }
+
+    def shutdown(self):
+        for job in self.active_jobs():
+            self.cancel(job.job_id)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+render_pool = RenderPool()
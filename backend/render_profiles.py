@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """
+    Output resolution, frame rate and x264 settings for one render quality tier.
+
+    scale is relative to the VideoCreator target_size, which stays the size
+    scene images and caption rasters are prepared at; lower tiers downscale
+    those shared assets instead of preparing their own.
+    """
+    name: str
+    scale: float = 1.0
+    fps: int = 24
+    codec: str = "libx264"
+    preset: str = "medium"
+    crf: Optional[int] = None
+    tune: Optional[str] = None
+    threads: Optional[int] = None
+
+    def output_size(self, target_size):
+        """
+        Scaled frame size, rounded down to even dimensions as yuv420p requires.
+        """
+        return tuple(max(2, int(side * self.scale) // 2 * 2) for side in target_size)
+
+    def ffmpeg_params(self):
+        """
+        Encoder arguments not covered by codec/preset/threads.
+        """
+        params = []
+        if self.crf is not None:
+            params += ["-crf", str(self.crf)]
+        if self.tune:
+            params += ["-tune", self.tune]
+        return params
+
+    def encoder_args(self):
+        """
+        Complete video encoder arguments for a raw ffmpeg command line.
+        """
+        args = ["-c:v", self.codec, "-preset", self.preset] + self.ffmpeg_params()
+        if self.threads is not None:
+            args += ["-threads", str(self.threads)]
+        return args
+
+
+RENDER_PROFILES = {
+    # Quick check of scene order and caption timing
+    "draft": RenderProfile("draft", scale=0.5, fps=12, preset="ultrafast", crf=30),
+    # Publishable output; stillimage tuning suits slideshow-style reels
+    "final": RenderProfile("final", scale=1.0, fps=24, preset="slow", crf=20, tune="stillimage", threads=0),
+}
+DEFAULT_PROFILE = "final"
+# VideoCreator segments value giving every scene its own segment
+PER_SCENE = "scenes"
+
+
+def get_profile(profile):
+    """
+    Look up a profile by name; RenderProfile instances are passed through.
+    """
+    if isinstance(profile, RenderProfile):
+        return profile
+    try:
+        return RENDER_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown render profile {profile!r}; expected one of {sorted(RENDER_PROFILES)}")
@@ -0,0 +1,184 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from math import ceil, sqrt
+
+SENTENCE_END = re.compile(r"[.!?]")
+WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours out over
+own same she should so some such than that the their theirs them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+@dataclass
+class Scene:
+    """
+    A run of spoken words shown over one image.
+    """
+    start: float
+    end: float
+    text: str
+    terms: Counter
+    image_index: int = 0
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def extend(self, other):
+        self.end = other.end
+        self.text = f"{self.text} {other.text}"
+        self.terms = self.terms + other.terms
+
+
+def content_terms(text):
+    """
+    Bag of content words: lowercased, stopwords dropped, plural "s" stripped.
+    """
+    terms = Counter()
+    for word in WORD.findall(text.lower()):
+        word = word.strip("'")
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            word = word[:-1]
+        terms[word] += 1
+    return terms
+
+
+def similarity(a, b):
+    """
+    Cosine similarity of two term bags (0 when either is empty).
+    """
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[term] for term, count in a.items() if term in b)
+    return dot / (sqrt(sum(v * v for v in a.values())) * sqrt(sum(v * v for v in b.values())))
+
+
+def sentence_ends(words, text):
+    """
+    For each word, whether a sentence ends after it in the source text.
+
+    TTS word boundaries carry no punctuation, so each word is located in the
+    script and the characters up to the next word are checked instead.
+    """
+    ends = []
+    cursor = 0
+    lowered = text.lower()
+    for n, (_, _, word) in enumerate(words):
+        position = lowered.find(word.lower(), cursor)
+        if position < 0:
+            ends.append(False)
+            continue
+        cursor = position + len(word)
+        if n + 1 < len(words):
+            following = lowered.find(words[n + 1][2].lower(), cursor)
+            gap = lowered[cursor:following] if following >= 0 else ""
+        else:
+            gap = lowered[cursor:]
+        ends.append(bool(SENTENCE_END.search(gap)))
+    return ends
+
+
+def split_evenly(group, max_duration):
+    """
+    Cut a run of words longer than max_duration into the fewest equal-length parts.
+    """
+    parts = ceil((group[-1][1] - group[0][0]) / max_duration) if group else 1
+    if parts <= 1:
+        return [group]
+    size = ceil(len(group) / parts)
+    return [group[i:i + size] for i in range(0, len(group), size)]
+
+
+def split_sentences(words, text, max_duration):
+    """
+    Group (start, end, word) boundaries into sentences, breaking sentences longer than max_duration.
+    """
+    sentences = []
+    current = []
+    for word, ends_sentence in zip(words, sentence_ends(words, text)):
+        current.append(word)
+        if ends_sentence:
+            sentences.append(current)
+            current = []
+    if current:
+        sentences.append(current)
+
+    scenes = []
+    for sentence in sentences:
+        for group in split_evenly(sentence, max_duration):
+            group_text = " ".join(word for _, _, word in group)
+            scenes.append(Scene(group[0][0], group[-1][1], group_text, content_terms(group_text)))
+    return scenes
+
+
+class ScenePlanner:
+    """
+    Group spoken words into image scenes by sentence and topic.
+
+    Sentences are merged while a scene is shorter than min_duration, or while
+    the next sentence stays on the same topic (term similarity of at least
+    merge_threshold) and the scene stays within max_duration. Scenes whose
+    text is a near duplicate of an earlier scene (similarity of at least
+    duplicate_threshold) reuse that scene's image, so they cost no prompt or
+    image call.
+
+    The defaults keep the median scene close to the six or so seconds that
+    15 spoken words take, and never show one image for more than 10 seconds.
+    """
+    def __init__(self, min_duration=5.0, max_duration=10.0, merge_threshold=0.2, duplicate_threshold=0.6):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.merge_threshold = merge_threshold
+        self.duplicate_threshold = duplicate_threshold
+
+    def group(self, sentences):
+        scenes = []
+        for sentence in sentences:
+            current = scenes[-1] if scenes else None
+            fits = current is not None and sentence.end - current.start <= self.max_duration
+            if fits and (
+                current.duration < self.min_duration
+                or similarity(current.terms, sentence.terms) >= self.merge_threshold
+            ):
+                current.extend(sentence)
+            else:
+                scenes.append(sentence)
+        # A short closing scene joins the previous one when it fits
+        if len(scenes) > 1 and scenes[-1].duration < self.min_duration and scenes[-1].end - scenes[-2].start <= self.max_duration:
+            scenes[-2].extend(scenes.pop())
+        return scenes
+
+    def assign_images(self, scenes):
+        """
+        Number the images, giving near-duplicate scenes the image of the first one.
+        """
+        originals = []
+        for scene in scenes:
+            match = max(originals, key=lambda original: similarity(original.terms, scene.terms), default=None)
+            if match is not None and similarity(match.terms, scene.terms) >= self.duplicate_threshold:
+                scene.image_index = match.image_index
+            else:
+                scene.image_index = len(originals) + 1
+                originals.append(scene)
+        return scenes
+
+    def plan(self, words, text=""):
+        """
+        Plan scenes from (start, end, word) boundaries in seconds and the script they were spoken from.
+
+        Scenes are extended to the start of the next one, so no black frames
+        show between sentences.
+        """
+        if not words:
+            return []
+        scenes = self.assign_images(self.group(split_sentences(words, text, self.max_duration)))
+        for scene, following in zip(scenes, scenes[1:]):
+            scene.end = following.start
+        return scenes
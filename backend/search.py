@@ -1,24 +1,40 @@
 # Import necessary modules
 import aiohttp
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse, Response
 from pydantic import BaseModel
+from typing import List, Optional
 from dotenv import load_dotenv
 import os
 import requests
 import json
 import asyncio
+import time
+import anyio
+import re
+import shutil
+from collections import OrderedDict
 from backend.summarize import (
     summarize_article,
     query_is_valid,
-    parse_srt,
     generate_prompt,
     generate_image,
-    transcriber_chain,
+    get_transcriber_chain,
+    load_clients,
 )
+from backend.artifacts import artifact_store, run_gc_periodically
+from backend.metrics import Histogram, render_metrics, spans, traced
+from backend.profiling import profiled, profiling, request_profile_mode
+from backend.timeline import load_timeline
 from backend.transcriber import Transcriber
-from backend.video_render import VideoCreator
-from backend.podcast_script import generate_script, save_script_to_json
-from backend.podcast import generate_podcast
+from backend.render_profiles import DEFAULT_PROFILE, PER_SCENE, RENDER_PROFILES
+from backend.pipeline import PipelineError, digest
+from backend.reels import ReelBatch, ReelJob, run_reel, search_articles
+from backend.render_pool import RenderPoolFull, render_pool, render_reel
+from backend.segment_render import RenderCancelled
+from backend.ffmpeg_render import OUTPUT_FORMATS
+from backend.podcast_script import agenerate_script, asave_script_to_json
+from backend.podcast import generate_podcast, new_podcast_dir
 
 # Step 1: Load environment variables from the .env file
 load_dotenv()
@@ -33,6 +49,54 @@ if not api_key:
 # Initialize FastAPI app
 app = FastAPI()
 
+# Artifact store job of the videos rendered by /generate_video
+LEGACY_VIDEO_JOB = "generate_video"
+ARTIFACT_NAME = re.compile(r"[0-9a-f]{64}(\.[a-z0-9]+)?")
+JOB_ID = re.compile(r"[\w-]+")
+
+# Reel batches by id, oldest first; kept so their progress can be polled
+batches = OrderedDict()
+# Finished batches kept for GET /reels/batch/{batch_id}
+BATCH_HISTORY = 50
+
+# Clients may pass their own trace id; it is echoed back on every response
+TRACE_HEADER = "X-Trace-Id"
+# "1", "sample" or "cprofile" profiles the request; the artifact path comes back in PROFILE_ARTIFACT_HEADER
+PROFILE_HEADER = "X-Profile"
+PROFILE_ARTIFACT_HEADER = "X-Profile-Artifact"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+HTTP_SECONDS = Histogram(
+    "medireels_http_request_seconds", "API request latency by route, method and status.", ["route", "method", "status"]
+)
+
+
+# Every request runs under a trace id, which its stages and external calls are recorded with.
+# Profiled requests (opt-in header or PROFILE_SAMPLE_RATE) also profile their pipeline stages and renders.
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    mode = request_profile_mode(request.headers.get(PROFILE_HEADER))
+    with traced(request.headers.get(TRACE_HEADER)) as trace_id, profiling(mode):
+        start = time.perf_counter()
+        # Requests that raise are still timed, as the 500 the client gets
+        status = 500
+        try:
+            with profiled(f"{request.method} {request.url.path}") as profile_path:
+                response = await call_next(request)
+            status = response.status_code
+        finally:
+            # The route template, not the path, so ids in URLs do not become labels
+            route = request.scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start,
+                route=getattr(route, "path", "unmatched"),
+                method=request.method,
+                status=status,
+            )
+        response.headers[TRACE_HEADER] = trace_id
+        if profile_path:
+            response.headers[PROFILE_ARTIFACT_HEADER] = profile_path
+        return response
+
 
 # Define a Pydantic model for the request body
 class SearchRequest(BaseModel):
@@ -43,6 +107,38 @@ class SummarizeRequest(BaseModel):
     title: str
 
 
+class SceneRequest(BaseModel):
+    index: int
+    prompt: str = ""
+
+
+class ReelRequest(BaseModel):
+    topic: str
+    # Search result to summarize (default: the first one with content)
+    title: str = ""
+    # Which of the summary's topics to turn into a reel
+    topic_index: int = 0
+    profile: str = DEFAULT_PROFILE
+
+
+class Summary(BaseModel):
+    title: str
+    script: str
+    follow_up_question: str = ""
+    caption: str = ""
+
+
+class ReelBatchRequest(BaseModel):
+    topic: str
+    title: str = ""
+    # Summary topics to make reels for (default: all of them)
+    topic_indices: Optional[List[int]] = None
+    profile: str = DEFAULT_PROFILE
+    # The article's summaries as /summarize returned them; the reels are made
+    # from these instead of a new search and summary
+    summaries: Optional[List[Summary]] = None
+
+
 # Define the GET endpoint to check if the query is valid
 @app.get("/is_valid")
 async def is_valid_query(topic: str):
@@ -53,30 +149,9 @@ async def is_valid_query(topic: str):
 # Define the POST endpoint for Tavily search
 @app.post("/search")
 async def search_tavily(request: SearchRequest):
-    # Define the Tavily API endpoint
-    url = "https://api.tavily.com/search"
-
-    # Prepare the payload for the Tavily request
-    payload = {
-        "api_key": api_key,
-        "query": "Trending topics in " + request.topic,
-        "search_depth": "advanced",  # default
-        "topic": "general",  # default
-        "days": 180,  # default
-        "max_results": 5,  # default
-        "include_images": False,  # default
-        "include_image_descriptions": False,  # default
-        "include_answer": False,  # default
-        "include_raw_content": True,  # default
-        "include_domains": [],  # default
-        "exclude_domains": [],  # default
-    }
-
     try:
         # Send the POST request to the Tavily API
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # Raise an HTTPError for bad responses
-        search_results = response.json()
+        search_results = search_articles(request.topic, api_key)
 
         # Write the response to a JSON file
         if not os.path.exists("results"):
@@ -88,14 +163,14 @@ async def search_tavily(request: SearchRequest):
         return search_results
 
     except requests.exceptions.HTTPError as http_err:
-        raise HTTPException(status_code=response.status_code, detail=str(http_err))
+        raise HTTPException(status_code=http_err.response.status_code, detail=str(http_err))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
 
 # Define the POST endpoint for podcast  generation
 @app.post("/generate_podcast")
-def generate_podcast_endpoint(request: SummarizeRequest):
+async def generate_podcast_endpoint(request: SummarizeRequest):
     # Path to the search results JSON file
     results_file = "results/search_results.json"
 
@@ -108,8 +183,7 @@ def generate_podcast_endpoint(request: SummarizeRequest):
 
     # Load the search results
     try:
-        with open(results_file, "r") as json_file:
-            search_results = json.load(json_file)
+        search_results = json.loads(await anyio.Path(results_file).read_text())
     except json.JSONDecodeError:
         raise HTTPException(
             status_code=500, detail="Failed to decode search results JSON."
@@ -139,19 +213,36 @@ def generate_podcast_endpoint(request: SummarizeRequest):
         )
 
     # Generate the podcast script
-    podcast_script = generate_script(raw_content)
+    podcast_script = await agenerate_script(raw_content)
     if not podcast_script:
         raise HTTPException(
             status_code=500, detail="Failed to generate podcast script."
         )
-    save_script_to_json(podcast_script)
 
-    filename = "results/podcast_script.json"
-    with open(filename, "r") as json_file:
-        podcast_data = json.load(json_file)
+    # Each request works in a directory of its own, so concurrent podcasts never share files.
+    # The script and the podcast are kept in the artifact store; the line clips are dropped.
+    podcast_dir = await asyncio.to_thread(new_podcast_dir)
+    try:
+        podcast_data = await asave_script_to_json(podcast_script, directory=podcast_dir)
 
-    # Run the podcast generation asynchronously
-    asyncio.run(generate_podcast(podcast_data))
+        # Run the podcast generation on the app's event loop
+        podcast_file = await generate_podcast(podcast_data, podcast_dir)
+
+        job_id = f"podcast-{digest({'title': request.title})[:16]}"
+        stored = await asyncio.to_thread(
+            artifact_store.record, job_id, [podcast_file, os.path.join(podcast_dir, "podcast_script.json")], adopt=False,
+        )
+    finally:
+        await asyncio.to_thread(shutil.rmtree, podcast_dir, ignore_errors=True)
+    blob = stored[os.path.basename(podcast_file)]
+    return {
+        "job_id": job_id,
+        "podcast_title": podcast_data["podcast_title"],
+        "artifact": blob,
+        "path": artifact_store.blob_path(blob),
+        "url": artifact_url(blob),
+        "script_url": artifact_url(stored["podcast_script.json"]),
+    }
 
 
 # Define the POST endpoint for summarization
@@ -225,11 +316,10 @@ async def summarize_content(request: SummarizeRequest):
 
 # Define the POST endpoint for transcribing
 @app.post("/transcribe")
-def transcribe(request: SummarizeRequest):
+async def transcribe(request: SummarizeRequest):
     # Path to the search results JSON file
     results_file = "results/summaries.json"
-    with open(results_file, "r") as json_file:
-        search_results = json.load(json_file)
+    search_results = json.loads(await anyio.Path(results_file).read_text())
     # Find the result with the matching title
     result = next(
         (item for item in search_results if item.get("title") == request.title),
@@ -249,13 +339,11 @@ def transcribe(request: SummarizeRequest):
     transcriber = Transcriber(
         text,
         "results/output.mp3",
-        "results/output_subtitles.vtt",
-        "results/output_images.vtt",
         "results/output_subtitles.srt",
         "results/output_images.srt",
+        "results/timeline.json",
     )
-    asyncio.run(transcriber.generate_audio_and_convert())
-    # transcriber.generate_audio_and_convert()
+    await transcriber.generate_audio_and_convert()
 
     return {"message": "Transcription completed successfully."}
 
@@ -269,20 +357,21 @@ async def generate_images():
             detail="Subtitles not found. Please transcribe the content first."
         )
 
-    # Path to your SRT file
-    srt_file_path = "results/output_images.srt"
+    # Scene timing saved by /transcribe
+    timeline = load_timeline("results/timeline.json", "results/output_subtitles.srt", "results/output_images.srt")
 
-    # Parse the SRT file
-    subtitles = parse_srt(srt_file_path)
+    # Step 1: Generate prompts for all images. Scenes that share an image
+    # repeat its index, and are described together in one prompt
+    contents = {}
+    for cue in timeline.scenes:
+        contents.setdefault(cue.index, []).append(cue.text)
 
-    # Step 1: Generate prompts for all subtitles
     prompts = []
-    for sub in subtitles:
-        index = sub['index']
-        content = sub['content']
+    for index, scene_contents in contents.items():
+        content = " ".join(scene_contents)
 
         # Generate image prompt using Mistral model
-        prompt = generate_prompt(content, transcriber_chain)
+        prompt = await asyncio.to_thread(generate_prompt, content, get_transcriber_chain())
         print(f"Subtitle {index}: {content}")
         print(f"Generated Prompt: {prompt}\n")
 
@@ -322,7 +411,21 @@ async def generate_images():
 
 
 @app.get("/generate_video")
-async def generate_video():
+async def generate_video(http_request: Request, profile: str = DEFAULT_PROFILE, formats: str = ""):
+    if profile not in RENDER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render profile: {profile}. Choose one of {sorted(RENDER_PROFILES)}.",
+        )
+    # Comma-separated aspect ratios, e.g. "9:16,1:1,16:9", rendered in one pass
+    format_names = [name.strip() for name in formats.split(",") if name.strip()]
+    unknown = [name for name in format_names if name not in OUTPUT_FORMATS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown output formats: {unknown}. Choose from {sorted(OUTPUT_FORMATS)}.",
+        )
+
     input_folder = "results/images"
     output_folder = "results/resized_images"
     target_size = (1080, 1920)
@@ -331,18 +434,279 @@ async def generate_video():
     image_srt_path = "results/output_images.srt"
     output_path = "results/output_video.mp4"
 
-    video_creator = VideoCreator(
-        input_folder,
-        output_folder,
-        target_size,
-        audio_path,
-        srt_path,
+    creator_args = (input_folder, output_folder, target_size, audio_path, srt_path, image_srt_path, output_path)
+    creator_kwargs = {"segments": PER_SCENE, "profile": profile, "timeline_path": "results/timeline.json"}
+    method, method_args = ("render_formats", (format_names,)) if format_names else ("render_video", ())
+
+    # Rendered in the render pool, so other endpoints stay responsive meanwhile
+    try:
+        outputs = await render_pool.run(
+            render_reel, creator_args, creator_kwargs, method, method_args,
+            description=f"generate_video {profile} {formats}".strip(), request=http_request,
+        )
+    except RenderPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except RenderCancelled as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # results/ is rewritten by the next video; serve this one from the artifact store
+    paths = list(outputs.values()) if format_names else [output_path]
+    stored = await asyncio.to_thread(artifact_store.record, LEGACY_VIDEO_JOB, paths, adopt=False)
+    urls = {name: artifact_url(blob) for name, blob in stored.items()}
+
+    if format_names:
+        return {
+            "message": "Videos generated successfully.",
+            "profile": profile,
+            "outputs": outputs,
+            "urls": {name: urls[os.path.basename(path)] for name, path in outputs.items()},
+        }
+    return {"message": "Video generated successfully.", "profile": profile, "url": urls[os.path.basename(output_path)]}
+
+
+# Regenerate the image of one scene and re-encode only that part of the reel
+@app.post("/regenerate_scene")
+async def regenerate_scene(request: SceneRequest, http_request: Request, profile: str = DEFAULT_PROFILE):
+    if profile not in RENDER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render profile: {profile}. Choose one of {sorted(RENDER_PROFILES)}.",
+        )
+    image_srt_path = "results/output_images.srt"
+    if not os.path.exists(image_srt_path):
+        raise HTTPException(
+            status_code=404,
+            detail="Subtitles not found. Please transcribe the content first."
+        )
+
+    # Scenes sharing the image all repeat its index
+    timeline = load_timeline("results/timeline.json", "results/output_subtitles.srt", image_srt_path)
+    contents = [cue.text for cue in timeline.scenes if cue.index == request.index]
+    if not contents:
+        raise HTTPException(status_code=404, detail=f"Scene {request.index} not found.")
+
+    # An explicit prompt replaces the generated one, e.g. to fix a bad image
+    prompt = request.prompt or await asyncio.to_thread(generate_prompt, " ".join(contents), get_transcriber_chain())
+    async with aiohttp.ClientSession() as session:
+        image_path = await generate_image(request.index, prompt, session, overwrite=True)
+    if image_path is None:
+        raise HTTPException(status_code=502, detail=f"Image generation failed for scene {request.index}.")
+
+    creator_args = (
+        "results/images",
+        "results/resized_images",
+        (1080, 1920),
+        "results/output.mp3",
+        "results/output_subtitles.srt",
         image_srt_path,
-        output_path,
+        "results/output_video.mp4",
     )
-    video_creator.render_video()
+    creator_kwargs = {"segments": PER_SCENE, "profile": profile, "timeline_path": "results/timeline.json"}
+    try:
+        segments = await render_pool.run(
+            render_reel, creator_args, creator_kwargs, "rerender_scene", (request.index,),
+            description=f"regenerate_scene {request.index}", request=http_request,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RenderPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except RenderCancelled as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {"message": "Scene regenerated successfully.", "index": request.index, "prompt": prompt, "segments": segments}
+
+
+# Run search -> summarize -> TTS -> scene planning -> prompts -> images -> render
+# in one call. Unchanged stages are skipped and a failed job resumes when posted again.
+@app.post("/reels")
+async def create_reel(request: ReelRequest):
+    if request.profile not in RENDER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render profile: {request.profile}. Choose one of {sorted(RENDER_PROFILES)}.",
+        )
+    job = ReelJob(request.topic, request.title, request.topic_index, request.profile)
+    try:
+        outputs, stages = await run_reel(job)
+    except PipelineError as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": str(e),
+                "job_id": job.job_id,
+                "failed_stage": e.stage,
+                "stages": e.timings,
+            },
+        )
+
+    return {
+        "message": "Reel generated successfully.",
+        "job_id": job.job_id,
+        "trace_id": job.job_id,
+        "title": outputs["tts"]["title"],
+        "video": outputs["render"]["files"][0],
+        "video_url": media_url(job.job_id, os.path.basename(outputs["render"]["files"][0])),
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages), 3),
+    }
+
+
+# Start reels for all (or some) topics of an article; poll GET /reels/batch/{batch_id}
+@app.post("/reels/batch")
+async def create_reel_batch(request: ReelBatchRequest):
+    if request.profile not in RENDER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render profile: {request.profile}. Choose one of {sorted(RENDER_PROFILES)}.",
+        )
+    summaries = [summary.model_dump() for summary in request.summaries] if request.summaries else None
+    batch = ReelBatch(request.topic, request.title, request.topic_indices, request.profile, summaries=summaries)
+    running = batches.get(batch.batch_id)
+    if running is not None and running.active:
+        return running.summary()
+    # Reels of one topic share a job directory, whatever the profile or summaries
+    for other in batches.values():
+        if other.active and other.overlaps(batch):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Reel batch {other.batch_id} is making reels of the same topics with other settings; try again when it is done.",
+            )
+
+    batches.pop(batch.batch_id, None)
+    batches[batch.batch_id] = batch
+    finished = [batch_id for batch_id, old in batches.items() if not old.active]
+    for batch_id in finished[:max(0, len(finished) - BATCH_HISTORY)]:
+        del batches[batch_id]
+    # Keep a reference to the task so it is not garbage collected while it runs
+    batch.task = asyncio.create_task(batch.run())
+    return batch.summary()
+
+
+@app.get("/reels/batch/{batch_id}")
+async def get_reel_batch(batch_id: str):
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No reel batch with id {batch_id}.")
+    return batch.summary()
+
+
+# Render pool load and recent renders
+@app.get("/renders")
+async def list_renders():
+    return render_pool.status()
+
+
+@app.delete("/renders/{job_id}")
+async def cancel_render(job_id: str):
+    if not render_pool.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"No running render with id {job_id}.")
+    return {"message": "Render cancelled.", "job_id": job_id}
+
+
+# Latency histograms, in-flight gauges, error counters, cache hit ratios and bytes moved
+@app.get("/metrics")
+async def get_metrics():
+    render_pool.status()  # refreshes the render job gauges
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# Spans of one request or reel job (the trace id of /reels is its job id)
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = spans(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail=f"No recent spans for trace {trace_id}.")
+    return {"trace_id": trace_id, "spans": trace}
+
+
+# Generated audio and video, streamed with Range requests and ETags so players can seek
+class ArtifactResponse(FileResponse):
+    """
+    FileResponse for a blob of the artifact store. The ETag is the blob's
+    content digest, which If-Range is checked against as well.
+
+    Uvicorn has no sendfile extension, so the file is sent in chunks; larger
+    chunks cut the per-chunk overhead for videos of tens of megabytes.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path, etag, cache_control):
+        super().__init__(path, headers={"ETag": etag, "Cache-Control": cache_control})
+        self.etag = etag
+
+    def _should_use_range(self, http_if_range, stat_result):
+        return http_if_range == self.etag
+
+
+def artifact_url(blob):
+    return f"/artifacts/{blob}"
+
+
+def media_url(job_id, name):
+    return f"/media/{job_id}/{name}"
+
+
+def serve_artifact(request, blob, cache_control):
+    path = artifact_store.blob_path(blob)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Artifact {blob} not found.")
+    etag = f'"{blob.split(".")[0]}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return ArtifactResponse(path, etag, cache_control)
+
+
+# Blobs are named by their content and never change, so clients may cache them indefinitely
+@app.api_route("/artifacts/{blob}", methods=["GET", "HEAD"])
+async def get_artifact(blob: str, request: Request):
+    if not ARTIFACT_NAME.fullmatch(blob):
+        raise HTTPException(status_code=404, detail=f"Artifact {blob} not found.")
+    return serve_artifact(request, blob, "public, max-age=31536000, immutable")
+
+
+# The current version of a job's artifact, e.g. /media/<reel job id>/output_video.mp4
+@app.api_route("/media/{job_id}/{name:path}", methods=["GET", "HEAD"])
+async def get_media(job_id: str, name: str, request: Request):
+    manifest = artifact_store.load_manifest(job_id) if JOB_ID.fullmatch(job_id) else None
+    entry = (manifest or {}).get("artifacts", {}).get(name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No artifact {name} for job {job_id}.")
+    # Re-running the job can change the artifact; clients revalidate with the ETag
+    return serve_artifact(request, entry["blob"], "no-cache")
+
+
+# Artifact GC task, started with the app
+artifact_gc = None
+# Build the Mistral clients in the background once the app is up, so startup does not wait
+# for them and the first request does not pay for them either
+WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "1") == "1"
+warm_up = None
+
+
+@app.on_event("startup")
+async def start_artifact_gc():
+    global artifact_gc
+    artifact_gc = asyncio.create_task(run_gc_periodically(artifact_store))
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    global warm_up
+    if WARM_UP_CLIENTS:
+        warm_up = asyncio.create_task(asyncio.to_thread(load_clients))
+
+
+@app.on_event("shutdown")
+def shutdown_render_pool():
+    render_pool.shutdown()
+
 
-    return {"message": "Video generated successfully."}
+@app.on_event("shutdown")
+async def stop_artifact_gc():
+    if artifact_gc is not None:
+        artifact_gc.cancel()
 
 
 if __name__ == "__main__":
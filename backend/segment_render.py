@@ -0,0 +1,299 @@
+from dataclasses import asdict
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+import time
+
+from backend.ffmpeg_render import run_ffmpeg
+from backend.metrics import call_collecting, collected, current_trace, merge, observe, stage
+from backend.pipeline import digest
+from backend.profiling import call_profiled, current_profile
+from backend.render_profiles import get_profile
+
+
+def split_timeline(scenes, duration, fps, count):
+    """
+    Choose up to count - 1 cut points at scene starts, as evenly spaced as possible.
+
+    Returns [(first_frame, frame_count), ...] covering every frame of the reel.
+    Cuts are frame indices, so segments tile the timeline exactly.
+    """
+    total = int(round(duration * fps))
+    candidates = sorted({int(round(start * fps)) for start, _, _ in scenes} - {0})
+    candidates = [frame for frame in candidates if frame < total]
+
+    cuts = []
+    for k in range(1, count):
+        if not candidates:
+            break
+        ideal = total * k / count
+        best = min(candidates, key=lambda frame: abs(frame - ideal))
+        candidates.remove(best)
+        cuts.append(best)
+
+    bounds = [0] + sorted(cuts) + [total]
+    return [(first, last - first) for first, last in zip(bounds, bounds[1:]) if last > first]
+
+
+def overlapping(items, start, end):
+    return [item for item in items if item[0] < end and item[1] > start]
+
+
+class RenderCancelled(Exception):
+    """
+    The render's CancelToken was cancelled.
+    """
+
+
+class CancelToken:
+    """
+    Cancellation flag for one render, shared with worker processes.
+
+    Backed by a marker file, so it pickles to any process; encoders check it
+    about once per second of video.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def cancel(self):
+        open(self.path, "w").close()
+
+    @property
+    def cancelled(self):
+        return os.path.exists(self.path)
+
+    def check(self):
+        if self.cancelled:
+            raise RenderCancelled(f"Render cancelled ({os.path.basename(self.path)})")
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def encode_frames(compositor, writer, first_frame, frame_count, fps, cancel=None):
+    """
+    Compose and write frames [first_frame, first_frame + frame_count).
+
+    Time spent composing and encoding is summed over the frames and
+    recorded once per call as the "compose" and "encode" stages.
+    """
+    compose_seconds = encode_seconds = 0.0
+    clock = time.perf_counter
+    for n in range(first_frame, first_frame + frame_count):
+        if cancel is not None and n % fps == 0:
+            cancel.check()
+        start = clock()
+        frame = compositor.make_frame(n / fps)
+        composed = clock()
+        writer.write_frame(frame)
+        compose_seconds += composed - start
+        encode_seconds += clock() - composed
+    observe("compose", compose_seconds)
+    observe("encode", encode_seconds)
+
+
+def open_writer(path, size, profile):
+    """
+    moviepy ffmpeg writer configured from a RenderProfile (video only).
+    """
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+    return FFMPEG_VideoWriter(
+        path, size, profile.fps,
+        codec=profile.codec, preset=profile.preset, threads=profile.threads, ffmpeg_params=profile.ffmpeg_params(),
+    )
+
+
+def render_segment(segment_path, size, profile, first_frame, frame_count, scenes, captions, caption_style, asset_size=None, cancel=None):
+    """
+    Encode frames [first_frame, first_frame + frame_count) of the reel without audio.
+
+    Runs in a worker process. Frame times are absolute, so captions that
+    cross a segment boundary are drawn identically on both sides of it.
+    """
+    # Imported here, in the worker: the web app only needs this module for its cancellation types
+    from backend.compositor import FrameCompositor
+
+    profile = get_profile(profile)
+    fps = profile.fps
+    start = first_frame / fps
+    end = (first_frame + frame_count) / fps
+    compositor = FrameCompositor(
+        size, overlapping(scenes, start, end), overlapping(captions, start, end), caption_style, asset_size=asset_size
+    )
+    # Both are closed even if encoding fails, so no ffmpeg writer outlives the call
+    with stage("render_segment"), closing(compositor), open_writer(segment_path, size, profile) as writer:
+        encode_frames(compositor, writer, first_frame, frame_count, fps, cancel)
+    return segment_path
+
+
+def concat_segments(segment_paths, audio_path, output_path, duration, list_path, cancel=None):
+    """
+    Join encoded segments with the concat demuxer (no re-encode) and mux the audio track.
+    """
+    with open(list_path, "w", encoding="utf-8") as list_file:
+        for segment_path in segment_paths:
+            escaped = os.path.abspath(segment_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", audio_path,
+        "-map", "0:v", "-map", "1:a",
+        "-c", "copy",
+        "-t", f"{duration:.6f}",
+        "-movflags", "+faststart",
+        output_path,
+    ], cancel)
+    return output_path
+
+
+SEGMENT_MANIFEST = "segments.json"
+
+
+class SegmentRenderer:
+    """
+    Render a reel as N segments in parallel worker processes, then join them losslessly.
+
+    The timeline is split at scene boundaries; each worker composes and
+    encodes its own frame range, and the audio is muxed once over the
+    joined video so it stays aligned with every segment.
+
+    Segments and a manifest are kept in segment_dir. Every segment is an
+    independent encode that starts on a keyframe, so a later rerender()
+    can re-encode just the segments covering a changed scene and splice
+    them back in with another stream copy.
+    """
+    def __init__(self, size, segment_dir, segments, profile, max_workers=None, asset_size=None, cancel=None):
+        self.size = tuple(size)
+        self.segment_dir = segment_dir
+        self.segments = segments
+        self.profile = get_profile(profile)
+        self.fps = self.profile.fps
+        self.max_workers = max_workers
+        self.asset_size = asset_size
+        self.cancel = cancel
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.segment_dir, SEGMENT_MANIFEST)
+
+    def timeline_key(self, scenes, captions, caption_style, duration):
+        """
+        What the segments depend on besides image content: output settings,
+        scene frame ranges and the burned-in captions with their style.
+        """
+        return {
+            "size": list(self.size),
+            "profile": self.profile.name,
+            "fps": self.fps,
+            "frames": int(round(duration * self.fps)),
+            "scenes": [[int(round(start * self.fps)), int(round(end * self.fps))] for start, end, _ in scenes],
+            "captions": digest({"captions": captions, "style": asdict(caption_style)}),
+        }
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as json_file:
+                return json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def encode(self, jobs, scenes, captions, caption_style):
+        """
+        Render (segment_path, first_frame, frame_count) jobs on the worker pool.
+        """
+        max_workers = max(1, min(self.max_workers or self.segments, len(jobs)))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Each worker ships back the metrics it recorded for its segment;
+            # profiles (when on) go next to the output, outside the wiped segment_dir
+            profile_dir = os.path.join(os.path.dirname(os.path.abspath(self.segment_dir)), "profiles")
+            futures = [
+                executor.submit(
+                    call_collecting, call_profiled, current_profile.get(),
+                    os.path.splitext(os.path.basename(segment_path))[0], profile_dir,
+                    render_segment, segment_path, self.size, self.profile, first_frame, frame_count,
+                    scenes, captions, caption_style, self.asset_size, self.cancel, trace_id=current_trace.get(),
+                )
+                for segment_path, first_frame, frame_count in jobs
+            ]
+            # Every segment's metrics are merged, failed ones included, before the first error is raised
+            error = None
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    error = error or e
+                metrics = collected(future)
+                if metrics is not None:
+                    merge(metrics)
+            if error is not None:
+                raise error
+
+    def join(self, segment_paths, audio_path, output_path, duration):
+        return concat_segments(
+            segment_paths, audio_path, output_path, duration, os.path.join(self.segment_dir, "segments.txt"), self.cancel
+        )
+
+    def render(self, scenes, captions, caption_style, audio_path, output_path, duration):
+        plan = split_timeline(scenes, duration, self.fps, self.segments)
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        for filename in os.listdir(self.segment_dir):
+            os.unlink(os.path.join(self.segment_dir, filename))
+
+        segment_paths = [
+            os.path.join(self.segment_dir, f"segment_{n:03}.mp4") for n in range(len(plan))
+        ]
+        self.encode(
+            [(path, first_frame, frame_count) for path, (first_frame, frame_count) in zip(segment_paths, plan)],
+            scenes, captions, caption_style,
+        )
+
+        manifest = self.timeline_key(scenes, captions, caption_style, duration)
+        manifest["segments"] = [
+            {"path": os.path.basename(path), "first_frame": first_frame, "frame_count": frame_count}
+            for path, (first_frame, frame_count) in zip(segment_paths, plan)
+        ]
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(manifest, json_file, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+        return self.join(segment_paths, audio_path, output_path, duration)
+
+    def rerender(self, ranges, scenes, captions, caption_style, audio_path, output_path, duration):
+        """
+        Re-encode only the segments overlapping the (start, end) ranges in seconds and splice them into output_path.
+
+        Returns the re-encoded segment file names, or None when the stored
+        segments no longer match the timeline (a full render() is needed).
+        """
+        manifest = self.load_manifest()
+        expected = self.timeline_key(scenes, captions, caption_style, duration)
+        if manifest is None or any(manifest.get(key) != value for key, value in expected.items()):
+            return None
+        segments = manifest["segments"]
+        if not all(os.path.isfile(os.path.join(self.segment_dir, segment["path"])) for segment in segments):
+            return None
+
+        frame_ranges = [(int(round(start * self.fps)), int(round(end * self.fps))) for start, end in ranges]
+        stale = [
+            segment for segment in segments
+            if any(
+                segment["first_frame"] < last and segment["first_frame"] + segment["frame_count"] > first
+                for first, last in frame_ranges
+            )
+        ]
+        # Encode next to the old segments, then swap them in together
+        jobs = [
+            (os.path.join(self.segment_dir, "new_" + segment["path"]), segment["first_frame"], segment["frame_count"])
+            for segment in stale
+        ]
+        self.encode(jobs, scenes, captions, caption_style)
+        for new_path, _, _ in jobs:
+            os.replace(new_path, os.path.join(self.segment_dir, os.path.basename(new_path)[len("new_"):]))
+
+        self.join([os.path.join(self.segment_dir, segment["path"]) for segment in segments], audio_path, output_path, duration)
+        return [segment["path"] for segment in stale]
@@ -1,19 +1,26 @@
 from pydantic import BaseModel, Field
 from typing import List
 import os
-from langchain_mistralai import ChatMistralAI
-from langchain_core.prompts import PromptTemplate
-import srt
-from PIL import Image
+from functools import lru_cache
+from backend.metrics import count_bytes, stage, timed
 from io import BytesIO
 import time
 
 
-llm = ChatMistralAI(
-    model="mistral-large-latest",
-    temperature=0,
-    max_retries=2,
-)
+# Overridable to point at a staging endpoint or a local stand-in
+IMAGE_API_URL = os.getenv("IMAGE_API_URL", "https://a39i6lutw4cmb1ag.us-east-1.aws.endpoints.huggingface.cloud/")
+
+# The Mistral client and chains are built on first use (or by load_clients at app startup):
+# importing langchain_mistralai takes about half a second
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain_mistralai import ChatMistralAI
+
+    return ChatMistralAI(
+        model="mistral-large-latest",
+        temperature=0,
+        max_retries=2,
+    )
 
 class ArticleTopic(BaseModel):
     title: str = Field(
@@ -69,12 +76,7 @@ class ArticleTopics(BaseModel):
         return self.topics[i]
 
 
-llm_structured = llm.with_structured_output(ArticleTopics)
-
-
-prompt_template = PromptTemplate(
-    input_variables=["article"],
-    template="""
+SUMMARY_TEMPLATE = """
 1. **Article Analysis:**
    - Read the provided article carefully:
 
@@ -114,37 +116,28 @@ prompt_template = PromptTemplate(
 - **Theme Emphasis:** Remember that the content is intended for social media educational platforms. It should be engaging, concise, and optimized for platforms like TikTok reels where attention spans are short.
 
 """.strip()
-)
 
-summary_chain = prompt_template | llm_structured
 
+@lru_cache(maxsize=None)
+def get_summary_chain():
+    from langchain_core.prompts import PromptTemplate
+
+    prompt_template = PromptTemplate(input_variables=["article"], template=SUMMARY_TEMPLATE)
+    return prompt_template | get_llm().with_structured_output(ArticleTopics)
+
+@timed("mistral.summarize")
 def summarize_article(article: str) -> ArticleTopics:
-    result = summary_chain.invoke(input={"article": article})
+    result = get_summary_chain().invoke(input={"article": article})
     return result
 
+@timed("mistral.query_is_valid")
 def query_is_valid(topic: str) -> bool:
-    response =  llm.invoke(f"Is the query relevant to healthcare? Return True if yes, False otherwise. \n Query: {topic}")
+    response =  get_llm().invoke(f"Is the query relevant to healthcare? Return True if yes, False otherwise. \n Query: {topic}")
     content = response.content.lower()
     return "true" in content or "yes" in content
 
 
-def parse_srt(file_path):
-    """
-    Parse the SRT file and return a list of subtitles.
-    """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        srt_content = file.read()
-    subtitles = list(srt.parse(srt_content))
-    parsed_subtitles = []
-    for sub in subtitles:
-        parsed_subtitles.append({
-            'index': sub.index,
-            'start_time': sub.start,
-            'end_time': sub.end,
-            'content': sub.content.replace('\n', ' ')
-        })
-    return parsed_subtitles
-
+@timed("mistral.prompt")
 def generate_prompt(subtitle_text, llm_chain):
     """
     Generate an image prompt based on the subtitle text using the LLM chain.
@@ -157,6 +150,8 @@ def load_mistral_chain():
     """
     Load the Mistral LLM chain with the specified prompt template.
     """
+    from langchain_core.prompts import PromptTemplate
+
     # Define the prompt template
     prompt_template = PromptTemplate(
         input_variables=["subtitle"],
@@ -172,16 +167,29 @@ Image Prompt:
     )
 
     # Create the LLM chain
-    llm_chain = prompt_template | llm
+    llm_chain = prompt_template | get_llm()
     return llm_chain
 
-transcriber_chain = load_mistral_chain()
+# The image prompt chain, shared by every request
+@lru_cache(maxsize=None)
+def get_transcriber_chain():
+    return load_mistral_chain()
+
+def load_clients():
+    """
+    Build the Mistral client and chains now rather than on the first request.
+    """
+    get_summary_chain()
+    get_transcriber_chain()
 
-async def generate_image(index, prompt, session):
+async def generate_image(index, prompt, session, overwrite=False, image_dir='results/images/'):
     """
-    Generate an image using the Hugging Face API asynchronously and save it to the results/image/ folder.
+    Generate an image using the Hugging Face API asynchronously and save it to the results/image/ folder
+    (or image_dir).
+
+    With overwrite, an existing image for the index is replaced (used when a
+    single scene is regenerated). Returns the saved path, or None on failure.
     """
-    API_URL = "https://a39i6lutw4cmb1ag.us-east-1.aws.endpoints.huggingface.cloud/"
     headers = {
         "Accept": "image/png",
         "Content-Type": "application/json",
@@ -190,9 +198,12 @@ async def generate_image(index, prompt, session):
     }
 
     async def query(payload):
-        async with session.post(API_URL, headers=headers, json=payload) as response:
-            response.raise_for_status()
-            return await response.read()
+        with stage("image_api"):
+            async with session.post(IMAGE_API_URL, headers=headers, json=payload) as response:
+                response.raise_for_status()
+                content = await response.read()
+        count_bytes("image_api", len(content))
+        return content
 
     try:
         payload = {
@@ -202,11 +213,12 @@ async def generate_image(index, prompt, session):
 
         output = await query(payload)
 
+        from PIL import Image
+
         # Open the image from bytes
         image = Image.open(BytesIO(output))
 
         # Ensure the results directory exists
-        image_dir = 'results/images/'
         os.makedirs(image_dir, exist_ok=True)
 
         # Generate a filename with index
@@ -214,25 +226,29 @@ async def generate_image(index, prompt, session):
         image_path = os.path.join(image_dir, image_filename)
 
         # Check if the file exists
-        if os.path.exists(image_path):
+        if os.path.exists(image_path) and not overwrite:
             # Append a timestamp to make it unique
             timestamp = int(time.time())
             image_filename = f"{index}{timestamp}.png"
             image_path = os.path.join(image_dir, image_filename)
 
-        # Save the image
-        image.save(image_path)
+        # Save the image; written aside first so a replaced scene is never half-written
+        tmp_path = image_path + ".tmp"
+        image.save(tmp_path, format="PNG")
+        os.replace(tmp_path, image_path)
         print(f"Image saved to {image_path}\n")
+        return image_path
 
     except Exception as e:
         print(f"Error generating image for subtitle {index}: {e}")
+        return None
 
 if __name__ == "__main__":
     article = """8 Mental Health Trends to Watch in 2022
 """.strip()
     
     print("Summarizing article...")
-    result = summary_chain.invoke(input={"article": article})
+    result = get_summary_chain().invoke(input={"article": article})
 
     for example in result:
         print("===== TITLE =====")
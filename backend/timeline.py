@@ -0,0 +1,289 @@
+from array import array
+from bisect import bisect_right
+from datetime import timedelta
+from html import unescape
+import json
+import os
+
+import srt
+
+# edge_tts word boundaries are in 100 ns ticks
+TICKS_PER_MS = 10_000
+TIMELINE_VERSION = 1
+
+
+class IntervalIndex:
+    """
+    Static index over [start, end) intervals answering "what is active at t".
+
+    Intervals are sorted by start once; a lookup is a bisect plus a short walk
+    back guarded by the running maximum of end times, so mostly disjoint
+    timelines (scenes, captions) cost O(log n) per query.
+    """
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.items = [interval[2] for interval in intervals]
+        self.max_ends = []
+        running = float("-inf")
+        for end in self.ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def __len__(self):
+        return len(self.items)
+
+    def active(self, t):
+        """
+        Positions of the intervals containing t, in start order.
+        """
+        positions = []
+        j = bisect_right(self.starts, t) - 1
+        while j >= 0 and self.max_ends[j] > t:
+            if self.ends[j] > t:
+                positions.append(j)
+            j -= 1
+        positions.reverse()
+        return positions
+
+
+class Cue:
+    """
+    One timed piece of text: a spoken word, a caption or an image scene.
+    """
+    __slots__ = ("index", "start_ms", "end_ms", "text")
+
+    def __init__(self, index, start_ms, end_ms, text):
+        self.index = index
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text = text
+
+    @property
+    def start(self):
+        return self.start_ms / 1000.0
+
+    @property
+    def end(self):
+        return self.end_ms / 1000.0
+
+    @property
+    def duration(self):
+        return (self.end_ms - self.start_ms) / 1000.0
+
+    def __repr__(self):
+        return f"Cue({self.index}, {self.start_ms}, {self.end_ms}, {self.text!r})"
+
+
+class CueTrack:
+    """
+    Cues of one kind, stored column-wise: start/end in integer milliseconds,
+    the cue index (the image number for scenes) and the text.
+    """
+    def __init__(self, starts=(), ends=(), texts=(), indices=None):
+        self.starts = array("q", starts)
+        self.ends = array("q", ends)
+        self.texts = list(texts)
+        self.indices = array("q", range(1, len(self.texts) + 1) if indices is None else indices)
+        if not len(self.starts) == len(self.ends) == len(self.texts) == len(self.indices):
+            raise ValueError("Cue columns must have the same length")
+        self._interval_index = None
+
+    @classmethod
+    def from_cues(cls, cues):
+        """
+        Build a track from Cue objects (or anything with index, start_ms, end_ms and text).
+        """
+        cues = list(cues)
+        return cls(
+            [cue.start_ms for cue in cues],
+            [cue.end_ms for cue in cues],
+            [cue.text for cue in cues],
+            [cue.index for cue in cues],
+        )
+
+    @classmethod
+    def from_srt(cls, srt_path):
+        with open(srt_path, "r", encoding="utf-8") as srt_file:
+            subtitles = list(srt.parse(srt_file.read()))
+        return cls(
+            [sub.start // timedelta(milliseconds=1) for sub in subtitles],
+            [sub.end // timedelta(milliseconds=1) for sub in subtitles],
+            [sub.content.replace("\n", " ") for sub in subtitles],
+            [sub.index for sub in subtitles],
+        )
+
+    def to_srt(self, srt_path):
+        """
+        Write the track as SRT, keeping cue indices (repeated for scenes sharing an image).
+        """
+        subtitles = [
+            srt.Subtitle(cue.index, timedelta(milliseconds=cue.start_ms), timedelta(milliseconds=cue.end_ms), cue.text)
+            for cue in self
+        ]
+        with open(srt_path, "w", encoding="utf-8") as srt_file:
+            srt_file.write(srt.compose(subtitles, reindex=False))
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, position):
+        return Cue(self.indices[position], self.starts[position], self.ends[position], self.texts[position])
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    @property
+    def interval_index(self):
+        if self._interval_index is None:
+            self._interval_index = IntervalIndex(zip(self.starts, self.ends, range(len(self))))
+        return self._interval_index
+
+    def active(self, t):
+        """
+        Cues on screen at t seconds, in start order. O(log n) per lookup.
+        """
+        index = self.interval_index
+        return [self[index.items[j]] for j in index.active(t * 1000.0)]
+
+    def intervals(self):
+        """
+        (start, end, text) in seconds, as FrameCompositor and the renderers take them.
+        """
+        return [(start / 1000.0, end / 1000.0, text) for start, end, text in zip(self.starts, self.ends, self.texts)]
+
+    @property
+    def end_ms(self):
+        return max(self.ends, default=0)
+
+    def to_dict(self):
+        return {
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "indices": self.indices.tolist(),
+            "texts": self.texts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["starts"], data["ends"], data["texts"], data["indices"])
+
+
+def group_words(words, words_per_cue):
+    """
+    Join every words_per_cue words into one cue, from the first word's start to the last word's end.
+    """
+    cues = []
+    for first in range(0, len(words), words_per_cue):
+        last = min(first + words_per_cue, len(words)) - 1
+        cues.append(Cue(
+            len(cues) + 1,
+            words.starts[first],
+            words.ends[last],
+            " ".join(words.texts[first:last + 1]),
+        ))
+    return CueTrack.from_cues(cues)
+
+
+class Timeline:
+    """
+    Timing of one reel: spoken words, captions and image scenes.
+
+    Built once from the TTS word boundaries by Transcriber and saved next to
+    the audio; prompt generation and rendering load it instead of parsing
+    SRT files. The SRT files are still written for other tools, and a
+    Timeline can be rebuilt from them when no saved timeline exists.
+    """
+    __slots__ = ("words", "captions", "scenes")
+
+    def __init__(self, words=None, captions=None, scenes=None):
+        self.words = words if words is not None else CueTrack()
+        self.captions = captions if captions is not None else CueTrack()
+        self.scenes = scenes if scenes is not None else CueTrack()
+
+    @classmethod
+    def from_words(cls, words, text="", scene_planner=None, words_per_caption=2, words_per_scene=15):
+        """
+        words: CueTrack of spoken words. Scenes come from scene_planner when
+        given, otherwise every words_per_scene words get their own image.
+        """
+        captions = group_words(words, words_per_caption)
+        if scene_planner:
+            scenes = CueTrack.from_cues(
+                Cue(scene.image_index, int(round(scene.start * 1000)), int(round(scene.end * 1000)), scene.text)
+                for scene in scene_planner.plan(words.intervals(), text)
+            )
+        else:
+            scenes = group_words(words, words_per_scene)
+        return cls(words, captions, scenes)
+
+    @classmethod
+    def from_submaker(cls, submaker, text="", scene_planner=None):
+        """
+        Timeline from an edge_tts SubMaker filled with word boundaries.
+        """
+        words = CueTrack(
+            [start // TICKS_PER_MS for start, _ in submaker.offset],
+            [end // TICKS_PER_MS for _, end in submaker.offset],
+            [unescape(word) for word in submaker.subs],
+        )
+        return cls.from_words(words, text, scene_planner)
+
+    @classmethod
+    def from_srt(cls, srt_path, image_srt_path):
+        """
+        Timeline of a reel transcribed before timelines were saved (no word track).
+        """
+        return cls(captions=CueTrack.from_srt(srt_path), scenes=CueTrack.from_srt(image_srt_path))
+
+    @property
+    def duration(self):
+        return max(self.words.end_ms, self.captions.end_ms, self.scenes.end_ms) / 1000.0
+
+    def save(self, path):
+        """
+        Write the timeline as compact JSON, atomically.
+        """
+        data = {"version": TIMELINE_VERSION}
+        for name in self.__slots__:
+            data[name] = getattr(self, name).to_dict()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as json_file:
+            json.dump(data, json_file, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as json_file:
+            data = json.load(json_file)
+        if data.get("version") != TIMELINE_VERSION:
+            raise ValueError(f"Unsupported timeline version {data.get('version')!r} in {path}")
+        return cls(*(CueTrack.from_dict(data[name]) for name in cls.__slots__))
+
+
+def load_timeline(timeline_path, srt_path, image_srt_path):
+    """
+    The saved timeline if it is at least as new as the SRT files, otherwise one parsed from them.
+    """
+    if timeline_path and os.path.exists(timeline_path):
+        saved = os.path.getmtime(timeline_path)
+        if all(not os.path.exists(path) or os.path.getmtime(path) <= saved for path in (srt_path, image_srt_path)):
+            return Timeline.load(timeline_path)
+    return Timeline.from_srt(srt_path, image_srt_path)
+
+
+def parse_srt(file_path):
+    """
+    Parse the SRT file and return a list of subtitles.
+    """
+    return [
+        {
+            'index': cue.index,
+            'start_time': timedelta(milliseconds=cue.start_ms),
+            'end_time': timedelta(milliseconds=cue.end_ms),
+            'content': cue.text,
+        }
+        for cue in CueTrack.from_srt(file_path)
+    ]
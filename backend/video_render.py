@@ -1,10 +1,183 @@
-from moviepy.editor import *
-import pysrt
+from concurrent.futures import ProcessPoolExecutor
+import json
 import os
 from PIL import Image
+from backend.artifacts import file_hash
+from backend.captions import CaptionStyle, load_caption
+from backend.compositor import FrameCompositor
+from backend.ffmpeg_render import (
+    OUTPUT_FORMATS,
+    FFmpegRenderer,
+    FFmpegRenderError,
+    MultiFormatRenderer,
+    mux_audio,
+    probe_duration,
+    run_ffmpeg,
+)
+from backend.metrics import count_bytes, count_lookup, stage, timed
+from backend.render_profiles import DEFAULT_PROFILE, PER_SCENE, get_profile
+from backend.segment_render import SegmentRenderer, encode_frames, open_writer
+from backend.timeline import load_timeline
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+RESIZE_MANIFEST = ".resize_manifest.json"
+RENDER_ENGINES = ("moviepy", "ffmpeg")
+AUDIO_CACHE_DIR = os.path.join("results", "audio_cache")
+# Codecs the TTS audio may be transcoded to: ffmpeg arguments and file extension
+AUDIO_CODECS = {
+    "aac": (["-c:a", "aac", "-b:a", "128k"], ".m4a"),
+}
+
+
+def available_cpus():
+    """
+    Number of cores this process may run on (respects CPU affinity/cgroups pinning).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resize_and_crop(input_path, output_path, target_size):
+    """
+    Scale an image to cover target_size and center-crop it.
+    Module level so it can be shipped to worker processes.
+    """
+    with Image.open(input_path) as img:
+        img_ratio = img.width / img.height
+        target_ratio = target_size[0] / target_size[1]
+
+        if target_ratio > img_ratio:
+            scale_factor = target_size[0] / img.width
+            new_size = (target_size[0], int(img.height * scale_factor))
+        else:
+            scale_factor = target_size[1] / img.height
+            new_size = (int(img.width * scale_factor), target_size[1])
+
+        img = img.resize(new_size, Image.LANCZOS)
+
+        left = (img.width - target_size[0]) / 2
+        top = (img.height - target_size[1]) / 2
+        right = (img.width + target_size[0]) / 2
+        bottom = (img.height + target_size[1]) / 2
+
+        img = img.crop((left, top, right, bottom))
+        img.save(output_path)
+    return output_path
+
+
+@timed("resize")
+def resize_images(input_folder, output_folder, target_size, max_workers=None):
+    """
+    Resize every image in input_folder into output_folder.
+
+    Images whose source hash and target size match the manifest entry of an
+    existing output are skipped; the rest are resized on a process pool.
+    Returns the list of output paths that were (re)written.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    manifest_path = os.path.join(output_folder, RESIZE_MANIFEST)
+    try:
+        with open(manifest_path, "r") as json_file:
+            manifest = json.load(json_file)
+    except (OSError, json.JSONDecodeError):
+        manifest = {}
+
+    sources = sorted(
+        filename for filename in os.listdir(input_folder)
+        if filename.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+    # Drop outputs whose source image no longer exists
+    for filename in os.listdir(output_folder):
+        file_path = os.path.join(output_folder, filename)
+        if filename == RESIZE_MANIFEST or filename in sources:
+            continue
+        try:
+            if os.path.isfile(file_path):
+                os.unlink(file_path)
+        except Exception as e:
+            print(f"Error deleting file {file_path}: {e}")
+        manifest.pop(filename, None)
+
+    jobs = []
+    entries = {}
+    for filename in sources:
+        input_path = os.path.join(input_folder, filename)
+        output_path = os.path.join(output_folder, filename)
+        entry = {"source_hash": file_hash(input_path), "target_size": list(target_size)}
+        cached = manifest.get(filename) == entry and os.path.isfile(output_path)
+        count_lookup("resize", cached)
+        if cached:
+            continue
+        jobs.append((input_path, output_path))
+        entries[filename] = entry
+
+    if max_workers is None:
+        max_workers = available_cpus()
+    max_workers = max(1, min(max_workers, len(jobs)))
+
+    written = []
+    if max_workers == 1:
+        for input_path, output_path in jobs:
+            written.append(resize_and_crop(input_path, output_path, target_size))
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(resize_and_crop, input_path, output_path, target_size)
+                for input_path, output_path in jobs
+            ]
+            written = [future.result() for future in futures]
+
+    for output_path in written:
+        print(f"Processed image saved: {output_path}")
+    manifest.update(entries)
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(manifest, json_file, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    return written
+
+
+def prepare_audio(audio_path, codec="copy", cache_dir=AUDIO_CACHE_DIR):
+    """
+    Path of the audio stream to mux into a reel.
+
+    "copy" returns the TTS file itself, so its stream is muxed bit-exact.
+    Other codecs are transcoded once and cached under the source's content
+    hash, so repeated renders of the same audio never re-encode it.
+    """
+    if codec == "copy":
+        return audio_path
+    if codec not in AUDIO_CODECS:
+        raise ValueError(f"Unknown audio codec {codec!r}; expected 'copy' or one of {sorted(AUDIO_CODECS)}")
+    codec_args, extension = AUDIO_CODECS[codec]
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_path = os.path.join(cache_dir, f"{file_hash(audio_path)}.{codec}{extension}")
+    count_lookup("audio", os.path.isfile(cached_path))
+    if not os.path.isfile(cached_path):
+        tmp_path = cached_path + ".tmp" + extension
+        run_ffmpeg(["-i", audio_path, "-vn"] + codec_args + [tmp_path])
+        os.replace(tmp_path, cached_path)
+    return cached_path
+
 
 class VideoCreator:
-    def __init__(self, input_folder, output_folder, target_size, audio_path, srt_path, image_srt_path, output_path):
+    """
+    One reel render session.
+
+    Every clip, writer and compositor the session opens is tracked and
+    closed when the session ends, on success or failure. Use it as a
+    context manager, or rely on render_video() closing it:
+
+        with VideoCreator(...) as video_creator:
+            video_creator.render_video()
+    """
+    def __init__(self, input_folder, output_folder, target_size, audio_path, srt_path, image_srt_path, output_path, max_workers=None, engine="moviepy", segments=1, profile=DEFAULT_PROFILE, audio_codec="copy", timeline_path=None, cancel=None):
+        if engine not in RENDER_ENGINES:
+            raise ValueError(f"Unknown render engine {engine!r}; expected one of {RENDER_ENGINES}")
         self.input_folder = input_folder
         self.output_folder = output_folder
         self.target_size = target_size
@@ -12,154 +185,270 @@ class VideoCreator:
         self.srt_path = srt_path
         self.image_srt_path = image_srt_path
         self.output_path = output_path
-        self.audio = AudioFileClip(audio_path)
+        # Saved by Transcriber; the SRT files are parsed only when it is missing or older
+        self.timeline_path = timeline_path
+        self._timeline = None
+        self.max_workers = max_workers
+        self.engine = engine
+        # segments > 1 renders the timeline in that many worker processes (0: one per core);
+        # PER_SCENE gives every scene its own segment, so rerender_scene() re-encodes one scene only
+        self.segments = segments if segments else available_cpus()
+        # Assets (resized images, caption rasters) are prepared at target_size
+        # for every profile; the profile only sets the encoded size and settings
+        self.profile = get_profile(profile)
+        self.frame_size = self.profile.output_size(target_size)
+        self.caption_style = CaptionStyle.for_frame(target_size)
+        # The audio is never decoded in Python; it is muxed at render time
+        self.audio_codec = audio_codec
+        self._audio_duration = None
+        self._resources = []
+        # CancelToken checked between frames; set when run in the render pool
+        self.cancel = cancel
 
-    def resize_and_crop_image(self, input_path, output_path):
-        with Image.open(input_path) as img:
-            img_ratio = img.width / img.height
-            target_ratio = self.target_size[0] / self.target_size[1]
+    def __enter__(self):
+        return self
 
-            if target_ratio > img_ratio:
-                scale_factor = self.target_size[0] / img.width
-                new_size = (self.target_size[0], int(img.height * scale_factor))
-            else:
-                scale_factor = self.target_size[1] / img.height
-                new_size = (int(img.width * scale_factor), self.target_size[1])
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
 
-            img = img.resize(new_size, Image.LANCZOS)
+    def track(self, resource):
+        """
+        Register a resource with a close() method to be closed with the session.
+        """
+        self._resources.append(resource)
+        return resource
 
-            left = (img.width - self.target_size[0]) / 2
-            top = (img.height - self.target_size[1]) / 2
-            right = (img.width + self.target_size[0]) / 2
-            bottom = (img.height + self.target_size[1]) / 2
+    def close(self):
+        """
+        Close every tracked resource, newest first. Safe to call more than once.
+        """
+        while self._resources:
+            resource = self._resources.pop()
+            try:
+                resource.close()
+            except Exception as e:
+                print(f"Error closing {type(resource).__name__}: {e}")
 
-            img = img.crop((left, top, right, bottom))
-            img.save(output_path)
+    @property
+    def timeline(self):
+        """
+        Caption and scene timing, loaded once per session.
+        """
+        if self._timeline is None:
+            self._timeline = load_timeline(self.timeline_path, self.srt_path, self.image_srt_path)
+        return self._timeline
 
-    def resize_images_in_folder(self):
-        os.makedirs(self.output_folder, exist_ok=True)
+    @property
+    def audio_duration(self):
+        """
+        Length of the TTS audio, read from its header on first use.
+        """
+        if self._audio_duration is None:
+            self._audio_duration = probe_duration(self.audio_path)
+        return self._audio_duration
 
-        # remove files in output folder
-        for filename in os.listdir(self.output_folder):
-            file_path = os.path.join(self.output_folder, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                print(f"Error deleting file: {file_path}")
+    def resize_and_crop_image(self, input_path, output_path):
+        resize_and_crop(input_path, output_path, self.target_size)
 
-        for filename in os.listdir(self.input_folder):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                input_path = os.path.join(self.input_folder, filename)
-                output_path = os.path.join(self.output_folder, filename)
-                self.resize_and_crop_image(input_path, output_path)
-                print(f"Processed image saved: {output_path}")
+    def resize_images_in_folder(self):
+        resize_images(self.input_folder, self.output_folder, self.target_size, self.max_workers)
 
     def srt_to_moviepy_subtitles(self):
-        subs = pysrt.open(self.srt_path)
+        # moviepy.editor pulls in IPython and friends; loaded only on this legacy path
+        from moviepy.editor import CompositeVideoClip, ImageClip, vfx
+
         subtitle_clips = []
-        max_width = self.target_size[0] * 0.8
 
-        for sub in subs:
-            start_time = sub.start.to_time()
-            end_time = sub.end.to_time()
-            start_seconds = (
-                start_time.hour * 3600 + start_time.minute * 60 + start_time.second + start_time.microsecond / 1e6
-            )
-            end_seconds = (
-                end_time.hour * 3600 + end_time.minute * 60 + end_time.second + end_time.microsecond / 1e6
-            )
-            duration = end_seconds - start_seconds
-            formatted_text = sub.text.replace("\n", " ")
-
-            text_clip = TextClip(
-                formatted_text,
-                fontsize=int(self.target_size[1] * 0.05),
-                color='white',
-                stroke_color='orange',
-                bg_color='black',
-                stroke_width=2,
-                size=(max_width, None),
-                method='caption',
-                align='center',
-            )
+        for cue in self.timeline.captions:
+            # Rasterized in-process with Pillow; no ImageMagick subprocess per caption
+            text_clip = self.track(ImageClip(load_caption(cue.text, self.caption_style)))
 
             text_clip = text_clip.set_position(("center", "center"))
-            text_clip = text_clip.set_start(start_seconds)
-            text_clip = text_clip.set_duration(duration)
+            text_clip = text_clip.set_start(cue.start)
+            text_clip = text_clip.set_duration(cue.duration)
             text_clip = text_clip.fx(vfx.fadein, 0.25).fx(vfx.fadeout, 0.25)
 
             subtitle_clips.append(text_clip)
 
-        return CompositeVideoClip(subtitle_clips, size=(self.target_size[0], self.target_size[1]))
+        return self.track(CompositeVideoClip(subtitle_clips, size=(self.target_size[0], self.target_size[1])))
 
-    def parse_image_timings(self):
-        subs = pysrt.open(self.image_srt_path)
-        image_timings = []
-
-        for sub in subs:
-            image_index = sub.index
-            start_time = sub.start.ordinal / 1000.0
-            end_time = sub.end.ordinal / 1000.0
-            duration = end_time - start_time
-            image_timings.append({
-                'image_index': image_index,
-                'start_time': start_time,
-                'end_time': end_time,
-                'duration': duration
-            })
+    def collect_scenes(self, folder=None):
+        """
+        (start, end, image_path) for every scene whose image exists in
+        folder (default: the resized images).
+        """
+        folder = folder or self.output_folder
+        scenes = []
+        for cue in self.timeline.scenes:
+            image_path = os.path.join(folder, f"{cue.index}.png")
+            if not os.path.isfile(image_path):
+                continue
+            scenes.append((cue.start, cue.end, image_path))
+        return scenes
 
-        return image_timings
+    def collect_captions(self):
+        return self.timeline.captions.intervals()
 
     def create_video_with_images_and_subtitles(self):
-        audio_clip = self.audio
-        image_timings = self.parse_image_timings()
-        image_clips = []
+        scenes = self.collect_scenes()
 
-        for timing in image_timings:
-            image_path = os.path.join(self.output_folder, f"{timing['image_index']}.png")
-            if not os.path.isfile(image_path):
-                continue
+        if scenes:
+            captions = self.collect_captions()
+            # Only the clips active at t are blended, instead of moviepy
+            # walking every scene and caption clip for every frame
+            compositor = self.track(FrameCompositor(
+                self.frame_size, scenes, captions, self.caption_style, asset_size=self.target_size
+            ))
 
-            image_clip = ImageClip(image_path)
-            target_aspect_ratio = 9 / 16
-            original_width, original_height = image_clip.size
-            original_aspect_ratio = original_width / original_height
+            # Encode video only, then mux the audio stream without decoding it
+            video_path = os.path.splitext(self.output_path)[0] + ".video.mp4"
+            try:
+                writer = self.track(open_writer(video_path, self.frame_size, self.profile))
+                fps = self.profile.fps
+                encode_frames(compositor, writer, 0, int(round(self.audio_duration * fps)), fps, self.cancel)
+                writer.close()
+                mux_audio(
+                    video_path, prepare_audio(self.audio_path, self.audio_codec), self.output_path, self.audio_duration, self.cancel
+                )
+            finally:
+                self.close()
+                if os.path.exists(video_path):
+                    os.remove(video_path)
 
-            if original_aspect_ratio > target_aspect_ratio:
-                new_width = int(original_height * target_aspect_ratio)
-                new_height = original_height
-            else:
-                new_width = original_width
-                new_height = int(original_width / target_aspect_ratio)
+    def segment_renderer(self, scenes):
+        segment_dir = os.path.splitext(self.output_path)[0] + "_segments"
+        if self.segments == PER_SCENE:
+            segments, max_workers = len(scenes), self.max_workers or available_cpus()
+        else:
+            segments, max_workers = self.segments, self.max_workers
+        return SegmentRenderer(
+            self.frame_size, segment_dir, segments, self.profile,
+            max_workers=max_workers, asset_size=self.target_size, cancel=self.cancel,
+        )
+
+    def create_video_in_segments(self):
+        scenes = self.collect_scenes()
+        if not scenes:
+            return
+        self.segment_renderer(scenes).render(
+            scenes,
+            self.collect_captions(),
+            self.caption_style,
+            prepare_audio(self.audio_path, self.audio_codec),
+            self.output_path,
+            self.audio_duration,
+        )
+
+    def rerender_scene(self, image_index):
+        """
+        Update the reel after the image of one scene was regenerated.
+
+        Only the segments covering that scene are composed and encoded again;
+        the rest of the reel is stream-copied from the previous render. If
+        that render's segments do not match the current timeline or settings,
+        the whole reel is rendered in segments instead.
 
-            x_center = original_width / 2
-            y_center = original_height / 2
-            image_clip = image_clip.crop(width=new_width, height=new_height, x_center=x_center, y_center=y_center)
-            image_clip = image_clip.set_duration(timing['duration'])
-            image_clip = image_clip.set_start(timing['start_time'])
-            image_clip = image_clip.crossfadein(0.1).crossfadeout(0.1)
+        Returns the names of the segments that were encoded.
+        """
+        with self:
+            self.resize_images_in_folder()
+            self.check_cancelled()
+            scenes = self.collect_scenes()
+            image_path = os.path.join(self.output_folder, f"{image_index}.png")
+            # Every scene showing the image, as planned scenes may share one
+            ranges = [(start, end) for start, end, path in scenes if path == image_path]
+            if not ranges:
+                raise ValueError(f"No scene with image {image_index} in the timeline")
 
-            image_clips.append(image_clip)
+            renderer = self.segment_renderer(scenes)
+            args = (
+                scenes,
+                self.collect_captions(),
+                self.caption_style,
+                prepare_audio(self.audio_path, self.audio_codec),
+                self.output_path,
+                self.audio_duration,
+            )
+            rerendered = renderer.rerender(ranges, *args)
+            if rerendered is None:
+                print("Previous segments do not match the reel, rendering all of them")
+                renderer.render(*args)
+                rerendered = [segment["path"] for segment in renderer.load_manifest()["segments"]]
+            return rerendered
+
+    def create_video_with_ffmpeg(self):
+        scenes = self.collect_scenes()
+        if not scenes:
+            return
+        renderer = FFmpegRenderer(self.frame_size, self.profile, asset_size=self.target_size, cancel=self.cancel)
+        renderer.render(
+            scenes,
+            self.collect_captions(),
+            self.caption_style,
+            prepare_audio(self.audio_path, self.audio_codec),
+            self.output_path,
+            duration=self.audio_duration,
+        )
 
-        if image_clips:
-            first_clip = image_clips[0]
-            video_size = (first_clip.w, first_clip.h)
+    def format_output_path(self, name):
+        base, extension = os.path.splitext(self.output_path)
+        return f"{base}_{name.replace(':', 'x')}{extension}"
 
-            video_clip = CompositeVideoClip(image_clips, size=video_size)
-            video_clip = video_clip.set_audio(audio_clip)
-            
+    def render_formats(self, formats=tuple(OUTPUT_FORMATS)):
+        """
+        Render the reel to several aspect ratios in one ffmpeg pass.
 
-            subtitles = self.srt_to_moviepy_subtitles()
-            final_video = CompositeVideoClip([video_clip, subtitles])
-            final_video = final_video.set_duration(audio_clip.duration)
+        Returns {format name: output path}. The original images are used,
+        since the resized ones are already cropped to target_size's aspect.
+        """
+        unknown = [name for name in formats if name not in OUTPUT_FORMATS]
+        if unknown:
+            raise ValueError(f"Unknown output formats {unknown}; expected some of {sorted(OUTPUT_FORMATS)}")
+        output_paths = {name: self.format_output_path(name) for name in formats}
 
-            # final_video.write_videofile(self.output_path, fps=24, codec='mpeg4')
-            final_video.write_videofile(self.output_path, fps=24, codec='libx264')
+        with self:
+            self.check_cancelled()
+            scenes = self.collect_scenes(self.input_folder)
+            if not scenes:
+                return {}
+            renderer = MultiFormatRenderer(
+                [self.profile.output_size(OUTPUT_FORMATS[name]) for name in formats], self.profile, cancel=self.cancel
+            )
+            renderer.render(
+                scenes,
+                self.collect_captions(),
+                self.caption_style,
+                prepare_audio(self.audio_path, self.audio_codec),
+                list(output_paths.values()),
+                duration=self.audio_duration,
+            )
+        return output_paths
+
+    def check_cancelled(self):
+        if self.cancel is not None:
+            self.cancel.check()
 
     def render_video(self):
-        self.resize_images_in_folder()
-        self.create_video_with_images_and_subtitles()
+        with self, stage("render_video"):
+            self.resize_images_in_folder()
+            self.check_cancelled()
+            if self.engine == "ffmpeg":
+                try:
+                    self.create_video_with_ffmpeg()
+                    self.count_output()
+                    return
+                except (FFmpegRenderError, OSError) as e:
+                    print(f"ffmpeg engine failed, falling back to moviepy: {e}")
+            if self.segments == PER_SCENE or self.segments > 1:
+                self.create_video_in_segments()
+            else:
+                self.create_video_with_images_and_subtitles()
+            self.count_output()
+
+    def count_output(self):
+        if os.path.isfile(self.output_path):
+            count_bytes("render_video", os.path.getsize(self.output_path), "out")
 
 if __name__ == "__main__":
     input_folder = 'results/images'
@@ -170,5 +459,5 @@ if __name__ == "__main__":
     image_srt_path = "output_images.srt"
     output_path = "output_video.mp4"
 
-    video_creator = VideoCreator(input_folder, output_folder, target_size, audio_path, srt_path, image_srt_path, output_path)
-    video_creator.render_video()
\ No newline at end of file
+    with VideoCreator(input_folder, output_folder, target_size, audio_path, srt_path, image_srt_path, output_path) as video_creator:
+        video_creator.render_video()
\ No newline at end of file
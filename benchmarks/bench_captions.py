@@ -0,0 +1,105 @@
+"""
+Compare caption rendering with ImageMagick TextClips against the Pillow rasterizer.
+
+Reports wall time and the number of child processes spawned for a reel's
+worth of 2-word captions. The ImageMagick run is skipped if it is not installed.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_captions --captions 80
+"""
+import argparse
+import itertools
+import subprocess
+import time
+
+from backend.captions import CaptionStyle, caption_cache_info, render_caption
+
+WORDS = (
+    "early screening helps doctors find colorectal cancer before symptoms appear "
+    "and a simple blood test may make that easier for many people"
+).split()
+
+
+class PopenCounter:
+    """
+    Count subprocess.Popen calls made while active.
+    """
+    def __init__(self):
+        self.count = 0
+        self._original = subprocess.Popen.__init__
+
+    def __enter__(self):
+        counter = self
+        original = self._original
+
+        def counting_init(popen, *args, **kwargs):
+            counter.count += 1
+            original(popen, *args, **kwargs)
+
+        subprocess.Popen.__init__ = counting_init
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.Popen.__init__ = self._original
+
+
+def caption_texts(count):
+    words = itertools.cycle(WORDS)
+    return [f"{next(words)} {next(words)}" for _ in range(count)]
+
+
+def bench_textclip(texts, frame_size):
+    from moviepy.editor import TextClip
+
+    with PopenCounter() as counter:
+        start = time.perf_counter()
+        for text in texts:
+            TextClip(
+                text,
+                fontsize=int(frame_size[1] * 0.05),
+                color='white',
+                stroke_color='orange',
+                bg_color='black',
+                stroke_width=2,
+                size=(frame_size[0] * 0.8, None),
+                method='caption',
+                align='center',
+            )
+        elapsed = time.perf_counter() - start
+    return elapsed, counter.count
+
+
+def bench_pillow(texts, frame_size):
+    style = CaptionStyle.for_frame(frame_size)
+    render_caption.cache_clear()
+    with PopenCounter() as counter:
+        start = time.perf_counter()
+        for text in texts:
+            render_caption(text, style)
+        elapsed = time.perf_counter() - start
+    return elapsed, counter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--captions", type=int, default=80, help="number of 2-word captions (~60s reel)")
+    parser.add_argument("--frame-size", type=int, nargs=2, default=[1080, 1920])
+    args = parser.parse_args()
+
+    texts = caption_texts(args.captions)
+    frame_size = tuple(args.frame_size)
+
+    print(f"{'renderer':<12} {'captions':>8} {'seconds':>8} {'ms/caption':>10} {'processes':>9}")
+    try:
+        elapsed, processes = bench_textclip(texts, frame_size)
+        print(f"{'imagemagick':<12} {len(texts):>8} {elapsed:>8.2f} {1000 * elapsed / len(texts):>10.2f} {processes:>9}")
+    except Exception as e:
+        print(f"{'imagemagick':<12} unavailable: {str(e).splitlines()[0]}")
+
+    elapsed, processes = bench_pillow(texts, frame_size)
+    print(f"{'pillow':<12} {len(texts):>8} {elapsed:>8.2f} {1000 * elapsed / len(texts):>10.2f} {processes:>9}")
+    print(f"cache: {caption_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
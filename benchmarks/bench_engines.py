@@ -0,0 +1,78 @@
+"""
+Benchmark the moviepy and ffmpeg render engines on the same inputs.
+
+Reports wall time plus CPU time spent in Python and in child processes
+(the ffmpeg encoder/reader subprocesses).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_engines --duration 60 --size 1080 1920
+"""
+import argparse
+import contextlib
+import io
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from backend.video_render import VideoCreator
+from benchmarks.fixtures import make_reel_fixture
+
+
+def cpu_times():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def bench_engine(paths, size, engine):
+    creator = VideoCreator(
+        paths["input_folder"],
+        paths["output_folder"],
+        size,
+        paths["audio_path"],
+        paths["srt_path"],
+        paths["image_srt_path"],
+        paths["output_path"].replace(".mp4", f"_{engine}.mp4"),
+        engine=engine,
+    )
+    # Resize once up front so only composition and encoding are timed
+    with contextlib.redirect_stdout(io.StringIO()):
+        creator.resize_images_in_folder()
+    own_before, children_before = cpu_times()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        if engine == "ffmpeg":
+            creator.create_video_with_ffmpeg()
+        else:
+            creator.create_video_with_images_and_subtitles()
+    elapsed = time.perf_counter() - start
+    own_after, children_after = cpu_times()
+    return elapsed, own_after - own_before, children_after - children_before, os.path.getsize(creator.output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--size", type=int, nargs=2, default=[1080, 1920])
+    parser.add_argument("--engines", nargs="+", default=["moviepy", "ffmpeg"])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_engines_")
+    try:
+        paths = make_reel_fixture(workdir, args.duration)
+        print(f"duration={args.duration}s size={tuple(args.size)}")
+        print(f"{'engine':<8} {'wall s':>8} {'python cpu s':>12} {'child cpu s':>11} {'x realtime':>10} {'MB':>6}")
+        for engine in args.engines:
+            elapsed, own, children, size = bench_engine(paths, tuple(args.size), engine)
+            print(
+                f"{engine:<8} {elapsed:>8.2f} {own:>12.2f} {children:>11.2f} "
+                f"{args.duration / elapsed:>10.2f} {size / 1e6:>6.2f}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
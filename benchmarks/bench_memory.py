@@ -0,0 +1,93 @@
+"""
+Peak RSS of a render for reels of different durations.
+
+Each duration is rendered in a fresh interpreter so ru_maxrss is the peak
+of that render alone. With the streaming frame source the peak should be
+roughly the same for every duration.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_memory --durations 30 60 180
+"""
+import argparse
+import contextlib
+import io
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from backend.video_render import VideoCreator
+from benchmarks.fixtures import make_reel_fixture
+
+
+def render_once(duration, size, profile, engine):
+    """
+    Render one fixture reel in this process and return its measurements.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench_memory_")
+    try:
+        paths = make_reel_fixture(workdir, duration)
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            with VideoCreator(
+                paths["input_folder"],
+                paths["output_folder"],
+                size,
+                paths["audio_path"],
+                paths["srt_path"],
+                paths["image_srt_path"],
+                paths["output_path"],
+                engine=engine,
+                profile=profile,
+            ) as video_creator:
+                video_creator.render_video()
+        elapsed = time.perf_counter() - start
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "duration": duration,
+        "seconds": elapsed,
+        "baseline_rss_mb": baseline_kb / 1024,
+        "peak_rss_mb": peak_kb / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[30, 60, 180])
+    parser.add_argument("--size", type=int, nargs=2, default=[1080, 1920])
+    parser.add_argument("--profile", default="final")
+    parser.add_argument("--engine", default="moviepy")
+    parser.add_argument("--child", type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(render_once(args.child, tuple(args.size), args.profile, args.engine)))
+        return
+
+    print(f"size={tuple(args.size)} profile={args.profile} engine={args.engine}")
+    print(f"{'duration s':>10} {'render s':>9} {'baseline MB':>11} {'peak RSS MB':>11}")
+    for duration in args.durations:
+        output = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.bench_memory", "--child", str(duration),
+                "--size", *map(str, args.size), "--profile", args.profile, "--engine", args.engine,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{result['duration']:>10.0f} {result['seconds']:>9.2f} "
+            f"{result['baseline_rss_mb']:>11.1f} {result['peak_rss_mb']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
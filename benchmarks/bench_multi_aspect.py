@@ -0,0 +1,70 @@
+"""
+Benchmark one multi-aspect render against sequential single-format renders.
+
+Both sides use the ffmpeg engine on the same fixture; the sequential side
+renders each format with its own VideoCreator (target_size = that format).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_multi_aspect --duration 60 --profile final
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from backend.ffmpeg_render import OUTPUT_FORMATS
+from backend.video_render import VideoCreator
+from benchmarks.fixtures import make_reel_fixture
+
+
+def creator(paths, target_size, output_path, profile):
+    return VideoCreator(
+        paths["input_folder"],
+        paths["output_folder"] + f"_{target_size[0]}x{target_size[1]}",
+        target_size,
+        paths["audio_path"],
+        paths["srt_path"],
+        paths["image_srt_path"],
+        output_path,
+        engine="ffmpeg",
+        profile=profile,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--profile", default="final")
+    parser.add_argument("--formats", nargs="+", default=list(OUTPUT_FORMATS))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_multi_aspect_")
+    try:
+        paths = make_reel_fixture(workdir, args.duration)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for name in args.formats:
+                output_path = os.path.join(workdir, f"single_{name.replace(':', 'x')}.mp4")
+                with creator(paths, OUTPUT_FORMATS[name], output_path, args.profile) as video_creator:
+                    video_creator.render_video()
+            sequential_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with creator(paths, OUTPUT_FORMATS["9:16"], os.path.join(workdir, "multi.mp4"), args.profile) as video_creator:
+                outputs = video_creator.render_formats(args.formats)
+            multi_s = time.perf_counter() - start
+
+        print(f"duration={args.duration}s profile={args.profile} formats={args.formats}")
+        print(f"{'mode':<12} {'wall s':>8}")
+        print(f"{'sequential':<12} {sequential_s:>8.2f}")
+        print(f"{'one pass':<12} {multi_s:>8.2f}")
+        print(f"speedup: {sequential_s / multi_s:.2f}x ({len(outputs)} outputs)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark serial vs parallel image resizing.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_resize --counts 10 25 50
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+from backend.video_render import available_cpus, resize_images
+
+
+def make_images(folder, count, size):
+    """
+    Write `count` noise PNGs of the given size, similar to the generator output.
+    """
+    os.makedirs(folder, exist_ok=True)
+    for index in range(1, count + 1):
+        Image.effect_noise(size, 64).convert("RGB").save(os.path.join(folder, f"{index}.png"))
+
+
+def timed_resize(input_folder, output_folder, target_size, max_workers):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        written = resize_images(input_folder, output_folder, target_size, max_workers)
+    return time.perf_counter() - start, len(written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 25, 50])
+    parser.add_argument("--source-size", type=int, nargs=2, default=[1024, 1024])
+    parser.add_argument("--target-size", type=int, nargs=2, default=[1080, 1920])
+    parser.add_argument("--workers", type=int, default=None, help="parallel pool size (default: available cores)")
+    args = parser.parse_args()
+
+    target_size = tuple(args.target_size)
+    print(f"cores={available_cpus()} source={tuple(args.source_size)} target={target_size}")
+    print(f"{'images':>6} {'serial s':>9} {'img/s':>7} {'parallel s':>10} {'img/s':>7} {'speedup':>7} {'incremental s':>13}")
+
+    for count in args.counts:
+        workdir = tempfile.mkdtemp(prefix="bench_resize_")
+        try:
+            input_folder = os.path.join(workdir, "images")
+            make_images(input_folder, count, tuple(args.source_size))
+
+            serial_s, _ = timed_resize(input_folder, os.path.join(workdir, "serial"), target_size, 1)
+            parallel_s, _ = timed_resize(input_folder, os.path.join(workdir, "parallel"), target_size, args.workers)
+            # Second pass over unchanged inputs only hashes and skips
+            incremental_s, rewritten = timed_resize(input_folder, os.path.join(workdir, "parallel"), target_size, args.workers)
+            assert rewritten == 0, f"incremental pass rewrote {rewritten} images"
+
+            print(
+                f"{count:>6} {serial_s:>9.2f} {count / serial_s:>7.1f} {parallel_s:>10.2f} "
+                f"{count / parallel_s:>7.1f} {serial_s / parallel_s:>6.2f}x {incremental_s:>13.3f}"
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare image calls per reel: fixed 15-word scenes vs the scene planner.
+
+Word timings are synthesized at a steady speaking rate from the sample
+podcast script; punctuation is stripped from them as in TTS word boundaries.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_scene_plan --durations 60 180 600
+"""
+import argparse
+import statistics
+import time
+
+from backend.scene_planner import ScenePlanner
+
+from benchmarks.fixtures import WORDS_PER_SECOND, script_words
+
+LEGACY_WORDS_PER_SCENE = 15
+
+
+def spoken_words(count):
+    words = script_words()[:count]
+    step = 1.0 / WORDS_PER_SECOND
+    boundaries = []
+    for n, word in enumerate(words):
+        bare = word.strip(".,!?;:\"()[]")
+        if bare:
+            boundaries.append((n * step, n * step + step * 0.9, bare))
+    return boundaries, " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60.0, 180.0, 600.0])
+    parser.add_argument("--min-duration", type=float, default=ScenePlanner().min_duration)
+    parser.add_argument("--max-duration", type=float, default=ScenePlanner().max_duration)
+    args = parser.parse_args()
+
+    planner = ScenePlanner(min_duration=args.min_duration, max_duration=args.max_duration)
+    print(f"min={planner.min_duration}s max={planner.max_duration}s rate={WORDS_PER_SECOND} words/s")
+    print(f"{'reel s':>7} {'fixed imgs':>10} {'planned scenes':>14} {'imgs':>5} {'saved':>6} {'median s':>8} {'max s':>6} {'plan ms':>7}")
+
+    for duration in args.durations:
+        words, text = spoken_words(int(duration * WORDS_PER_SECOND))
+        legacy = -(-len(words) // LEGACY_WORDS_PER_SCENE)
+
+        start = time.perf_counter()
+        scenes = planner.plan(words, text)
+        plan_ms = (time.perf_counter() - start) * 1000
+
+        images = len({scene.image_index for scene in scenes})
+        durations = [scene.duration for scene in scenes]
+        print(
+            f"{duration:>7.0f} {legacy:>10} {len(scenes):>14} {images:>5} {1 - images / legacy:>6.0%}"
+            f" {statistics.median(durations):>8.1f} {max(durations):>6.1f} {plan_ms:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Stage-level benchmark of the reel backend, offline.
+
+Search, summarization, TTS, scene planning, prompt and image scheduling
+run against local stand-ins for Tavily, Mistral, edge-tts and the image
+endpoint (benchmarks/fakes.py) answering after --latency seconds; resize,
+caption rendering, compose and encode run on a synthetic reel. Inputs come
+from the sample script in podcast_res/podcast_script.json, so runs are
+repeatable. Results are written as JSON; with --baseline, the run fails
+(exit status 1) when a stage's median regressed by more than --threshold.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_stages --output bench.json
+    python -m benchmarks.bench_stages --baseline bench.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import FakeServices
+from benchmarks.fixtures import make_reel_fixture
+
+SERVICE_STAGES = ("search", "summarize", "tts", "plan", "prompts", "images")
+RENDER_STAGES = ("resize", "caption_render", "compose", "encode")
+STAGES = SERVICE_STAGES + RENDER_STAGES
+
+
+def run_stage(fn, *args):
+    """
+    Run a (possibly async) stage quietly and return (seconds, result).
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(fn(*args)) if asyncio.iscoroutinefunction(fn) else fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_services(stages, workdir):
+    """
+    One pass of search -> summarize -> tts -> plan -> prompts -> images in a fresh job directory.
+    Stages not selected still run when a later one needs their output, but are not reported.
+    """
+    from backend import reels
+
+    job = reels.ReelJob("health", reels_dir=workdir)
+    os.makedirs(job.job_dir, exist_ok=True)
+    chain = [
+        ("search", reels.search_stage, ()),
+        ("summarize", reels.summarize_stage, ("search",)),
+        ("tts", reels.tts_stage, ("summarize",)),
+        ("plan", reels.plan_stage, ("tts",)),
+        ("prompts", reels.prompts_stage, ("plan",)),
+        ("images", reels.images_stage, ("prompts",)),
+    ]
+    last = max(SERVICE_STAGES.index(name) for name in stages)
+    outputs = {}
+    seconds = {}
+    for name, fn, deps in chain[:last + 1]:
+        seconds[name], outputs[name] = run_stage(fn, job, {dep: outputs[dep] for dep in deps})
+    return {name: value for name, value in seconds.items() if name in stages}
+
+
+def bench_render(stages, fixture, target_size, frames):
+    """
+    One pass of the render stages over the fixture reel. Images are resized
+    first if needed even when "resize" is not selected.
+    """
+    from backend import metrics
+    from backend.captions import CaptionStyle, render_caption
+    from backend.compositor import FrameCompositor
+    from backend.render_profiles import get_profile
+    from backend.segment_render import encode_frames, open_writer
+    from backend.timeline import Timeline
+    from backend.video_render import resize_images
+
+    seconds = {}
+    resized = fixture["output_folder"]
+    if "resize" in stages or not os.path.isdir(resized):
+        shutil.rmtree(resized, ignore_errors=True)
+        seconds["resize"], _ = run_stage(resize_images, fixture["input_folder"], resized, target_size)
+
+    timeline = Timeline.from_srt(fixture["srt_path"], fixture["image_srt_path"])
+    style = CaptionStyle.for_frame(target_size)
+    if "caption_render" in stages:
+        render_caption.cache_clear()
+        start = time.perf_counter()
+        for text in timeline.captions.texts:
+            render_caption(text, style)
+        seconds["caption_render"] = time.perf_counter() - start
+
+    if "compose" in stages or "encode" in stages:
+        profile = get_profile("final")
+        scenes = [(cue.start, cue.end, os.path.join(resized, f"{cue.index}.png")) for cue in timeline.scenes]
+        compositor = FrameCompositor(target_size, scenes, timeline.captions.intervals(), style)
+        video_path = os.path.join(os.path.dirname(resized), "bench_frames.mp4")
+        # encode_frames records its compose and encode time as metrics
+        metrics.reset()
+        with contextlib.closing(compositor), open_writer(video_path, target_size, profile) as writer:
+            encode_frames(compositor, writer, 0, frames, profile.fps)
+        for name in ("compose", "encode"):
+            if name in stages:
+                seconds[name] = metrics.STAGE_SECONDS.values[(name,)][1]
+        os.remove(video_path)
+    return {name: value for name, value in seconds.items() if name in stages}
+
+
+def summarize_runs(runs):
+    return {
+        "median_s": round(statistics.median(runs), 4),
+        "min_s": round(min(runs), 4),
+        "max_s": round(max(runs), 4),
+        "runs": [round(value, 4) for value in runs],
+    }
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    Stages whose median is more than threshold (a fraction) and min_delta seconds slower than the baseline's.
+    """
+    regressions = []
+    for name, stats in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+        delta = stats["median_s"] - base["median_s"]
+        if delta > min_delta and stats["median_s"] > base["median_s"] * (1 + threshold):
+            regressions.append((name, base["median_s"], stats["median_s"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each fake service waits before answering")
+    parser.add_argument("--prompt-interval", type=float, default=0.0, help="pause between prompt requests (production: 1.5)")
+    parser.add_argument("--duration", type=float, default=30.0, help="length of the synthetic reel for render stages")
+    parser.add_argument("--target-size", type=int, nargs=2, default=[1080, 1920])
+    parser.add_argument("--frames", type=int, default=60, help="frames composed and encoded per run")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown of a stage's median (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    runs = {name: [] for name in args.stages}
+    workdir = tempfile.mkdtemp(prefix="bench_stages_")
+    try:
+        with FakeServices(latency=args.latency) as fakes:
+            # Imported once the fakes are up: these modules read their endpoints at import time
+            from backend import reels
+
+            reels.PROMPT_INTERVAL = args.prompt_interval
+            service_stages = [name for name in args.stages if name in SERVICE_STAGES]
+            render_stages = [name for name in args.stages if name in RENDER_STAGES]
+            fixture = make_reel_fixture(os.path.join(workdir, "reel"), args.duration) if render_stages else None
+            for n in range(args.repeat):
+                if service_stages:
+                    for name, value in bench_services(service_stages, os.path.join(workdir, f"jobs_{n}")).items():
+                        runs[name].append(value)
+                if render_stages:
+                    for name, value in bench_render(render_stages, fixture, tuple(args.target_size), args.frames).items():
+                        runs[name].append(value)
+            requests = dict(fakes.requests)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "config": {
+            "latency": args.latency,
+            "prompt_interval": args.prompt_interval,
+            "duration": args.duration,
+            "target_size": args.target_size,
+            "frames": args.frames,
+            "repeat": args.repeat,
+            "cpus": os.cpu_count(),
+        },
+        "stages": {name: summarize_runs(values) for name, values in runs.items() if values},
+        "fake_requests": requests,
+    }
+
+    print(f"latency={args.latency}s repeat={args.repeat} reel={args.duration}s frames={args.frames}")
+    print(f"{'stage':>15} {'median s':>9} {'min s':>8} {'max s':>8}")
+    for name, stats in results["stages"].items():
+        print(f"{name:>15} {stats['median_s']:>9.4f} {stats['min_s']:>8.4f} {stats['max_s']:>8.4f}")
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as json_file:
+            baseline = json.load(json_file)
+        if baseline.get("config", {}).get("latency") != args.latency:
+            print(f"Warning: baseline was measured with latency={baseline.get('config', {}).get('latency')}s")
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.4f}s -> {after:.4f}s (+{after / before - 1:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
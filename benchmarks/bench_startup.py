@@ -0,0 +1,118 @@
+"""
+Startup benchmark: import time of the backend entry modules.
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+(--repeat times), and its cumulative import time is reported with the
+packages that cost the most. The run fails (exit status 1) when a module's
+median exceeds --budget-ms, or when it loads a package that must stay lazy
+(--deferred: moviepy, langchain, Pillow, ... load on first use or in a
+render worker, not when the web app starts).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --modules backend.search --budget-ms 500 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ("backend.search", "backend.reels", "backend.render_pool")
+# Heavy packages the entry modules must not import at load time
+DEFERRED = ("moviepy", "IPython", "langchain_mistralai", "langchain_core", "PIL", "numpy", "pydub")
+# Settings the modules read at import; dummy values are enough to import them
+IMPORT_ENV = {"SEARCH_API_KEY": "startup-bench", "MISTRAL_API_KEY": "startup-bench"}
+
+
+def import_times(module):
+    """
+    Import module in a new interpreter. Returns [(name, depth, self_us, cumulative_us), ...] in import order.
+    """
+    env = dict(os.environ)
+    for key, value in IMPORT_ENV.items():
+        env.setdefault(key, value)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return times
+
+
+def heaviest_packages(times, count):
+    """
+    Top-level packages by the cumulative time of their first import.
+    """
+    packages = {}
+    for name, _, _, cumulative_us in times:
+        root = name.split(".")[0]
+        if "." not in name and root not in packages:
+            packages[root] = cumulative_us
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return [{"package": name, "ms": round(us / 1000, 1)} for name, us in ranked[:count]]
+
+
+def bench_module(module, repeat, top, deferred=DEFERRED):
+    runs = []
+    for _ in range(repeat):
+        times = import_times(module)
+        total_us = next(cumulative_us for name, depth, _, cumulative_us in times if name == module and depth == 0)
+        runs.append((total_us, times))
+    runs.sort(key=lambda run: run[0])
+    _, times = runs[len(runs) // 2]
+    loaded = {name.split(".")[0] for name, _, _, _ in times}
+    return {
+        "median_ms": round(statistics.median(total for total, _ in runs) / 1000, 1),
+        "min_ms": round(runs[0][0] / 1000, 1),
+        "max_ms": round(runs[-1][0] / 1000, 1),
+        "modules_imported": len(times),
+        "heaviest": heaviest_packages(times, top),
+        "deferred_loaded": sorted(loaded & set(deferred)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest packages listed per module")
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="allowed median import time of each module")
+    parser.add_argument("--deferred", nargs="*", default=list(DEFERRED), help="packages no module may import at load time")
+    parser.add_argument("--output", help="write results as JSON here")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "budget_ms": args.budget_ms, "modules": {}}
+    failures = []
+    for module in args.modules:
+        stats = bench_module(module, args.repeat, args.top, args.deferred)
+        results["modules"][module] = stats
+        print(f"\n{module}: median {stats['median_ms']} ms (min {stats['min_ms']}, max {stats['max_ms']}), {stats['modules_imported']} modules")
+        for package in stats["heaviest"]:
+            print(f"{package['package']:>24} {package['ms']:>8.1f} ms")
+        if stats["median_ms"] > args.budget_ms:
+            failures.append(f"{module} takes {stats['median_ms']} ms to import, over the {args.budget_ms:.0f} ms budget")
+        if stats["deferred_loaded"]:
+            failures.append(f"{module} loads {', '.join(stats['deferred_loaded'])} at import time")
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"Results written to {args.output}")
+
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"\nAll modules import within {args.budget_ms:.0f} ms without deferred packages")
+
+
+if __name__ == "__main__":
+    main()
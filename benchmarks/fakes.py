@@ -0,0 +1,267 @@
+"""
+Local stand-ins for the external services, for offline benchmarks.
+
+One aiohttp app on 127.0.0.1 plays Tavily search, the Mistral chat API,
+the Hugging Face image endpoint and the edge-tts websocket, each answering
+after a configurable latency with content built from the sample podcast
+script. Start it before importing backend modules that read their endpoint
+at import time (see FakeServices.start).
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import uuid
+from html import unescape
+
+from aiohttp import WSMsgType, web
+from PIL import Image
+
+from backend.ffmpeg_render import ffmpeg_binary
+
+from benchmarks.fixtures import WORDS_PER_SECOND, SCRIPT_PATH
+
+# edge-tts timestamps are in 100 ns ticks
+TICKS_PER_SECOND = 10_000_000
+TOPICS = 5
+WORDS_PER_TOPIC = 200
+# Length of the MP3 the fake TTS streams from; longer texts wrap around
+AUDIO_SECONDS = 300
+
+
+def script_exchanges():
+    with open(SCRIPT_PATH, "r") as json_file:
+        data = json.load(json_file)
+    return data["podcast_title"], [text for exchange in data["conversation"] for text in exchange.values()]
+
+
+def article_topics(tag=""):
+    """
+    Five topics with ~200-word scripts cut from the sample conversation, as the summary LLM returns them.
+    tag (the search topic the article was found for) is put in every title.
+    """
+    title, exchanges = script_exchanges()
+    if tag:
+        title = f"{title} [{tag}]"
+    words = " ".join(exchanges).split()
+    topics = []
+    for n in range(TOPICS):
+        chunk = [words[(n * WORDS_PER_TOPIC + i) % len(words)] for i in range(WORDS_PER_TOPIC)]
+        topics.append({
+            "title": f"{title} part {n + 1}",
+            "script": " ".join(chunk),
+            "follow_up_question": "What would you ask your doctor next?",
+            "caption": "Health news in a minute #health",
+        })
+    return {"topics": topics}
+
+
+def podcast_script(tag=""):
+    """
+    The sample podcast script, fenced as the podcast LLM returns it.
+    """
+    with open(SCRIPT_PATH, "r") as json_file:
+        data = json.load(json_file)
+    if tag:
+        data["podcast_title"] = f"{data['podcast_title']} [{tag}]"
+    return "```json\n" + json.dumps(data) + "\n```"
+
+
+def sample_mp3(seconds=AUDIO_SECONDS):
+    """
+    A 48 kbit/s mono MP3 tone, the format edge-tts streams.
+    """
+    result = subprocess.run(
+        [
+            ffmpeg_binary(), "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+            "-ac", "1", "-ar", "24000", "-c:a", "libmp3lame", "-b:a", "48k", "-f", "mp3", "-",
+        ],
+        check=True, stdout=subprocess.PIPE,
+    )
+    return result.stdout
+
+
+def sample_png(size=(1024, 1024)):
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def tts_message(path, body="", content_type="application/json; charset=utf-8"):
+    return f"X-RequestId:{uuid.uuid4().hex}\r\nContent-Type:{content_type}\r\nPath:{path}\r\n\r\n{body}"
+
+
+def tts_audio(chunk):
+    header = f"X-RequestId:{uuid.uuid4().hex}\r\nContent-Type:audio/mpeg\r\nPath:audio\r\n".encode("utf-8")
+    return len(header).to_bytes(2, "big") + header + chunk
+
+
+class FakeServices:
+    """
+    The fake services in a background thread. Use as a context manager:
+
+        with FakeServices(latency=0.05) as fakes:
+            ...  # endpoints are configured through fakes.env() and fakes.patch_edge_tts()
+
+    latency: seconds before each answer. audio_bytes_per_word: MP3 data sent
+    per word (2400 bytes is 0.4 s at 48 kbit/s, matching WORDS_PER_SECOND).
+
+    Search results carry the query as a tag that the fake LLM copies into
+    summary titles and podcast scripts. Outputs can therefore be traced to
+    the request that caused them.
+    """
+    def __init__(self, latency=0.05, audio_bytes_per_word=2400):
+        self.latency = latency
+        self.audio_bytes_per_word = audio_bytes_per_word
+        self.png = sample_png()
+        self.mp3 = sample_mp3()
+        self.requests = {}
+        self.loop = None
+        self.runner = None
+        self.port = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, name="fake-services", daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def count(self, service):
+        self.requests[service] = self.requests.get(service, 0) + 1
+
+    async def tavily(self, request):
+        self.count("tavily")
+        query = (await request.json()).get("query", "")
+        await asyncio.sleep(self.latency)
+        title, exchanges = script_exchanges()
+        return web.json_response({
+            "query": query,
+            "results": [
+                {
+                    "title": f"{title} [{query}]",
+                    "url": "https://example.org/article",
+                    "content": exchanges[0],
+                    "raw_content": f"Tag: {query}\n" + "\n".join(exchanges),
+                },
+            ],
+        })
+
+    async def mistral(self, request):
+        self.count("mistral")
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        message = {"role": "assistant", "content": ""}
+        prompt = payload["messages"][-1]["content"]
+        tag = re.search(r"Tag: (.*)", prompt)
+        tag = tag.group(1).strip() if tag else ""
+        if payload.get("tools"):
+            name = payload["tools"][0]["function"]["name"]
+            message["tool_calls"] = [{
+                "id": uuid.uuid4().hex[:9],
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(article_topics(tag))},
+            }]
+        elif "podcast" in prompt.lower():
+            message["content"] = podcast_script(tag)
+        else:
+            subtitle = re.search(r'"(.*)"', prompt, re.S)
+            message["content"] = "A clear medical illustration of " + (subtitle.group(1) if subtitle else prompt)[:200]
+        return web.json_response({
+            "id": uuid.uuid4().hex,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    async def image(self, request):
+        self.count("image")
+        await request.read()
+        await asyncio.sleep(self.latency)
+        return web.Response(body=self.png, content_type="image/png")
+
+    async def tts(self, request):
+        """
+        The edge-tts websocket protocol: one word boundary and one audio chunk per word of the SSML.
+        """
+        self.count("tts")
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for received in ws:
+            if received.type != WSMsgType.TEXT or "Path:ssml" not in received.data:
+                continue
+            text = re.search(r"<prosody[^>]*>(.*)</prosody>", received.data, re.S).group(1)
+            await asyncio.sleep(self.latency)
+            await ws.send_str(tts_message("turn.start", "{}"))
+            step = TICKS_PER_SECOND / WORDS_PER_SECOND
+            for n, word in enumerate(unescape(text).split()):
+                offset = n * self.audio_bytes_per_word % len(self.mp3)
+                await ws.send_bytes(tts_audio(self.mp3[offset:offset + self.audio_bytes_per_word]))
+                metadata = {"Metadata": [{"Type": "WordBoundary", "Data": {
+                    "Offset": int(n * step), "Duration": int(step * 0.9), "text": {"Text": word},
+                }}]}
+                await ws.send_str(tts_message("audio.metadata", json.dumps(metadata)))
+            await ws.send_str(tts_message("turn.end", "{}"))
+        return ws
+
+    def serve(self):
+        self.loop = asyncio.new_event_loop()
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/tavily/search", self.tavily)
+        app.router.add_post("/mistral/v1/chat/completions", self.mistral)
+        app.router.add_post("/image/", self.image)
+        app.router.add_get("/tts", self.tts)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def env(self):
+        """
+        Environment variables pointing the backend at the fakes.
+        """
+        return {
+            "TAVILY_URL": f"{self.base_url}/tavily/search",
+            "SEARCH_API_KEY": "fake",
+            "MISTRAL_BASE_URL": f"{self.base_url}/mistral/v1",
+            "MISTRAL_API_KEY": "fake",
+            "IMAGE_API_URL": f"{self.base_url}/image/",
+        }
+
+    def patch_edge_tts(self):
+        """
+        edge-tts has no endpoint setting, so its websocket URL is replaced in the library module.
+        """
+        import edge_tts.communicate
+
+        edge_tts.communicate.WSS_URL = f"ws://127.0.0.1:{self.port}/tts?TrustedClientToken=fake"
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        os.environ.update(self.env())
+        self.patch_edge_tts()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,97 @@
+"""
+Synthetic reel inputs shared by the benchmarks.
+
+A fixture mirrors what /transcribe and /generate_images leave in results/:
+a TTS-like MP3, 2-word caption SRT, 15-word image SRT and one PNG per scene.
+"""
+import json
+import os
+import subprocess
+
+from PIL import Image
+
+from backend.ffmpeg_render import ffmpeg_binary
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "podcast_res", "podcast_script.json")
+WORDS_PER_SECOND = 2.5
+
+
+def script_words():
+    """
+    Words from the sample podcast script, used as caption text.
+    """
+    with open(SCRIPT_PATH, "r") as json_file:
+        data = json.load(json_file)
+    words = []
+    for exchange in data["conversation"]:
+        for text in exchange.values():
+            words.extend(text.split())
+    return words
+
+
+def srt_timestamp(seconds):
+    ms = int(round(seconds * 1000))
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    secs, ms = divmod(ms, 1000)
+    return f"{hours:02}:{minutes:02}:{secs:02},{ms:03}"
+
+
+def write_srt(path, cues):
+    blocks = [
+        f"{index}\n{srt_timestamp(start)} --> {srt_timestamp(end)}\n{text}\n"
+        for index, (start, end, text) in enumerate(cues, start=1)
+    ]
+    with open(path, "w", encoding="utf-8") as srt_file:
+        srt_file.write("\n".join(blocks))
+
+
+def word_cues(words, duration, words_per_cue):
+    """
+    Group evenly spaced words into cues of words_per_cue words covering [0, duration).
+    """
+    step = 1.0 / WORDS_PER_SECOND
+    count = int(duration * WORDS_PER_SECOND)
+    cues = []
+    for first in range(0, count, words_per_cue):
+        last = min(first + words_per_cue, count)
+        text = " ".join(words[i % len(words)] for i in range(first, last))
+        cues.append((first * step, min(last * step, duration), text))
+    return cues
+
+
+def make_reel_fixture(workdir, duration=60.0, image_size=(1024, 1024)):
+    """
+    Write a reel's worth of inputs into workdir and return their paths.
+    """
+    images_dir = os.path.join(workdir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    paths = {
+        "input_folder": images_dir,
+        "output_folder": os.path.join(workdir, "resized_images"),
+        "audio_path": os.path.join(workdir, "output.mp3"),
+        "srt_path": os.path.join(workdir, "output_subtitles.srt"),
+        "image_srt_path": os.path.join(workdir, "output_images.srt"),
+        "output_path": os.path.join(workdir, "output_video.mp4"),
+    }
+
+    subprocess.run(
+        [
+            ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}",
+            "-ac", "1", "-ar", "24000", "-c:a", "libmp3lame", "-b:a", "48k", paths["audio_path"],
+        ],
+        check=True,
+    )
+
+    words = script_words()
+    write_srt(paths["srt_path"], word_cues(words, duration, 2))
+    scene_cues = word_cues(words, duration, 15)
+    write_srt(paths["image_srt_path"], scene_cues)
+
+    for index in range(1, len(scene_cues) + 1):
+        color = ((index * 53) % 256, (index * 97) % 256, (index * 151) % 256)
+        image = Image.linear_gradient("L").resize(image_size).convert("RGB")
+        Image.blend(image, Image.new("RGB", image_size, color), 0.6).save(os.path.join(images_dir, f"{index}.png"))
+
+    return paths
@@ -0,0 +1,258 @@
+"""
+Load test of the FastAPI app with concurrent simulated users.
+
+The real app (backend/search.py) is served by uvicorn on a local port,
+with Tavily, Mistral, edge-tts and the image endpoint replaced by the
+local fakes of benchmarks/fakes.py. It runs in a scratch directory so its
+results/ files do not touch the checkout. Each user repeats one flow:
+
+    legacy   /search -> /summarize -> /transcribe -> /generate_images [-> /generate_video]
+    reels    POST /reels (search to render in one job directory)
+    podcast  /search -> /generate_podcast
+
+Every user searches its own topic. The fakes echo it into titles and
+scripts, so an output that belongs to another user counts as a
+corruption incident. So does a 404 for data the user has just created.
+The report gives throughput, p50/p95/p99 latency and the error rate per
+endpoint. Corruption incidents are listed by kind.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --users 1 2 4 --flow legacy
+    python -m benchmarks.load_test --users 4 --flow reels --profile draft --output load.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+from benchmarks.fakes import FakeServices
+
+FLOWS = ("legacy", "reels", "podcast", "mixed")
+# Requests of the legacy flow that read shared results/ files written by the previous step
+NOT_FOUND_IS_CORRUPTION = ("/summarize", "/transcribe", "/generate_podcast")
+INTRO_MUSIC = os.path.join("podcast_audio", "music", "intro_music", "intro_music_1.mp3")
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile (q in 0..100) of a non-empty list.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    """
+    Latency, status and corruption incidents of every request, per endpoint.
+    """
+    def __init__(self):
+        self.calls = {}
+        self.incidents = []
+        self.flows = {"done": 0, "failed": 0}
+
+    def record(self, endpoint, seconds, ok):
+        self.calls.setdefault(endpoint, []).append((seconds, ok))
+
+    def corruption(self, user, endpoint, kind):
+        self.incidents.append({"user": user, "endpoint": endpoint, "kind": kind})
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for endpoint, calls in sorted(self.calls.items()):
+            latencies = [seconds for seconds, _ in calls]
+            errors = sum(1 for _, ok in calls if not ok)
+            endpoints[endpoint] = {
+                "requests": len(calls),
+                "error_rate": round(errors / len(calls), 4),
+                "p50_s": round(percentile(latencies, 50), 4),
+                "p95_s": round(percentile(latencies, 95), 4),
+                "p99_s": round(percentile(latencies, 99), 4),
+            }
+        kinds = {}
+        for incident in self.incidents:
+            kinds[incident["kind"]] = kinds.get(incident["kind"], 0) + 1
+        requests = sum(len(calls) for calls in self.calls.values())
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "flows_done": self.flows["done"],
+            "flows_failed": self.flows["failed"],
+            "flows_per_minute": round(self.flows["done"] * 60 / wall_seconds, 3),
+            "requests_per_second": round(requests / wall_seconds, 3),
+            "endpoints": endpoints,
+            "corruption": kinds,
+        }
+
+
+class FlowFailed(Exception):
+    pass
+
+
+class User:
+    """
+    One simulated user running flows back to back against base_url.
+    """
+    def __init__(self, number, base_url, session, recorder, profile, render):
+        self.number = number
+        self.base_url = base_url
+        self.session = session
+        self.recorder = recorder
+        self.profile = profile
+        self.render = render
+        self.tag = ""
+
+    async def call(self, method, endpoint, **kwargs):
+        start = time.perf_counter()
+        async with self.session.request(method, self.base_url + endpoint, **kwargs) as response:
+            body = await response.text()
+        ok = response.status < 400
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        data = json.loads(body) if body and response.headers.get("Content-Type", "").startswith("application/json") else body
+        if response.status == 404 and endpoint in NOT_FOUND_IS_CORRUPTION:
+            self.recorder.corruption(self.number, endpoint, "own data missing (overwritten by another user)")
+        if not ok:
+            raise FlowFailed(f"{method} {endpoint}: {response.status} {body[:200]}")
+        return data
+
+    def check(self, endpoint, text, kind):
+        if self.tag not in text:
+            self.recorder.corruption(self.number, endpoint, kind)
+
+    def check_timeline(self, endpoint):
+        try:
+            with open(os.path.join("results", "timeline.json"), "r", encoding="utf-8") as json_file:
+                words = " ".join(json.load(json_file)["words"]["texts"])
+        except (OSError, ValueError, KeyError):
+            words = ""
+        self.check(endpoint, words, "results/timeline.json belongs to another user")
+
+    async def search(self):
+        results = await self.call("POST", "/search", json={"topic": self.tag})
+        titles = [item["title"] for item in results.get("results", [])]
+        self.check("/search", " ".join(titles), "search results of another user")
+        return titles[0]
+
+    async def legacy(self):
+        title = await self.search()
+        summaries = await self.call("POST", "/summarize", json={"title": title})
+        self.check("/summarize", summaries[0]["title"], "summaries of another user")
+        await self.call("POST", "/transcribe", json={"title": summaries[0]["title"]})
+        self.check_timeline("/transcribe")
+        await self.call("GET", "/generate_images")
+        self.check_timeline("/generate_images")
+        if self.render:
+            await self.call("GET", "/generate_video", params={"profile": self.profile})
+            self.check_timeline("/generate_video")
+
+    async def reels(self):
+        reel = await self.call("POST", "/reels", json={"topic": self.tag, "profile": self.profile})
+        self.check("/reels", reel["title"], "reel of another user")
+
+    async def podcast(self):
+        title = await self.search()
+        podcast = await self.call("POST", "/generate_podcast", json={"title": title})
+        self.check("/generate_podcast", podcast.get("podcast_title", ""), "podcast script of another user")
+
+    async def run(self, flow, iterations):
+        for iteration in range(iterations):
+            self.tag = f"user{self.number}run{iteration}"
+            name = flow if flow != "mixed" else ("legacy", "reels", "podcast")[(self.number + iteration) % 3]
+            try:
+                await getattr(self, name)()
+                self.recorder.flows["done"] += 1
+            except (FlowFailed, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.recorder.flows["failed"] += 1
+                print(f"user {self.number} {name} failed: {e}")
+
+
+def start_server():
+    """
+    Serve backend.search.app with uvicorn in a thread. Returns (server, thread, base_url).
+    """
+    import uvicorn
+
+    from backend.search import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def run_users(base_url, users, flow, iterations, profile, render, timeout):
+    recorder = Recorder()
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(timeout=client_timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            User(number, base_url, session, recorder, profile, render).run(flow, iterations)
+            for number in range(users)
+        ))
+        wall_seconds = time.perf_counter() - start
+    return recorder.report(wall_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4], help="concurrent users; one run per value")
+    parser.add_argument("--flow", choices=FLOWS, default="legacy")
+    parser.add_argument("--iterations", type=int, default=2, help="flows per user")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each fake service waits before answering")
+    parser.add_argument("--profile", default="draft", help="render profile for /reels and /generate_video")
+    parser.add_argument("--render", action="store_true", help="end the legacy flow with /generate_video")
+    parser.add_argument("--timeout", type=float, default=600.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    checkout = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    reports = {}
+    with FakeServices(latency=args.latency) as fakes:
+        # The app writes results/ and podcast_audio/ relative to the working directory
+        os.chdir(workdir)
+        os.makedirs(os.path.dirname(INTRO_MUSIC), exist_ok=True)
+        with open(INTRO_MUSIC, "wb") as mp3_file:
+            mp3_file.write(fakes.mp3[:fakes.audio_bytes_per_word * 5])
+        server, thread, base_url = start_server()
+        try:
+            for users in args.users:
+                report = asyncio.run(run_users(
+                    base_url, users, args.flow, args.iterations, args.profile, args.render, args.timeout
+                ))
+                reports[str(users)] = report
+                print(
+                    f"\n{users} users, {args.flow}: {report['flows_done']} flows done, {report['flows_failed']} failed,"
+                    f" {report['flows_per_minute']} flows/min, {report['requests_per_second']} req/s"
+                )
+                print(f"{'endpoint':>18} {'requests':>8} {'errors':>7} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8}")
+                for endpoint, stats in report["endpoints"].items():
+                    print(
+                        f"{endpoint:>18} {stats['requests']:>8} {stats['error_rate']:>7.1%}"
+                        f" {stats['p50_s']:>8.3f} {stats['p95_s']:>8.3f} {stats['p99_s']:>8.3f}"
+                    )
+                for kind, count in report["corruption"].items():
+                    print(f"CORRUPTION x{count}: {kind}")
+        finally:
+            server.should_exit = True
+            thread.join()
+            os.chdir(checkout)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as json_file:
+            json.dump({"flow": args.flow, "latency": args.latency, "runs": reports}, json_file, indent=2)
+        print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Soak test: render many reels in one process and check that nothing leaks.
+
+After a warm-up render, the open file descriptor count and the number of
+child processes (including zombies) must return to the warm-up baseline
+after every render, and RSS must stay within --rss-slack-mb of it.
+Every --fail-every'th render is made to fail mid-encode, to check that
+the session also cleans up on errors. Exits non-zero on a leak.
+
+Usage (from the repository root):
+    python -m benchmarks.soak_render --renders 20 --duration 10
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+from backend.compositor import FrameCompositor
+from backend.video_render import VideoCreator
+from benchmarks.fixtures import make_reel_fixture
+
+
+class InjectedFailure(RuntimeError):
+    pass
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def child_processes():
+    children = set()
+    for task in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{task}/children") as children_file:
+                children.update(children_file.read().split())
+        except OSError:
+            continue
+    return len(children)
+
+
+def rss_mb():
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+@contextlib.contextmanager
+def failing_compositor(after_frames):
+    """
+    Make FrameCompositor.make_frame raise after a number of frames.
+    """
+    original = FrameCompositor.make_frame
+    calls = {"count": 0}
+
+    def make_frame(compositor, t):
+        calls["count"] += 1
+        if calls["count"] > after_frames:
+            raise InjectedFailure("injected failure mid-encode")
+        return original(compositor, t)
+
+    FrameCompositor.make_frame = make_frame
+    try:
+        yield
+    finally:
+        FrameCompositor.make_frame = original
+
+
+def render(paths, args, fail):
+    creator = VideoCreator(
+        paths["input_folder"],
+        paths["output_folder"],
+        tuple(args.size),
+        paths["audio_path"],
+        paths["srt_path"],
+        paths["image_srt_path"],
+        paths["output_path"],
+        engine=args.engine,
+        profile=args.profile,
+    )
+    failure = failing_compositor(10) if fail else contextlib.nullcontext()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()), failure:
+        try:
+            creator.render_video()
+        except InjectedFailure:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--size", type=int, nargs=2, default=[540, 960])
+    parser.add_argument("--engine", default="moviepy")
+    parser.add_argument("--profile", default="draft")
+    parser.add_argument("--fail-every", type=int, default=4, help="inject a mid-encode failure every N renders (0: never)")
+    parser.add_argument("--rss-slack-mb", type=float, default=50.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="soak_render_")
+    try:
+        paths = make_reel_fixture(workdir, args.duration)
+        render(paths, args, fail=False)
+        base_fds, base_children, base_rss = open_fds(), child_processes(), rss_mb()
+        print(f"baseline: fds={base_fds} children={base_children} rss={base_rss:.1f}MB")
+
+        leaks = []
+        for n in range(1, args.renders + 1):
+            fail = bool(args.fail_every) and n % args.fail_every == 0
+            render(paths, args, fail)
+            fds, children, rss = open_fds(), child_processes(), rss_mb()
+            print(f"render {n:>3}{' (failed)' if fail else '         '}: fds={fds} children={children} rss={rss:.1f}MB")
+            if fds > base_fds:
+                leaks.append(f"render {n}: {fds - base_fds} file descriptors leaked")
+            if children > base_children:
+                leaks.append(f"render {n}: {children - base_children} child processes left behind")
+            if rss - base_rss > args.rss_slack_mb:
+                leaks.append(f"render {n}: RSS grew {rss - base_rss:.1f}MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if leaks:
+        print("LEAKS:\n  " + "\n  ".join(leaks))
+        sys.exit(1)
+    print("OK: fd count, child processes and RSS stayed flat")
+
+
+if __name__ == "__main__":
+    main()
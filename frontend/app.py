@@ -1,19 +1,161 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import os
-import uuid
 
-# Function to validate the search query
+# Where the FastAPI backend runs; media is streamed from it, so the two need not share a disk
+BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
+# Seconds between progress checks of running reels and podcasts
+POLL_INTERVAL = 2
+# Validations and search results are reused for this many seconds
+CACHE_TTL = 600
+
+
+# One pooled HTTP session shared by every rerun and every user of this Streamlit server
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Podcasts take minutes and the backend answers only when they are done, so they are
+# generated in the background while the page stays responsive
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def error_detail(response, error):
+    # Attempt to extract more detailed error message
+    try:
+        return response.json().get('detail', str(error))
+    except Exception:
+        return str(error)
+
+
+# Function to validate the search query; failed requests raise, so they are not cached
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
 def is_valid(query):
     # Send GET request to /is_valid endpoint
+    response = get_session().get(f"{BACKEND_URL}/is_valid", params={"topic": query})
+    response.raise_for_status()
+    return response.json().get("is_valid", False)
+
+
+def search_backend(topic, session=None):
+    response = (session or get_session()).post(f"{BACKEND_URL}/search", json={"topic": topic})
+    response.raise_for_status()
+    # Keep only what the page shows; the raw article text stays in the backend
+    return [
+        {"title": result["title"], "url": result["url"], "content": result["content"]}
+        for result in response.json().get("results", [])
+    ]
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def search(topic):
+    return search_backend(topic)
+
+
+def post_for_search_result(path, title, topic, session=None):
+    """
+    POST a title to an endpoint that looks it up in the backend's latest search.
+    A cached search may not be the backend's latest one, so on a 404 the topic
+    is searched again and the request retried once.
+    """
+    session = session or get_session()
+    response = session.post(f"{BACKEND_URL}{path}", json={"title": title})
+    if response.status_code == 404:
+        search_backend(topic, session)
+        response = session.post(f"{BACKEND_URL}{path}", json={"title": title})
     try:
-        response = requests.get("http://127.0.0.1:8000/is_valid", params={"topic": query})
-        if response.status_code == 200:
-            return response.json().get("is_valid", False)
-        return False
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as http_err:
+        raise RuntimeError(f"HTTP error occurred: {error_detail(response, http_err)}")
+    return response.json()
+
+
+def generate_podcast(session, title, topic):
+    # Runs in the executor, outside the script run; returns the URL the podcast is streamed from
+    return BACKEND_URL + post_for_search_result("/generate_podcast", title, topic, session)["url"]
+
+
+def submit_reel(topic, title, topic_index, summaries):
+    # The backend renders the reel in the background; its progress is polled by batch id.
+    # The summaries on screen go along, so the reel speaks the script the user read.
+    response = get_session().post(
+        f"{BACKEND_URL}/reels/batch",
+        json={"topic": topic, "title": title, "topic_indices": [topic_index], "summaries": summaries},
+    )
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError as http_err:
+        raise RuntimeError(f"HTTP error occurred: {error_detail(response, http_err)}")
+    batch = response.json()
+    return batch["batch_id"], batch["jobs"][str(topic_index)]
+
+
+def poll_video(video):
+    response = get_session().get(f"{BACKEND_URL}/reels/batch/{video['batch_id']}")
+    if response.status_code == 404:
+        video.update(status="failed", error="The backend restarted before the reel was done.")
+        return
+    response.raise_for_status()
+    batch = response.json()
+    # Only this video's reel; the batch may hold others
+    job_id = video["job_id"]
+    current = batch["progress"].get(job_id) or batch["progress"]["article"]
+    video["stage"] = current["stage"]
+    if batch["status"] == "running":
+        return
+    result = batch["results"].get(job_id)
+    if result is not None and result["status"] == "done":
+        video.update(status="done", url=BACKEND_URL + result["video_url"])
+    else:
+        errors = [result.get("error", "") for result in batch["results"].values() if result["status"] != "done"]
+        video.update(status="failed", error="; ".join(errors) or "Reel generation failed.")
+
+
+def poll_podcast(podcast):
+    future = podcast["future"]
+    if not future.done():
+        return
+    try:
+        podcast.update(status="done", url=future.result())
     except Exception as e:
-        st.error(f"Error validating query: {e}")
-        return False
+        podcast.update(status="failed", error=str(e))
+    del podcast["future"]
+
+
+# Re-runs on its own every POLL_INTERVAL seconds while reels or podcasts are being
+# generated, and reruns the whole page once one of them is done
+@st.fragment(run_every=POLL_INTERVAL)
+def show_progress():
+    finished = False
+    for video in pending(st.session_state['generated_videos']):
+        try:
+            poll_video(video)
+        except requests.exceptions.RequestException as e:
+            st.warning(f"Could not check the reel for '{video['title']}': {e}")
+        if video["status"] == "running":
+            st.info(f"Generating reel for: {video['title']} ({video.get('stage') or 'queued'})")
+        finished = finished or video["status"] != "running"
+    for podcast in pending(st.session_state['generated_podcasts']):
+        poll_podcast(podcast)
+        if podcast["status"] == "running":
+            st.info(f"Generating podcast for: {podcast['title']}")
+        finished = finished or podcast["status"] != "running"
+    if finished:
+        st.rerun()
+
+
+def pending(jobs):
+    return [job for job in jobs if job["status"] == "running"]
+
 
 # Set the page configuration to wide layout
 st.set_page_config(
@@ -27,18 +169,22 @@ st.set_page_config(
 st.image("frontend/logo.jpg", width=100)
 st.title("MediReels")
 
-# Initialize session state to store search results, summaries, generated video path, and podcasts
+# Initialize session state to store search results, summaries, generated videos and podcasts.
+# Generated media is kept as URLs, so reruns stay cheap however much a session generates.
+if 'search_topic' not in st.session_state:
+    st.session_state['search_topic'] = None
+
 if 'search_results' not in st.session_state:
     st.session_state['search_results'] = None
 
 if 'summary' not in st.session_state:
     st.session_state['summary'] = None
 
-if 'generated_video_path' not in st.session_state:
-    st.session_state['generated_video_path'] = None
+if 'generated_videos' not in st.session_state:
+    st.session_state['generated_videos'] = []  # List of {"title", "batch_id", "status", "url"}
 
 if 'generated_podcasts' not in st.session_state:
-    st.session_state['generated_podcasts'] = []  # List to store generated podcasts
+    st.session_state['generated_podcasts'] = []  # List of {"title", "status", "url"}
 
 # --- Search Interface ---
 st.header("Search")
@@ -50,35 +196,27 @@ topic = st.text_input("Enter a topic for search:", "")
 if st.button("Search"):
     if topic:
         # Check if the query is valid
-        if is_valid(topic):
-            # Backend FastAPI URL
-            backend_url = "http://127.0.0.1:8000/search"
-
-            # Prepare the request payload (only the topic is sent from the frontend)
-            payload = {
-                "topic": topic
-            }
+        try:
+            valid = is_valid(topic)
+        except Exception as e:
+            st.error(f"Error validating query: {e}")
+            valid = False
 
+        if valid:
             # Send the request to the FastAPI backend
             try:
                 with st.spinner('Searching...'):
-                    response = requests.post(backend_url, json=payload)
-                    response.raise_for_status()  # Raise an error for bad status codes
+                    results = search(topic)
 
-                # Parse and store the results in session state
-                st.session_state['search_results'] = response.json()
+                # Store the results in session state
+                st.session_state['search_topic'] = topic
+                st.session_state['search_results'] = results
                 st.session_state['summary'] = None  # Reset summary when a new search is performed
-                st.session_state['generated_video_path'] = None  # Reset generated video path
 
                 st.success(f"Search completed for topic: {topic}")
 
             except requests.exceptions.HTTPError as http_err:
-                # Attempt to extract more detailed error message
-                try:
-                    error_detail = response.json().get('detail', str(http_err))
-                except:
-                    error_detail = str(http_err)
-                st.error(f"HTTP error occurred: {error_detail}")
+                st.error(f"HTTP error occurred: {error_detail(http_err.response, http_err)}")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
         else:
@@ -94,9 +232,9 @@ st.markdown("---")  # Separator
 st.subheader("Trending Topics")
 
 # Check if search results are available
-if st.session_state['search_results']:
-    search_results = st.session_state['search_results']
-    results = search_results.get("results", [])
+if st.session_state['search_results'] is not None:
+    results = st.session_state['search_results']
+    search_topic = st.session_state['search_topic']
 
     if results:
         # Display each result as an expander with clickable titles and "Explore Reels" and "Explore Podcasts" buttons
@@ -118,75 +256,28 @@ if st.session_state['search_results']:
                 # Handle "Explore Reels" button click
                 if explore_reels:
                     selected_title = result['title']
-                    # Backend Summarize API URL
-                    backend_summarize_url = "http://127.0.0.1:8000/summarize"
-
-                    # Prepare the payload with the selected title
-                    payload = {"title": selected_title}
-
                     try:
                         with st.spinner('Exploring Reels...'):
-                            summarize_response = requests.post(backend_summarize_url, json=payload)
-                            summarize_response.raise_for_status()
-                            summary = summarize_response.json()
+                            summary = post_for_search_result("/summarize", selected_title, search_topic)
 
-                        # Store the summary in session state
-                        st.session_state['summary'] = summary
-                        st.session_state['generated_video_path'] = None  # Reset generated video path
+                        # Store the summary, and the article it belongs to, in session state
+                        st.session_state['summary'] = {"title": selected_title, "topics": summary}
 
                         st.success(f"Reels exploration completed for: {selected_title}")
 
-                    except requests.exceptions.HTTPError as http_err:
-                        # Attempt to extract more detailed error message
-                        try:
-                            error_detail = summarize_response.json().get('detail', str(http_err))
-                        except:
-                            error_detail = str(http_err)
-                        st.error(f"HTTP error occurred: {error_detail}")
                     except Exception as e:
                         st.error(f"An error occurred: {e}")
 
                 # Handle "Explore Podcasts" button click
                 if explore_podcasts:
                     selected_title = result['title']
-                    try:
-                        with st.spinner('Generating podcast...'):
-                            podcast_payload = {"title": selected_title}
-                            podcast_response = requests.post("http://127.0.0.1:8000/generate_podcast", json=podcast_payload)
-                            podcast_response.raise_for_status()
-
-                        # Generate a unique filename for the podcast to prevent overwriting
-                        podcast_filename = f"podcast_{idx}_{uuid.uuid4().hex[:8]}.mp3"
-                        podcast_path = os.path.join("results", podcast_filename)
-
-                        # Move or rename the generated podcast to the unique filename
-                        # This assumes that the backend saves the podcast to 'results/podcast_final.mp3'
-                        original_podcast_path = "results/podcast_final.mp3"
-                        if os.path.exists(original_podcast_path):
-                            os.rename(original_podcast_path, podcast_path)
-                        else:
-                            st.error("Podcast generation succeeded but the audio file was not found.")
-                            podcast_path = None
-
-                        if podcast_path and os.path.exists(podcast_path):
-                            # Append the generated podcast to the session state list
-                            st.session_state['generated_podcasts'].append({
-                                "title": selected_title,
-                                "path": podcast_path
-                            })
-                            st.success(f"Podcast generated for: {selected_title}")
-                        else:
-                            st.error("Failed to locate the generated podcast file.")
-
-                    except requests.exceptions.HTTPError as http_err:
-                        # Attempt to extract more detailed error message
-                        try:
-                            error_detail = podcast_response.json().get('detail', str(http_err))
-                        except:
-                            error_detail = str(http_err)
-                        st.error(f"HTTP error occurred: {error_detail}")
-                    except Exception as e:
-                        st.error(f"An error occurred: {e}")
+                    # Generated in the background; the progress section below reports when it is ready
+                    st.session_state['generated_podcasts'].append({
+                        "title": selected_title,
+                        "status": "running",
+                        "future": get_executor().submit(generate_podcast, get_session(), selected_title, search_topic),
+                    })
+                    st.success(f"Podcast generation started for: {selected_title}")
 
     else:
         st.info("No results found for the given topic.")
@@ -200,9 +291,13 @@ st.header("Scripts")
 
 # Check if a summary is available
 if st.session_state['summary']:
-    summary = st.session_state['summary']
+    article_title = st.session_state['summary']['title']
+    summary = st.session_state['summary']['topics']
 
     if isinstance(summary, list) and all(isinstance(item, dict) for item in summary):
+        # The backend runs one reel batch per article at a time
+        article_busy = any(video["article"] == article_title for video in pending(st.session_state['generated_videos']))
+
         # Display each summary with a "Generate Video" button
         for idx, item in enumerate(summary):
             title = item.get("title", "No Title")
@@ -232,45 +327,21 @@ if st.session_state['summary']:
 
                 with button_col:
                     # "Generate Video" button for this specific summary
-                    if st.button("Generate Video", key=f"generate_{idx}"):
-                        selected_title = title
-                        selected_script = script
-
+                    if st.button("Generate Video", key=f"generate_{idx}", disabled=article_busy):
                         try:
-                            # Step 1: Send POST request to /transcribe
-                            with st.spinner('Generating subtitles for video...'):
-                                transcribe_url = "http://127.0.0.1:8000/transcribe"
-                                transcribe_payload = {"title": selected_title}
-                                transcribe_response = requests.post(transcribe_url, json=transcribe_payload)
-                                transcribe_response.raise_for_status()
-
-                            # Step 2: Send GET request to /generate_images
-                            with st.spinner('Generating images...'):
-                                generate_images_url = "http://127.0.0.1:8000/generate_images"
-                                generate_images_response = requests.get(generate_images_url)
-                                generate_images_response.raise_for_status()
-
-                            # Step 3: Send GET request to /generate_video
-                            with st.spinner('Generating reel...'):
-                                generate_video_url = "http://127.0.0.1:8000/generate_video"
-                                generate_video_response = requests.get(generate_video_url)
-                                generate_video_response.raise_for_status()
-
-                            # Assuming the video is saved at './results/output_video.mp4'
-                            st.session_state['generated_video_path'] = "results/output_video.mp4"
-
-                            # Immediately display the generated video
-                            st.success(f"Video generation completed for: {selected_title}")
-
-                        except requests.exceptions.HTTPError as http_err:
-                            # Attempt to extract more detailed error message
-                            try:
-                                error_detail = generate_video_response.json().get('detail', str(http_err))
-                            except:
-                                error_detail = str(http_err)
-                            st.error(f"HTTP error occurred: {error_detail}")
+                            batch_id, job_id = submit_reel(st.session_state['search_topic'], article_title, idx, summary)
                         except Exception as e:
                             st.error(f"An error occurred: {e}")
+                        else:
+                            st.session_state['generated_videos'].append({
+                                "title": title,
+                                "article": article_title,
+                                "batch_id": batch_id,
+                                "job_id": job_id,
+                                "status": "running",
+                            })
+                            # Rerun so the buttons of this article are disabled and polling starts
+                            st.rerun()
     else:
         st.info("No summary data available.")
 else:
@@ -278,22 +349,25 @@ else:
 
 st.markdown("---")  # Separator
 
-# --- Generated Video Section ---
-st.header("Generated Video")
-
-# Display Generated Video if available
-if st.session_state['generated_video_path']:
-    video_path = st.session_state['generated_video_path']
-    if os.path.exists(video_path):
-        try:
-            # Create three columns: left spacer, video, right spacer
-            left_col, video_col, right_col = st.columns([3, 1, 3])  # Adjust ratios as needed
-            with video_col:
-                st.video(video_path)
-        except Exception as e:
-            st.error(f"An error occurred while loading the video: {e}")
-    else:
-        st.error("Generated video file not found.")
+# --- Progress of reels and podcasts being generated ---
+if pending(st.session_state['generated_videos']) or pending(st.session_state['generated_podcasts']):
+    show_progress()
+
+# --- Generated Videos Section ---
+st.header("Generated Videos")
+
+# Display generated videos, streamed from the backend by URL; the browser fetches byte ranges as it seeks
+videos = [video for video in st.session_state['generated_videos'] if video["status"] != "running"]
+if videos:
+    for video in videos:
+        st.subheader(f"Reel for: {video['title']}")
+        if video["status"] == "failed":
+            st.error(f"Reel generation failed: {video['error']}")
+            continue
+        # Create three columns: left spacer, video, right spacer
+        left_col, video_col, right_col = st.columns([3, 1, 3])  # Adjust ratios as needed
+        with video_col:
+            st.video(video["url"])
 else:
     st.info("No video generated yet. Please generate a video from the summary section.")
 
@@ -303,21 +377,17 @@ st.markdown("---")  # Separator
 st.header("Generated Podcasts")
 
 # Check if any podcasts have been generated
-if st.session_state['generated_podcasts']:
-    for podcast in st.session_state['generated_podcasts']:
+podcasts = [podcast for podcast in st.session_state['generated_podcasts'] if podcast["status"] != "running"]
+if podcasts:
+    for podcast in podcasts:
         podcast_title = podcast['title']
-        podcast_path = podcast['path']
 
         st.subheader(f"Podcast for: {podcast_title}")
 
-        if os.path.exists(podcast_path):
-            try:
-                with open(podcast_path, "rb") as audio_file:
-                    audio_bytes = audio_file.read()
-                st.audio(audio_bytes, format="audio/mp3")
-            except Exception as e:
-                st.error(f"Error loading podcast for '{podcast_title}': {e}")
+        # Streamed from the backend by URL instead of reading the file on every rerun
+        if podcast["status"] == "failed":
+            st.error(f"Error generating podcast for '{podcast_title}': {podcast['error']}")
         else:
-            st.error(f"Podcast audio file for '{podcast_title}' not found.")
+            st.audio(podcast['url'], format="audio/mp3")
 else:
     st.info("No podcasts generated yet. Explore topics to generate podcasts.")